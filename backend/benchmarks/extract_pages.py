@@ -0,0 +1,78 @@
+"""
+Benchmark page extraction throughput (pages/sec) for the in-loop extractor and
+the process pool extractor with an increasing number of workers.
+
+Usage:
+    python benchmarks/extract_pages.py [path/to/file.pdf] [--pages 300]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import pymupdf
+
+from backend.document_parser import extract_page_data, iter_page_data, load_pdf
+
+
+def make_sample_pdf(page_count: int) -> bytes:
+    document = pymupdf.open()
+    for page_num in range(page_count):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Section {page_num + 1}", fontsize=18)
+        page.insert_textbox(
+            pymupdf.Rect(72, 100, 540, 760),
+            "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40,
+            fontsize=10,
+        )
+        page.draw_rect(
+            pymupdf.Rect(72, 600, 300, 740), color=(0, 0, 1), fill=(0.9, 0.9, 0.9)
+        )
+    return document.tobytes()
+
+
+async def run_in_loop(pdf_bytes: bytes) -> int:
+    document = await load_pdf(pdf_bytes)
+    return len(await extract_page_data(document))
+
+
+async def run_in_pool(pdf_bytes: bytes, workers: int) -> int:
+    pages = iter_page_data(pdf_bytes, max_workers=workers)
+    return len([page async for page in pages])
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.path:
+        with open(args.path, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = make_sample_pdf(args.pages)
+
+    start = time.perf_counter()
+    pages = await run_in_loop(pdf_bytes)
+    elapsed = time.perf_counter() - start
+    print(
+        f"in-loop      {pages} pages  {elapsed:6.2f}s  "
+        f"{pages / elapsed:7.1f} pages/s"
+    )
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        pages = await run_in_pool(pdf_bytes, workers)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{workers:2d} worker(s) {pages} pages  {elapsed:6.2f}s  "
+            f"{pages / elapsed:7.1f} pages/s"
+        )
+        workers *= 2
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
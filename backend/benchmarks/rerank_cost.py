@@ -0,0 +1,72 @@
+"""
+Benchmark the CPU cost of re-ranking retrieved chunks per query. Runs offline
+on synthetic candidates.
+
+Usage:
+    python benchmarks/rerank_cost.py [--candidates 50] [--chars 1500]
+        [--queries 200] [--scorer lexical]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from backend.rerank import load_scorer
+
+WORDS = (
+    "revenue margin quarter forecast pipeline supplier contract warranty "
+    "compliance audit invoice shipment inventory region segment growth "
+    "customer churn retention pricing discount component assembly tolerance"
+).split()
+
+
+def make_candidates(count: int, chars: int) -> list:
+    candidates = []
+    for i in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < chars:
+            words.append(random.choice(WORDS))
+        words.insert(random.randrange(len(words)), f"PN-{random.randint(100, 999)}")
+        candidates.append(
+            {
+                "id": str(i),
+                "content": " ".join(words),
+                "metadata": {},
+                # Some candidates only come from the full-text search
+                "distance": random.uniform(0.4, 1.4) if i % 4 else None,
+            }
+        )
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--chars", type=int, default=1500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scorer", default="lexical")
+    args = parser.parse_args()
+
+    scorer = load_scorer(args.scorer)
+    candidates = make_candidates(args.candidates, args.chars)
+
+    timings = []
+    for _ in range(args.queries):
+        query = " ".join(random.sample(WORDS, 6)) + f" PN-{random.randint(100, 999)}"
+        start = time.perf_counter()
+        scorer.score(query, candidates)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    p95 = timings[int(0.95 * (len(timings) - 1))]
+    print(
+        f"{args.scorer}: {args.candidates} candidates of {args.chars} chars  "
+        f"p50 {statistics.median(timings) * 1000:6.2f}ms  "
+        f"p95 {p95 * 1000:6.2f}ms  "
+        f"max {timings[-1] * 1000:6.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark search latency with clients created per request against the shared,
+pooled clients. Needs a running Chroma server and an OpenAI API key.
+
+Usage:
+    python benchmarks/search_latency.py [--queries 50] [--concurrency 1]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import chromadb
+from openai import AsyncOpenAI
+
+from backend.chroma import EMBEDDING_MODEL, FILE_COLLECTION_NAME, search_vector_db
+from backend.clients import CHROMA_HOST, CHROMA_PORT, close_clients
+
+QUERY = "What are the main results of the paper?"
+
+
+async def search_with_new_clients(query: str):
+    openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    collection = chroma_client.get_or_create_collection(FILE_COLLECTION_NAME)
+    try:
+        response = await openai_client.embeddings.create(
+            input=query, model=EMBEDDING_MODEL
+        )
+        collection.query(query_embeddings=[response.data[0].embedding], n_results=5)
+    finally:
+        await openai_client.close()
+
+
+async def search_with_shared_clients(query: str):
+    await search_vector_db(query)
+
+
+async def measure(search, queries: int, concurrency: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await search(f"{QUERY} ({i})")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(timed(i) for i in range(queries)))
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{name:8s} {len(latencies)} searches  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+        f"p95 {p95 * 1000:7.1f}ms  "
+        f"mean {statistics.mean(latencies) * 1000:7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    # Warm up DNS and the server side caches before measuring
+    await search_with_new_clients(QUERY)
+
+    report(
+        "new", await measure(search_with_new_clients, args.queries, args.concurrency)
+    )
+    report(
+        "shared",
+        await measure(search_with_shared_clients, args.queries, args.concurrency),
+    )
+    await close_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
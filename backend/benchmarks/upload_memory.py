@@ -0,0 +1,109 @@
+"""
+Load test measuring the peak memory of a running server while it receives
+concurrent uploads. The server's resident set size is sampled from /proc, so
+the benchmark must run on the same host as the server.
+
+Usage:
+    python benchmarks/upload_memory.py --pid <server pid> \
+        [--url http://localhost:8000] [--uploads 8] [--size-mb 50]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+EMAIL = "upload-memory@example.com"
+PASSWORD = "upload-memory"
+
+
+async def login(client: httpx.AsyncClient) -> str:
+    # Registering fails if the user already exists, which is fine
+    await client.post(
+        "/auth/register",
+        json={"name": "upload-memory", "email": EMAIL, "password": PASSWORD},
+    )
+    response = await client.post(
+        "/auth/token", data={"username": EMAIL, "password": PASSWORD}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError(f"No resident set size for process {pid}")
+
+
+async def sample_peak_rss(pid: int, done: asyncio.Event, interval: float = 0.02):
+    peak = rss_mb(pid)
+    while not done.is_set():
+        peak = max(peak, rss_mb(pid))
+        await asyncio.sleep(interval)
+    return peak
+
+
+async def upload(client: httpx.AsyncClient, headers: dict, path: str, i: int):
+    with open(path, "rb") as f:
+        # Not a PDF, so the workers don't index it
+        response = await client.post(
+            "/files",
+            headers=headers,
+            files={"file": (f"upload-{i}.bin", f, "application/octet-stream")},
+        )
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pid", type=int, required=True, help="Server process")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as sample:
+        for _ in range(args.size_mb):
+            sample.write(os.urandom(1024 * 1024))
+        sample.flush()
+
+        async with httpx.AsyncClient(base_url=args.url, timeout=300) as client:
+            token = await login(client)
+            headers = {"Authorization": f"Bearer {token}"}
+
+            baseline = rss_mb(args.pid)
+            done = asyncio.Event()
+            sampler = asyncio.create_task(sample_peak_rss(args.pid, done))
+            start = time.perf_counter()
+            file_ids = await asyncio.gather(
+                *(
+                    upload(client, headers, sample.name, i)
+                    for i in range(args.uploads)
+                )
+            )
+            elapsed = time.perf_counter() - start
+            done.set()
+            peak = await sampler
+
+            print(
+                f"{args.uploads} concurrent uploads of {args.size_mb}MB in "
+                f"{elapsed:.1f}s"
+            )
+            print(
+                f"server RSS  baseline {baseline:7.1f}MB  peak {peak:7.1f}MB  "
+                f"growth {peak - baseline:7.1f}MB"
+            )
+
+            for file_id in file_ids:
+                await client.delete(f"/files/{file_id}", headers=headers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
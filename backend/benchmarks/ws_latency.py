@@ -0,0 +1,99 @@
+"""
+Load test measuring websocket latency on a running server, first while idle and
+then while uploaded files are being indexed. Latency is measured as the time
+to open and authenticate a chat websocket, which stalls whenever the event loop
+is blocked.
+
+Usage:
+    python benchmarks/ws_latency.py [--url http://localhost:8000] [--uploads 4]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import websockets
+
+from extract_pages import make_sample_pdf
+
+EMAIL = "ws-latency@example.com"
+PASSWORD = "ws-latency"
+
+
+async def login(client: httpx.AsyncClient) -> str:
+    # Registering fails if the user already exists, which is fine
+    await client.post(
+        "/auth/register",
+        json={"name": "ws-latency", "email": EMAIL, "password": PASSWORD},
+    )
+    response = await client.post(
+        "/auth/token", data={"username": EMAIL, "password": PASSWORD}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def measure(ws_url: str, token: str, seconds: float) -> list:
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with websockets.connect(
+            ws_url, additional_headers={"Cookie": f"auth_token={token}"}
+        ):
+            latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{name:9s} {len(latencies):4d} connections  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+        f"p95 {p95 * 1000:7.1f}ms  "
+        f"max {latencies[-1] * 1000:7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=30)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        token = await login(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        session = await client.post("/chat/sessions", headers=headers)
+        session.raise_for_status()
+        ws_url = (
+            args.url.replace("http", "ws", 1) + f"/ws/chat/{session.json()['id']}"
+        )
+
+        report("idle", await measure(ws_url, token, args.seconds))
+
+        pdf_bytes = make_sample_pdf(args.pages)
+        file_ids = []
+        for i in range(args.uploads):
+            response = await client.post(
+                "/files",
+                headers=headers,
+                files={"file": (f"sample-{i}.pdf", pdf_bytes, "application/pdf")},
+            )
+            response.raise_for_status()
+            file_ids.append(response.json()["id"])
+
+        report("indexing", await measure(ws_url, token, args.seconds))
+
+        for file_id in file_ids:
+            await client.delete(f"/files/{file_id}", headers=headers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""indexing jobs
+
+Revision ID: a6c3f8e19d42
+Revises: e2a7c9d4b815
+Create Date: 2025-05-27 10:21:37.845102
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a6c3f8e19d42"
+down_revision: Union[str, None] = "e2a7c9d4b815"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "indexing_jobs",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("file_id", sa.UUID(), nullable=False),
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column(
+            "run_at",
+            sa.DateTime(),
+            server_default=sa.text("LOCALTIMESTAMP"),
+            nullable=False,
+        ),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sa.Column("locked_by", sa.String(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["file_id"], ["files.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_indexing_jobs_file_id"), "indexing_jobs", ["file_id"], unique=False
+    )
+    op.create_index(
+        "ix_indexing_jobs_status_run_at",
+        "indexing_jobs",
+        ["status", "run_at"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_indexing_jobs_user_id_status",
+        "indexing_jobs",
+        ["user_id", "status"],
+        unique=False,
+    )
+
+    op.add_column(
+        "files",
+        sa.Column(
+            "index_status", sa.String(), server_default="pending", nullable=False
+        ),
+    )
+    op.add_column("files", sa.Column("index_error", sa.Text(), nullable=True))
+    op.execute("UPDATE files SET index_status = 'indexed' WHERE is_indexed")
+    # Files whose background indexing was lost are queued again
+    op.execute(
+        """
+        INSERT INTO indexing_jobs (
+            id, file_id, user_id, status, attempts, max_attempts, created_at
+        )
+        SELECT gen_random_uuid(), id, user_id, 'queued', 0, 5, LOCALTIMESTAMP
+        FROM files
+        WHERE index_status = 'pending'
+        """
+    )
+    op.drop_column("files", "is_indexed")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column(
+        "files",
+        sa.Column("is_indexed", sa.Boolean(), nullable=True),
+    )
+    op.execute("UPDATE files SET is_indexed = (index_status = 'indexed')")
+    op.drop_column("files", "index_error")
+    op.drop_column("files", "index_status")
+    op.drop_index("ix_indexing_jobs_user_id_status", table_name="indexing_jobs")
+    op.drop_index("ix_indexing_jobs_status_run_at", table_name="indexing_jobs")
+    op.drop_index(op.f("ix_indexing_jobs_file_id"), table_name="indexing_jobs")
+    op.drop_table("indexing_jobs")
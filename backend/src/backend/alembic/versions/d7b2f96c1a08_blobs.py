@@ -0,0 +1,50 @@
+"""blobs
+
+Revision ID: d7b2f96c1a08
+Revises: c4e81a7d3f59
+Create Date: 2025-05-30 10:17:52.604913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7b2f96c1a08"
+down_revision: Union[str, None] = "c4e81a7d3f59"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            server_default=sa.text("LOCALTIMESTAMP"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+    # Existing files are still stored under their own id, files.sha256 is
+    # only set once backend.migrate_blobs moves them to blob storage
+    op.execute("UPDATE files SET sha256 = NULL")
+    op.create_foreign_key(
+        "files_sha256_fkey", "files", "blobs", ["sha256"], ["sha256"]
+    )
+    op.create_index(op.f("ix_files_sha256"), "files", ["sha256"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_files_sha256"), table_name="files")
+    op.drop_constraint("files_sha256_fkey", "files", type_="foreignkey")
+    op.drop_table("blobs")
@@ -0,0 +1,140 @@
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.models import File
+from backend.uploads import StoredUpload
+
+logger = logging.getLogger(__name__)
+
+
+UPLOAD_DIR = "files"
+# File contents, stored once per sha256 however many files share them
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+
+os.makedirs(BLOB_DIR, exist_ok=True)
+
+ADD_BLOB_REF_QUERY = text(
+    """
+    INSERT INTO blobs (sha256, size, ref_count)
+    VALUES (:sha256, :size, 1)
+    ON CONFLICT (sha256) DO UPDATE SET ref_count = blobs.ref_count + 1
+    """
+)
+
+RELEASE_BLOB_QUERY = text(
+    """
+    UPDATE blobs SET ref_count = ref_count - 1
+    WHERE sha256 = :sha256
+    RETURNING ref_count
+    """
+)
+
+# Content files are only moved into place or removed while holding this lock,
+# so removing an unreferenced blob can't race with a new upload of it
+LOCK_BLOB_QUERY = text("SELECT pg_advisory_xact_lock(hashtextextended(:sha256, 0))")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256)
+
+
+def file_path(file: File) -> str:
+    """
+    Return the path of a file's content. Files uploaded before blob storage
+    are stored under their own id until backend.migrate_blobs moves them.
+    """
+    if file.sha256 is not None:
+        return blob_path(file.sha256)
+    return os.path.join(UPLOAD_DIR, str(file.id))
+
+
+def add_blob_ref(db: Session, upload: StoredUpload):
+    """
+    Reference the blob of an upload. The reference is saved when the caller
+    commits, the content has to be put in place with `store_blob` before.
+    """
+    db.execute(ADD_BLOB_REF_QUERY, {"sha256": upload.sha256, "size": upload.size})
+
+
+def store_blob(db: Session, upload: StoredUpload, copy: bool = False):
+    """
+    Move an upload's temporary file to its blob, in the transaction that
+    references it, so the content is in place before the reference (and
+    any job indexing it) is committed. The blob stays locked until the caller
+    commits. If it rolls back instead, the moved content is cleaned up with
+    `remove_unreferenced_blob`.
+
+    Replacing the content of an existing blob with the same bytes is
+    harmless, and restores it if it went missing.
+
+    Args:
+        db: Database session
+        upload: The content to store
+        copy: Copy the content instead of moving it, unless the blob already
+            has it, for content that has to stay until the commit succeeded
+    """
+    db.execute(LOCK_BLOB_QUERY, {"sha256": upload.sha256})
+    path = blob_path(upload.sha256)
+    if not copy:
+        os.replace(upload.path, path)
+        return
+    if os.path.exists(path):
+        return
+
+    # Copied next to the blob first, so the blob never has partial content
+    fd, temp_path = tempfile.mkstemp(dir=BLOB_DIR, prefix=".copy-")
+    os.close(fd)
+    try:
+        shutil.copyfile(upload.path, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def release_blob(db: Session, sha256: Optional[str]) -> bool:
+    """
+    Drop a file's reference to its blob, and the blob's row once nothing
+    references it. Call before committing the file's deletion, and
+    `remove_unreferenced_blob` after it when this returns True.
+
+    Args:
+        db: Database session
+        sha256: The file's blob, None for files not in blob storage
+
+    Returns:
+        True if nothing references the blob anymore
+    """
+    if sha256 is None:
+        return False
+
+    ref_count = db.execute(RELEASE_BLOB_QUERY, {"sha256": sha256}).scalar()
+    if ref_count is None or ref_count > 0:
+        return False
+
+    db.execute(text("DELETE FROM blobs WHERE sha256 = :sha256"), {"sha256": sha256})
+    return True
+
+
+def remove_unreferenced_blob(db: Session, sha256: str):
+    """
+    Remove a blob's content, unless it was uploaded again since its last
+    reference was released, or its content was stored by a transaction that
+    was rolled back.
+    """
+    db.execute(LOCK_BLOB_QUERY, {"sha256": sha256})
+    try:
+        referenced = db.execute(
+            text("SELECT 1 FROM blobs WHERE sha256 = :sha256"), {"sha256": sha256}
+        ).first()
+        if referenced is None and os.path.exists(blob_path(sha256)):
+            os.remove(blob_path(sha256))
+            logger.info(f"Removed blob {sha256[:12]}, no file references it")
+    finally:
+        db.commit()
@@ -1,93 +1,626 @@
+import asyncio
+import copy
+import hashlib
+import logging
 import os
 import uuid
-from typing import List, Dict, Any
-from backend.document_parser import parse_pdf
-import chromadb
-from openai import AsyncOpenAI
+from array import array
+from collections import Counter, deque
+from typing import List, Dict, Any, Set
+from backend.clients import (
+    get_chroma_client,
+    get_collection,
+    get_openai_client,
+    run_chroma,
+)
+from backend.document_parser import ParsedDocument
+from backend.document_store import (
+    chunk_page_num,
+    copy_parsed_document,
+    file_version,
+    load_blocks,
+    load_or_parse_document,
+    save_parsed_document,
+)
+from backend.embedding_cache import embedding_cache
+from backend.indexing_events import report_page_count, report_pages
+from backend.indexing_progress import (
+    clear_page_progress,
+    iter_resumable_pages,
+    load_page_progress,
+    parsed_document_from_progress,
+    record_pages,
+)
+from backend.lexical_search import add_chunks, search_chunks
 from backend.models import File
+from backend.openai_scheduler import estimate_tokens, openai_scheduler
+from backend.rerank import RERANK_CANDIDATES, rerank, reranker
+from backend.search_cache import (
+    corpus_versions,
+    query_embedding_cache,
+    search_result_cache,
+)
+
+logger = logging.getLogger(__name__)
 
 
 FILE_COLLECTION_NAME = "files"
 
+# How chunks are split between collections:
+# - "none": every user's chunks in FILE_COLLECTION_NAME, filtered by user id
+# - "user": one collection per user
+# - "hashed": users hashed into CHROMA_COLLECTION_SHARDS collections, filtered
+#   by user id within a collection
+# Existing chunks are moved after changing this with backend.migrate_collections
+COLLECTION_SHARDING = os.getenv("CHROMA_COLLECTION_SHARDING", "none")
+CHROMA_COLLECTION_SHARDS = int(os.getenv("CHROMA_COLLECTION_SHARDS", "64"))
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
+# Chunks are embedded in batches bounded by both the number of inputs and their
+# total tokens (the API accepts up to 2048 inputs and 300k tokens per request)
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "64"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+# Number of embedding batches requested concurrently while indexing a file
+EMBEDDING_MAX_INFLIGHT_BATCHES = int(
+    os.getenv("EMBEDDING_MAX_INFLIGHT_BATCHES", "4")
+)
+
+# Hybrid search runs a vector and a full-text search in parallel and fuses
+# their rankings with reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_VECTOR_TOP_K = int(os.getenv("HYBRID_VECTOR_TOP_K", "20"))
+HYBRID_LEXICAL_TOP_K = int(os.getenv("HYBRID_LEXICAL_TOP_K", "20"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+# Dampens the weight of the top ranks, 60 is the usual choice
+RRF_K = int(os.getenv("RRF_K", "60"))
+
 
 async def get_chromadb_client():
-    client = chromadb.HttpClient(host="chroma", port=8000)
-    return client
+    return get_chroma_client()
+
+
+def collection_name_for_user(
+    user_id: uuid.UUID | str, sharding: str | None = None
+) -> str:
+    """
+    Return the name of the collection holding a user's chunks
+
+    Args:
+        user_id: The user's ID
+        sharding: The sharding mode, defaults to COLLECTION_SHARDING
+
+    Returns:
+        The collection name
+    """
+    sharding = sharding or COLLECTION_SHARDING
+    if sharding == "user":
+        return f"{FILE_COLLECTION_NAME}_user_{uuid.UUID(str(user_id)).hex}"
+    if sharding == "hashed":
+        digest = hashlib.sha256(str(user_id).encode("utf-8")).digest()
+        shard = int.from_bytes(digest[:8], "big") % CHROMA_COLLECTION_SHARDS
+        return f"{FILE_COLLECTION_NAME}_shard_{shard:03d}"
+    if sharding == "none":
+        return FILE_COLLECTION_NAME
+    raise ValueError(f"Unknown collection sharding mode: {sharding}")
+
+
+def list_file_collection_names() -> List[str]:
+    """
+    Return the names of all collections holding file chunks, in any sharding
+    mode
+    """
+    names = []
+    for collection in get_chroma_client().list_collections():
+        # Older clients list names, newer ones list collections
+        name = getattr(collection, "name", collection)
+        if name == FILE_COLLECTION_NAME or name.startswith(
+            f"{FILE_COLLECTION_NAME}_"
+        ):
+            names.append(name)
+    return names
+
+
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Embed several texts, requesting the ones missing from the embedding cache
+    with a single embeddings request
+
+    Args:
+        texts: The texts to embed
+
+    Returns:
+        The embedding of each text, in the same order
+    """
+    # The cache is in Postgres, keep its queries off the event loop too
+    embeddings = await asyncio.to_thread(
+        embedding_cache.get_many, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, texts
+    )
+    missing = list(dict.fromkeys(text for text in texts if text not in embeddings))
+
+    if missing:
+        openai_client = get_openai_client()
+        response = await openai_scheduler.run(
+            EMBEDDING_MODEL,
+            lambda: openai_client.embeddings.create(
+                input=missing, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS
+            ),
+            estimated_tokens=sum(estimate_tokens(text) for text in missing),
+        )
+        new_embeddings = {missing[item.index]: item.embedding for item in response.data}
+        await asyncio.to_thread(
+            embedding_cache.put_many,
+            EMBEDDING_MODEL,
+            EMBEDDING_DIMENSIONS,
+            new_embeddings,
+        )
+        embeddings.update(new_embeddings)
+
+    return [embeddings[text] for text in texts]
 
 
 async def add_file_to_chromadb(file: File, file_path: str):
     """
     Add a file to ChromaDB for vector search
 
+    The progress of each page is recorded, so indexing the file again after a
+    failure resumes from the pages that weren't written yet. Chunk IDs are
+    derived from their page, so chunks written before the failure are
+    overwritten rather than duplicated.
+
     Args:
         file: The File object from the database
         file_path: Path to the file on disk
     """
-    openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    chroma_client = await get_chromadb_client()
-    collection = chroma_client.get_or_create_collection(FILE_COLLECTION_NAME)
+    collection = await get_collection(collection_name_for_user(file.user_id))
 
     # Read the file content
     with open(file_path, "rb") as f:
         file_content = f.read()
 
     # Parse the document
-    parsed = None
-    if file.content_type == "application/pdf":
-        parsed = await parse_pdf(
-            file_content
-        )  # HOMEWORK: Try and compare page-level chunks vs. block-level chunks
-    else:
+    if file.content_type != "application/pdf":
         # For non-PDF files, we can add support later
         return
 
-    # Process in batches for better performance
-    batch_size = 100
+    # HOMEWORK: Try and compare page-level chunks vs. block-level chunks
+    chunking_mode = "page"
+    version = file.sha256 or file_version(file_content)
+    progress = await asyncio.to_thread(load_page_progress, file.id, version)
+    written_pages = {
+        page_num for page_num, page in progress.items() if page.stage == "written"
+    }
+    if progress:
+        logger.info(
+            f"Resuming indexing of file {file.id}, {len(written_pages)} pages "
+            "already written"
+        )
+
+    stored = await asyncio.to_thread(load_blocks, file.id, version) is not None
+    if stored:
+        # This version was already parsed, e.g. through /parse, so its stored
+        # chunks are indexed without analyzing the pages again
+        parsed_document = await load_or_parse_document(
+            file.id, file_content, chunking_mode
+        )
+        pages = _iter_stored_pages(parsed_document, skip_pages=written_pages)
+        pages_total = len(parsed_document.stats.get("pages", []))
+        report_page_count(pages_total)
+        report_pages("extracted", pages_total)
+        report_pages("analyzed", pages_total)
+    else:
+        pages = iter_resumable_pages(
+            file.id, version, file_content, chunking_mode, progress
+        )
+        # The parser reports the pages it extracts and analyzes, not those
+        # parsed by earlier runs
+        report_pages("extracted", len(progress))
+        report_pages("analyzed", len(progress))
+    for stage in ("described", "embedded", "written"):
+        report_pages(stage, len(written_pages))
+
+    # Chunks of each page that are not embedded, and not written yet
+    unembedded = Counter()
+    unwritten = Counter()
+
+    async def record_stage(stage: str, page_nums: List[int]):
+        report_pages(stage, len(page_nums))
+        await asyncio.to_thread(
+            record_pages,
+            file.id,
+            version,
+            stage,
+            {page_num: {} for page_num in page_nums},
+        )
+
+    # Chunks are streamed from the parser, so batches are kept small enough
+    # that the first pages become searchable while the rest are still parsed
+    batch_size = 20
     batched_ids = []
     batched_embeddings = []
     batched_documents = []
     batched_metadata = []
 
-    for i, chunk in enumerate(parsed.chunks):
-        # Get embedding from OpenAI
-        embedding_response = await openai_client.embeddings.create(
-            input=chunk.embed,  # HOMEWORK: Try and compare using chunk.embed vs. chunk.content
-            model="text-embedding-3-small",
+    async def flush_batch():
+        # Chunks of a previous, interrupted run have the same IDs
+        await run_chroma(
+            collection.upsert,
+            ids=batched_ids,
+            embeddings=batched_embeddings,
+            documents=batched_documents,
+            metadatas=batched_metadata,
+        )
+        await asyncio.to_thread(
+            add_chunks,
+            [
+                {
+                    "id": chunk_id,
+                    "file_id": file.id,
+                    "user_id": file.user_id,
+                    "file_name": file.name,
+                    "page_number": metadata["page_number"],
+                    "content": document,
+                }
+                for chunk_id, document, metadata in zip(
+                    batched_ids, batched_documents, batched_metadata
+                )
+            ],
         )
-        embedding_vector = embedding_response.data[0].embedding
+        # New chunks can change the user's search results. This only reaches
+        # this process's caches, the web servers bump theirs on the progress
+        # events the workers relay.
+        corpus_versions.bump(file.user_id)
 
+        written = []
+        for metadata in batched_metadata:
+            unwritten[metadata["page_number"]] -= 1
+            if unwritten[metadata["page_number"]] == 0:
+                written.append(metadata["page_number"])
+        await record_stage("written", written)
+
+        # Clear batches
+        batched_ids.clear()
+        batched_embeddings.clear()
+        batched_documents.clear()
+        batched_metadata.clear()
+
+    async def add_to_batch(
+        page_num: int, chunk_id: str, chunk, embedding_vector: List[float]
+    ):
         # Create metadata
         metadata = {
             "file_id": str(file.id),
             "file_name": file.name,
-            "page_number": chunk.metadata.get("page_num", 0),
+            "page_number": page_num,
             "user_id": str(file.user_id),
         }
+        if chunk.metadata.get("duplicate_pages"):
+            metadata["duplicate_pages"] = ",".join(
+                str(duplicate) for duplicate in chunk.metadata["duplicate_pages"]
+            )
 
-        batched_ids.append(f"{file.id}_{i}")
+        batched_ids.append(chunk_id)
         batched_embeddings.append(embedding_vector)
         batched_documents.append(chunk.content)
         batched_metadata.append(metadata)
 
         # Add in batches
-        if len(batched_ids) >= batch_size or i == len(parsed.chunks) - 1:
-            collection.add(
-                ids=batched_ids,
-                embeddings=batched_embeddings,
-                documents=batched_documents,
-                metadatas=batched_metadata,
+        if len(batched_ids) >= batch_size:
+            await flush_batch()
+
+    # Embedding requests in flight, oldest first so chunks are added in order.
+    # Chunks are (page number, chunk ID, chunk) tuples.
+    inflight = deque()
+    pending_chunks = []
+    pending_tokens = 0
+
+    def request_embeddings():
+        nonlocal pending_chunks, pending_tokens
+        # HOMEWORK: Try and compare using chunk.embed vs. chunk.content
+        texts = [chunk.embed for _, _, chunk in pending_chunks]
+        inflight.append((asyncio.create_task(embed_texts(texts)), pending_chunks))
+        pending_chunks = []
+        pending_tokens = 0
+
+    async def add_oldest_embeddings():
+        task, batch_chunks = inflight.popleft()
+        embedding_vectors = await task
+
+        embedded = []
+        for page_num, _, _ in batch_chunks:
+            unembedded[page_num] -= 1
+            if unembedded[page_num] == 0:
+                embedded.append(page_num)
+        await record_stage("embedded", embedded)
+
+        for (page_num, chunk_id, chunk), embedding_vector in zip(
+            batch_chunks, embedding_vectors
+        ):
+            await add_to_batch(page_num, chunk_id, chunk, embedding_vector)
+
+    async def drain():
+        if pending_chunks:
+            if len(inflight) >= EMBEDDING_MAX_INFLIGHT_BATCHES:
+                await add_oldest_embeddings()
+            request_embeddings()
+        while inflight:
+            await add_oldest_embeddings()
+        if batched_ids:
+            await flush_batch()
+
+    try:
+        async for page_num, chunks in pages:
+            report_pages("described")
+            if not chunks:
+                # Blank and duplicate pages have nothing to index
+                report_pages("embedded")
+                await record_stage("written", [page_num])
+                continue
+            unembedded[page_num] = len(chunks)
+            unwritten[page_num] = len(chunks)
+
+            for index, chunk in enumerate(chunks):
+                tokens = estimate_tokens(chunk.embed)
+                if pending_chunks and (
+                    len(pending_chunks) >= EMBEDDING_BATCH_MAX_INPUTS
+                    or pending_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS
+                ):
+                    if len(inflight) >= EMBEDDING_MAX_INFLIGHT_BATCHES:
+                        await add_oldest_embeddings()
+                    request_embeddings()
+                chunk_id = f"{file.id}_{page_num}_{index}"
+                pending_chunks.append((page_num, chunk_id, chunk))
+                pending_tokens += tokens
+
+            while inflight and inflight[0][0].done():
+                await add_oldest_embeddings()
+            # Don't hold chunks back while no request is in flight, so batches
+            # only grow while waiting on the API anyway
+            if not inflight:
+                request_embeddings()
+    except Exception:
+        # Write the pages parsed before the failure, a retry resumes after them
+        await drain()
+        raise
+    else:
+        await drain()
+    finally:
+        for task, _ in inflight:
+            task.cancel()
+
+    # Every page is written, keep the parsed document and forget the progress
+    if not stored:
+        progress = await asyncio.to_thread(load_page_progress, file.id, version)
+        await asyncio.to_thread(
+            save_parsed_document,
+            file.id,
+            version,
+            chunking_mode,
+            parsed_document_from_progress(progress),
+        )
+    await asyncio.to_thread(clear_page_progress, file.id, version)
+
+
+async def _iter_stored_pages(parsed_document: ParsedDocument, skip_pages: Set[int]):
+    """
+    Yield the chunks of a stored parsed document grouped by page, including
+    the pages without chunks.
+    """
+    pages = {
+        report["page_num"]: [] for report in parsed_document.stats.get("pages", [])
+    }
+    for chunk in parsed_document.chunks:
+        pages.setdefault(chunk_page_num(chunk), []).append(chunk)
+    for page_num in sorted(pages):
+        if page_num not in skip_pages:
+            yield page_num, pages[page_num]
+
+
+async def copy_file_in_chromadb(
+    source: File, file: File, batch_size: int = 500
+) -> int:
+    """
+    Index a file by copying the chunks of an indexed file with the same
+    content, retagged with the file's id, name and user. Embeddings are copied
+    as they are, so nothing is parsed or embedded again.
+
+    Args:
+        source: The indexed file
+        file: The file to index
+        batch_size: Number of chunks read and written at once
+
+    Returns:
+        The number of chunks copied
+    """
+    source_collection = await get_collection(collection_name_for_user(source.user_id))
+    collection = await get_collection(collection_name_for_user(file.user_id))
+    source_prefix = f"{source.id}_"
+
+    copied = 0
+    while True:
+        # New chunks have another file id, so they don't shift the offsets
+        # when both files are in the same collection
+        batch = await run_chroma(
+            source_collection.get,
+            where={"file_id": str(source.id)},
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=copied,
+        )
+        if not batch["ids"]:
+            break
+        copied += len(batch["ids"])
+
+        ids = [
+            f"{file.id}_{chunk_id.removeprefix(source_prefix)}"
+            for chunk_id in batch["ids"]
+        ]
+        metadatas = [
+            {
+                **metadata,
+                "file_id": str(file.id),
+                "file_name": file.name,
+                "user_id": str(file.user_id),
+            }
+            for metadata in batch["metadatas"]
+        ]
+        await run_chroma(
+            collection.upsert,
+            ids=ids,
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=metadatas,
+        )
+        await asyncio.to_thread(
+            add_chunks,
+            [
+                {
+                    "id": chunk_id,
+                    "file_id": file.id,
+                    "user_id": file.user_id,
+                    "file_name": file.name,
+                    "page_number": metadata["page_number"],
+                    "content": document,
+                }
+                for chunk_id, document, metadata in zip(
+                    ids, batch["documents"], metadatas
+                )
+            ],
+        )
+
+    if file.sha256 is not None:
+        await asyncio.to_thread(copy_parsed_document, source.id, file.id, file.sha256)
+    corpus_versions.bump(file.user_id)
+    logger.info(f"Copied {copied} chunks of file {source.id} to file {file.id}")
+    return copied
+
+
+async def delete_file_from_chromadb(file_id: uuid.UUID, user_id: uuid.UUID):
+    collection = await get_collection(collection_name_for_user(user_id))
+    await run_chroma(collection.delete, where={"file_id": str(file_id)})
+
+
+async def query_vector_db(
+    query_embeddings: List[List[float]], top_k: int, user_id: uuid.UUID = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Find the chunks nearest to each of several query embeddings, with a single
+    query per collection
+
+    Args:
+        query_embeddings: Embeddings of the search queries
+        top_k: Number of results to return per query
+        user_id: If provided, only search files belonging to this user
+
+    Returns:
+        For each query, list of chunks with metadata, nearest first
+    """
+    if user_id:
+        collection_names = [collection_name_for_user(user_id)]
+    elif COLLECTION_SHARDING == "none":
+        collection_names = [FILE_COLLECTION_NAME]
+    else:
+        # Searching across users fans out to every shard
+        collection_names = await run_chroma(list_file_collection_names)
+
+    # A collection per user holds only that user's chunks, no need to filter
+    where_clause = None
+    if user_id and COLLECTION_SHARDING != "user":
+        where_clause = {"user_id": str(user_id)}
+
+    async def query_collection(name: str) -> Dict[str, Any]:
+        collection = await get_collection(name)
+        return await run_chroma(
+            collection.query,
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=where_clause,
+        )
+
+    # Format the results
+    formatted_results = [[] for _ in query_embeddings]
+    for results in await asyncio.gather(*map(query_collection, collection_names)):
+        if not results or not results.get("documents"):
+            continue
+        for q, documents in enumerate(results["documents"]):
+            for i, doc in enumerate(documents):
+                formatted_results[q].append(
+                    {
+                        "id": results["ids"][q][i],
+                        "content": doc,
+                        "metadata": (
+                            results["metadatas"][q][i]
+                            if results.get("metadatas")
+                            else {}
+                        ),
+                        "distance": (
+                            results["distances"][q][i]
+                            if results.get("distances")
+                            else None
+                        ),
+                    }
+                )
+
+    if len(collection_names) > 1:
+        for q, query_results in enumerate(formatted_results):
+            query_results.sort(
+                key=lambda result: (
+                    result["distance"]
+                    if result["distance"] is not None
+                    else float("inf")
+                )
             )
-            # Clear batches
-            batched_ids = []
-            batched_embeddings = []
-            batched_documents = []
-            batched_metadata = []
+            formatted_results[q] = query_results[:top_k]
+
+    return formatted_results
 
 
-async def delete_file_from_chromadb(file_id: uuid.UUID):
-    chroma_client = await get_chromadb_client()
-    collection = chroma_client.get_or_create_collection(FILE_COLLECTION_NAME)
-    collection.delete(where={"file_id": str(file_id)})
+def reciprocal_rank_fusion(rankings: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Fuse rankings of chunks with reciprocal rank fusion: each chunk scores
+    weight / (RRF_K + rank) in every ranking it appears in
+
+    Args:
+        rankings: (results, weight) pairs, results best first
+
+    Returns:
+        The results of all rankings, deduplicated and sorted by fused score
+    """
+    fused = {}
+    for results, weight in rankings:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result["id"], {**result, "score": 0.0})
+            entry["score"] += weight / (RRF_K + rank)
+            # Keep the vector distance of chunks found by both searches
+            if entry.get("distance") is None:
+                entry["distance"] = result.get("distance")
+    return sorted(fused.values(), key=lambda result: result["score"], reverse=True)
+
+
+async def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embed search queries, with one embeddings request for the queries missing
+    from the query embedding cache
+
+    Args:
+        queries: The normalized search queries
+
+    Returns:
+        The embedding of each query, in the same order
+    """
+    query_embeddings = {}
+    for query in queries:
+        cached_embedding = query_embedding_cache.get(query)
+        if cached_embedding is not None:
+            query_embeddings[query] = cached_embedding.tolist()
+    missing = list(dict.fromkeys(q for q in queries if q not in query_embeddings))
+    if missing:
+        for query, embedding in zip(missing, await embed_texts(missing)):
+            query_embeddings[query] = embedding
+            # Stored as float32 to keep the cache small
+            query_embedding_cache.put(query, array("f", embedding))
+    return [query_embeddings[query] for query in queries]
 
 
 async def search_vector_db(
@@ -104,41 +637,93 @@ async def search_vector_db(
     Returns:
         List of relevant chunks with metadata
     """
-    openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    chroma_client = await get_chromadb_client()
-    collection = chroma_client.get_or_create_collection(FILE_COLLECTION_NAME)
+    return await search_vector_db_batch([query], top_k=top_k, user_id=user_id)
 
-    # HOMEWORK: Try query enrichment techniques
 
-    # Get embedding for the query
-    embedding_response = await openai_client.embeddings.create(
-        input=query, model="text-embedding-3-small"
-    )
-    query_embedding = embedding_response.data[0].embedding
+def _discard_outcome(future: asyncio.Future):
+    # Marks the future's exception as retrieved, so it isn't logged
+    if not future.cancelled():
+        future.exception()
 
-    # Search the collection
-    where_clause = {"user_id": str(user_id)} if user_id else None
 
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        where=where_clause,
+async def search_vector_db_batch(
+    queries: List[str], top_k: int = 5, user_id: uuid.UUID = None
+) -> List[Dict[str, Any]]:
+    """
+    Search the vector database for chunks relevant to any of several queries,
+    with one embeddings request and one query per collection for all of them
+
+    Args:
+        queries: The search queries, e.g. reformulations of a question
+        top_k: Number of results to return in total
+        user_id: If provided, only search files belonging to this user
+
+    Returns:
+        List of relevant chunks with metadata, deduplicated across queries
+    """
+    # Queries differing only in whitespace share cache entries
+    queries = list(dict.fromkeys(" ".join(query.split()) for query in queries))
+    # Results are invalidated by bumping the version when the corpus changes
+    corpus_version = corpus_versions.get(user_id)
+    result_key = (
+        str(user_id) if user_id else None,
+        tuple(queries),
+        top_k,
+        corpus_version,
     )
+    cached_results = search_result_cache.get(result_key)
+    if cached_results is not None:
+        return copy.deepcopy(cached_results)
 
-    # Format the results
-    formatted_results = []
-    if results and results.get("documents"):
-        for i, doc in enumerate(results["documents"][0]):
-            formatted_results.append(
-                {
-                    "content": doc,
-                    "metadata": (
-                        results["metadatas"][0][i] if results.get("metadatas") else {}
-                    ),
-                    "distance": (
-                        results["distances"][0][i] if results.get("distances") else None
-                    ),
-                }
+    # HOMEWORK: Try query enrichment techniques
+
+    # Over-fetch candidates for the re-ranker to choose from
+    candidate_k = max(top_k, RERANK_CANDIDATES) if reranker else top_k
+
+    # The full-text search doesn't need the query embeddings, start it first
+    lexical_search = None
+    if HYBRID_SEARCH:
+        lexical_k = max(HYBRID_LEXICAL_TOP_K, candidate_k)
+        lexical_search = asyncio.ensure_future(
+            asyncio.gather(
+                *(
+                    asyncio.to_thread(search_chunks, query, lexical_k, user_id)
+                    for query in queries
+                )
+            )
+        )
+
+    try:
+        # Get embeddings for the queries
+        query_embeddings = await embed_queries(queries)
+
+        # Every ranking of every query is fused, so chunks found by several of
+        # them rank higher
+        if HYBRID_SEARCH:
+            vector_results, lexical_results = await asyncio.gather(
+                query_vector_db(
+                    query_embeddings, max(HYBRID_VECTOR_TOP_K, candidate_k), user_id
+                ),
+                lexical_search,
             )
+            rankings = [(results, HYBRID_VECTOR_WEIGHT) for results in vector_results]
+            rankings += [
+                (results, HYBRID_LEXICAL_WEIGHT) for results in lexical_results
+            ]
+        else:
+            vector_results = await query_vector_db(
+                query_embeddings, candidate_k, user_id
+            )
+            rankings = [(results, 1.0) for results in vector_results]
+    finally:
+        if lexical_search is not None:
+            # Left behind when the vector search failed. Its threads can't be
+            # stopped, but their results are dropped.
+            lexical_search.cancel()
+            lexical_search.add_done_callback(_discard_outcome)
+    formatted_results = reciprocal_rank_fusion(rankings)[:candidate_k]
+
+    formatted_results = await rerank(" ".join(queries), formatted_results, top_k)
 
+    search_result_cache.put(result_key, copy.deepcopy(formatted_results))
     return formatted_results
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import chromadb
+from chromadb.api import ClientAPI
+from chromadb.api.models.Collection import Collection
+from chromadb.api.shared_system_client import SharedSystemClient
+from chromadb.config import Settings
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logger = logging.getLogger(__name__)
+
+
+CHROMA_HOST = os.getenv("CHROMA_HOST", "chroma")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
+# Connection pools shared by every request to OpenAI and Chroma. Idle
+# connections are kept open so requests skip the TCP and TLS handshakes.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+CHROMA_MAX_CONNECTIONS = int(os.getenv("CHROMA_MAX_CONNECTIONS", "50"))
+CHROMA_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("CHROMA_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+KEEPALIVE_EXPIRY_SECONDS = 60.0
+# The Chroma client is synchronous, its calls run on a dedicated thread pool so
+# they don't block the event loop. This bounds concurrent Chroma requests.
+CHROMA_MAX_WORKERS = int(os.getenv("CHROMA_MAX_WORKERS", "16"))
+
+T = TypeVar("T")
+
+_openai_client: Optional[AsyncOpenAI] = None
+_chroma_client: Optional[ClientAPI] = None
+_collections: Dict[str, Collection] = {}
+_chroma_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Return the application-wide OpenAI client, creating it on first use.
+
+    The client doesn't retry failed requests itself, retries are handled by
+    the OpenAI scheduler.
+    """
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            ),
+        )
+    return _openai_client
+
+
+def _chroma_http_settings() -> Dict[str, Any]:
+    """
+    Connection pool settings for the Chroma HTTP client.
+    """
+    return {
+        "chroma_http_max_connections": CHROMA_MAX_CONNECTIONS,
+        "chroma_http_max_keepalive_connections": CHROMA_MAX_KEEPALIVE_CONNECTIONS,
+        "chroma_http_keepalive_secs": KEEPALIVE_EXPIRY_SECONDS,
+    }
+
+
+def get_chroma_client() -> ClientAPI:
+    """
+    Return the application-wide Chroma client, creating it on first use.
+    """
+    global _chroma_client
+    if _chroma_client is None:
+        _chroma_client = chromadb.HttpClient(
+            host=CHROMA_HOST,
+            port=CHROMA_PORT,
+            settings=Settings(**_chroma_http_settings()),
+        )
+    return _chroma_client
+
+
+async def run_chroma(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking Chroma call on the Chroma thread pool.
+
+    Args:
+        func: The Chroma client or collection method to call
+        *args: Positional arguments for the call
+        **kwargs: Keyword arguments for the call
+
+    Returns:
+        The result of the call
+    """
+    global _chroma_executor
+    if _chroma_executor is None:
+        _chroma_executor = ThreadPoolExecutor(
+            max_workers=CHROMA_MAX_WORKERS, thread_name_prefix="chroma"
+        )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _chroma_executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def get_collection(name: str) -> Collection:
+    """
+    Return a handle to a Chroma collection, creating the collection if needed.
+    Handles are cached so the collection is only looked up once.
+    """
+    if name not in _collections:
+        _collections[name] = await run_chroma(
+            get_chroma_client().get_or_create_collection, name
+        )
+    return _collections[name]
+
+
+async def close_clients():
+    """
+    Close the application-wide clients and their connection pools.
+    """
+    global _openai_client, _chroma_client, _chroma_executor
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+    if _chroma_client is not None:
+        _collections.clear()
+        _chroma_client = None
+        # Chroma shares its HTTP session between clients with the same
+        # settings, dropping the shared systems releases it
+        SharedSystemClient.clear_system_cache()
+
+    if _chroma_executor is not None:
+        _chroma_executor.shutdown(wait=True)
+        _chroma_executor = None
+
+    logger.info("Closed OpenAI and Chroma clients")
@@ -0,0 +1,156 @@
+import hashlib
+import os
+from typing import Any, Dict, List, Set
+
+from pydantic import BaseModel, Field
+
+from backend.openai_scheduler import estimate_tokens
+
+
+# Maximum number of tokens of context returned to the agent per retrieval
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# Fraction of a chunk's shingles found in a better ranked chunk from which it
+# counts as a duplicate
+CONTEXT_DUPLICATE_THRESHOLD = float(
+    os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8")
+)
+# A chunk that doesn't fit the budget is cut down to the remaining budget only
+# if at least this many tokens remain
+CONTEXT_MIN_TRIM_TOKENS = 200
+# Number of words per shingle when comparing chunks
+SHINGLE_SIZE = 5
+
+
+class ContextPart(BaseModel):
+    file_id: str | None = Field(description="ID of the file")
+    file_name: str | None = Field(description="Name of the file")
+    page_numbers: List[int] = Field(description="Pages the content comes from")
+    content: str = Field(description="Text of the pages")
+
+
+class PackedContext(BaseModel):
+    parts: List[ContextPart] = Field(
+        description="Context parts, most relevant first"
+    )
+    raw_tokens: int = Field(description="Estimated tokens of all search results")
+    packed_tokens: int = Field(description="Estimated tokens of the packed parts")
+    duplicates: int = Field(description="Search results dropped as duplicates")
+    truncated: int = Field(description="Search results cut or dropped to fit")
+
+
+def _shingles(text: str) -> Set[str]:
+    words = text.lower().split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {
+        hashlib.blake2b(
+            " ".join(words[i : i + SHINGLE_SIZE]).encode("utf-8"), digest_size=8
+        ).hexdigest()
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    """
+    Cut a text to about `max_tokens` tokens, at a paragraph or line break when
+    there is one close enough.
+    """
+    # Longest text estimated at `max_tokens`, see estimate_tokens
+    max_chars = max_tokens * 4 - 1
+    if len(text) <= max_chars:
+        return text
+    # Leave room for the marker appended to the cut text
+    cut = text[: max_chars - len(" [...]")]
+    for separator in ("\n\n", "\n", ". "):
+        position = cut.rfind(separator)
+        if position >= len(cut) * 0.7:
+            return cut[: position + len(separator)].rstrip() + "\n[...]"
+    return cut.rstrip() + " [...]"
+
+
+def pack_context(
+    results: List[Dict[str, Any]],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD,
+) -> PackedContext:
+    """
+    Pack search results into as little context as possible for the agent.
+
+    Results are taken in order of relevance. Results mostly contained in a
+    better ranked one are dropped, the rest are added until the token budget
+    is spent, and results from adjacent pages of the same file are merged.
+
+    Args:
+        results: Search results, most relevant first
+        token_budget: Maximum estimated tokens of packed content
+        duplicate_threshold: Fraction of shared shingles from which a result is
+            a duplicate of a better ranked one
+
+    Returns:
+        The packed context parts with token counts
+    """
+    raw_tokens = sum(estimate_tokens(result["content"]) for result in results)
+
+    selected = []
+    seen_shingles: Set[str] = set()
+    duplicates = 0
+    truncated = 0
+    remaining = token_budget
+    for result in results:
+        content = result["content"].strip()
+        shingles = _shingles(content)
+        if shingles and len(shingles & seen_shingles) >= duplicate_threshold * len(
+            shingles
+        ):
+            duplicates += 1
+            continue
+
+        tokens = estimate_tokens(content)
+        if tokens > remaining:
+            truncated += 1
+            if remaining < CONTEXT_MIN_TRIM_TOKENS:
+                continue
+            content = _trim(content, remaining)
+            tokens = estimate_tokens(content)
+
+        seen_shingles |= shingles
+        remaining -= tokens
+        selected.append((result["metadata"], content))
+
+    # Merge results from the same or adjacent pages of a file into one part,
+    # placed where its best ranked result was
+    parts: List[ContextPart] = []
+    for metadata, content in selected:
+        file_id = metadata.get("file_id")
+        page_number = metadata.get("page_number")
+        for part in parts:
+            if (
+                part.file_id == file_id
+                and page_number is not None
+                and part.page_numbers
+                and min(abs(page_number - page) for page in part.page_numbers) <= 1
+            ):
+                # Keep the text in page order
+                if page_number < min(part.page_numbers):
+                    part.content = f"{content}\n\n{part.content}"
+                else:
+                    part.content = f"{part.content}\n\n{content}"
+                part.page_numbers = sorted(set(part.page_numbers) | {page_number})
+                break
+        else:
+            parts.append(
+                ContextPart(
+                    file_id=file_id,
+                    file_name=metadata.get("file_name"),
+                    page_numbers=[page_number] if page_number is not None else [],
+                    content=content,
+                )
+            )
+
+    return PackedContext(
+        parts=parts,
+        raw_tokens=raw_tokens,
+        packed_tokens=sum(estimate_tokens(part.content) for part in parts),
+        duplicates=duplicates,
+        truncated=truncated,
+    )
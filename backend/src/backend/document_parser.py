@@ -1,19 +1,88 @@
 import asyncio
-import base64
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+import multiprocessing
 import os
-from typing import Any, Dict, List, Literal
+import re
+import tempfile
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from openai import AsyncOpenAI
 
 import pymupdf
 from pydantic import BaseModel, Field
 
+from backend.clients import get_openai_client
+from backend.indexing_events import report_page_count, report_pages
+from backend.openai_scheduler import (
+    estimate_message_tokens,
+    estimate_tokens,
+    openai_scheduler,
+)
+from backend.page_cache import page_analysis_cache, page_cache_key
+from backend.page_image import (
+    PAGE_IMAGE_POLICY,
+    PageImagePolicy,
+    page_fingerprint,
+    render_page_image,
+)
+
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+PAGE_ANALYSIS_MODEL = "gpt-4.1-mini-2025-04-14"
+# Part of the page analysis cache key. Bump when the analysis or description
+# prompts or the response schemas change so stale results aren't reused.
+PAGE_ANALYSIS_PROMPT_VERSION = "1"
+
+# Number of worker processes used to rasterize pages. 0 disables the process
+# pool and extracts pages in the event loop.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Number of consecutive pages rendered by a single worker task
+PDF_EXTRACT_BATCH_SIZE = int(os.getenv("PDF_EXTRACT_BATCH_SIZE", "8"))
+
+# Maximum number of pages being analyzed and chunked at once by the streaming
+# parser. Bounds the number of rendered page images held in memory.
+PARSE_MAX_INFLIGHT_PAGES = int(os.getenv("PARSE_MAX_INFLIGHT_PAGES", "10"))
+
+# Turn simple digital-text pages into blocks locally instead of sending them to
+# the vision model
+PDF_LOCAL_FAST_PATH = os.getenv("PDF_LOCAL_FAST_PATH", "true").lower() == "true"
+# Pages with fewer characters than this are likely scanned or mostly graphics
+LOCAL_MIN_TEXT_CHARS = 200
+# Pages with more vector drawings than this likely contain tables or charts
+LOCAL_MAX_DRAWINGS = 8
+
+# Skip blank pages and pages duplicating an earlier page of the document
+PDF_SKIP_REDUNDANT_PAGES = (
+    os.getenv("PDF_SKIP_REDUNDANT_PAGES", "true").lower() == "true"
+)
+# Maximum number of differing bits between the image hashes of two pages with
+# the same text for them to be considered duplicates
+PAGE_DUPLICATE_MAX_DISTANCE = 5
+
+# Bullets ("•", "-", "*") or enumerations ("1.", "a)") at the start of a block
+LIST_ITEM_PATTERN = re.compile(
+    r"^\s*([\u2022\u25cf\u25aa\u2013*-]|\d+[.)]|[a-z][.)])\s+"
+)
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+
+
 class BlockType(str, Enum):
     """
     Classification of document block types.
@@ -156,6 +225,10 @@ class ParsedDocument(BaseModel):
     chunks: List[DocumentChunk] = Field(
         description="Organized collection of document chunks"
     )
+    stats: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Statistics about how the document was parsed",
+    )
 
 
 async def load_pdf(bytes: bytes) -> ParsedDocument:
@@ -181,14 +254,272 @@ async def load_pdf(bytes: bytes) -> ParsedDocument:
         raise
 
 
+def has_graphics(page: pymupdf.Page) -> bool:
+    """
+    Whether a page contains images or more than a few vector drawings, i.e.
+    figures, charts, tables or scanned content.
+    """
+    return bool(page.get_images()) or len(page.get_drawings()) > LOCAL_MAX_DRAWINGS
+
+
+def extract_local_blocks(
+    page: pymupdf.Page, page_has_graphics: Optional[bool] = None
+) -> Optional[List[Dict[str, str]]]:
+    """
+    Turn a simple page into blocks using its text layer only.
+
+    A page is simple when it has a real text layer and no images or more than
+    a few vector drawings, i.e. no figures, charts, tables or scanned content
+    that need the vision model. Blocks are classified from their font sizes,
+    weight and position on the page.
+
+    Args:
+        page: A pymupdf.Page object
+        page_has_graphics: Result of `has_graphics` for the page, if already
+            known
+
+    Returns:
+        A list of dictionaries with the block type and content, or None if the
+        page should be analyzed by the model
+    """
+    if page_has_graphics is None:
+        page_has_graphics = has_graphics(page)
+    if page_has_graphics:
+        return None
+
+    text_blocks = []
+    size_chars = Counter()
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] != 0:
+            # Image block
+            return None
+
+        spans = [span for line in block["lines"] for span in line["spans"]]
+        content = "\n".join(
+            "".join(span["text"] for span in line["spans"]).strip()
+            for line in block["lines"]
+        ).strip()
+        if not content:
+            continue
+
+        for span in spans:
+            size_chars[round(span["size"], 1)] += len(span["text"])
+        text_blocks.append(
+            {
+                "content": content,
+                "bbox": block["bbox"],
+                "size": max(span["size"] for span in spans),
+                "bold": all(span["flags"] & pymupdf.TEXT_FONT_BOLD for span in spans),
+                "lines": len(block["lines"]),
+            }
+        )
+
+    if sum(size_chars.values()) < LOCAL_MIN_TEXT_CHARS:
+        return None
+
+    # The most common font size by character count is the body text size
+    body_size = size_chars.most_common(1)[0][0]
+    largest_size = max(block["size"] for block in text_blocks)
+    page_height = page.rect.height
+
+    blocks = []
+    for block in text_blocks:
+        content = block["content"]
+        _, top, _, bottom = block["bbox"]
+        is_short = block["lines"] <= 2 and len(content) < 200
+
+        if content.isdigit() and is_short:
+            block_type = BlockType.PAGE_NUMBER
+        elif bottom < page_height * 0.06 and is_short:
+            block_type = BlockType.HEADER
+        elif top > page_height * 0.94 and is_short:
+            block_type = BlockType.FOOTER
+        elif (
+            page.number == 0
+            and block["size"] == largest_size
+            and block["size"] >= body_size * 1.5
+            and is_short
+        ):
+            block_type = BlockType.TITLE
+        elif is_short and (block["size"] >= body_size * 1.15 or block["bold"]):
+            block_type = BlockType.SECTION_HEADER
+        elif LIST_ITEM_PATTERN.match(content):
+            block_type = BlockType.LIST_ITEM
+        else:
+            block_type = BlockType.TEXT
+
+        blocks.append({"type": block_type.value, "content": content})
+
+    return blocks
+
+
+def _render_page(
+    page: pymupdf.Page, image_policy: PageImagePolicy = PAGE_IMAGE_POLICY
+) -> Dict[str, Any]:
+    """
+    Extract the text and a base64 encoded JPEG rendering of a single page.
+    Simple pages get their blocks extracted locally instead of being
+    rendered, see `extract_local_blocks`.
+    """
+    # Extract text
+    text = page.get_text()
+    page_has_graphics = has_graphics(page)
+    local_blocks = (
+        extract_local_blocks(page, page_has_graphics) if PDF_LOCAL_FAST_PATH else None
+    )
+
+    page_data = {
+        "page_num": page.number + 1,  # 1-indexed
+        "text": text,
+        "local_blocks": local_blocks,
+    }
+    # Only the model looks at the image
+    if local_blocks is None:
+        page_data.update(render_page_image(page, text, page_has_graphics, image_policy))
+    return page_data
+
+
+def _extract_pages(
+    pdf_path: str,
+    page_indexes: List[int],
+    image_policy: PageImagePolicy = PAGE_IMAGE_POLICY,
+) -> List[Dict[str, Any]]:
+    """
+    Render the given pages (0-indexed) of a PDF. Runs in a worker process,
+    which opens the document itself so only the path and the results cross
+    the process boundary.
+    """
+    with pymupdf.open(pdf_path) as document:
+        return [
+            _render_page(document[page_index], image_policy)
+            for page_index in page_indexes
+        ]
+
+
+def _fingerprint_page_range(pdf_path: str, start: int, stop: int) -> List[Dict]:
+    """
+    Fingerprint pages `start` (inclusive) to `stop` (exclusive) of a PDF in a
+    worker process.
+    """
+    with pymupdf.open(pdf_path) as document:
+        return [
+            page_fingerprint(document[page_index])
+            for page_index in range(start, stop)
+        ]
+
+
+def find_redundant_pages(fingerprints: List[Dict[str, Any]]) -> Dict[int, Dict]:
+    """
+    Find blank pages and pages duplicating an earlier page of the same
+    document. Pages with text are duplicates when their normalized text is
+    identical and their image hashes differ by at most
+    `PAGE_DUPLICATE_MAX_DISTANCE` bits. Pages without text, e.g. scans, are
+    only duplicates when their renderings are identical pixel for pixel, a
+    close image hash alone doesn't tell distinct scans apart.
+
+    Args:
+        fingerprints: Page fingerprints in page order, see `page_fingerprint`
+
+    Returns:
+        A dictionary mapping the number (1-indexed) of each redundant page to
+        a placeholder page: {"page_num", "skip_reason": "blank"} or
+        {"page_num", "skip_reason": "duplicate", "duplicate_of": page_num}
+    """
+    redundant = {}
+    # Earlier kept pages by text hash, as (image hash, page number)
+    seen: Dict[str, List] = {}
+    # Earlier kept pages without text by pixel hash
+    seen_pixels: Dict[str, int] = {}
+    for page_index, fingerprint in enumerate(fingerprints):
+        page_num = page_index + 1
+        if fingerprint["blank"]:
+            redundant[page_num] = {"page_num": page_num, "skip_reason": "blank"}
+            continue
+
+        if not fingerprint["has_text"]:
+            first_page_num = seen_pixels.setdefault(fingerprint["pixel_hash"], page_num)
+            if first_page_num != page_num:
+                redundant[page_num] = {
+                    "page_num": page_num,
+                    "skip_reason": "duplicate",
+                    "duplicate_of": first_page_num,
+                }
+            continue
+
+        candidates = seen.setdefault(fingerprint["text_hash"], [])
+        for image_hash, first_page_num in candidates:
+            distance = (image_hash ^ fingerprint["image_hash"]).bit_count()
+            if distance <= PAGE_DUPLICATE_MAX_DISTANCE:
+                redundant[page_num] = {
+                    "page_num": page_num,
+                    "skip_reason": "duplicate",
+                    "duplicate_of": first_page_num,
+                }
+                break
+        else:
+            candidates.append((fingerprint["image_hash"], page_num))
+
+    if redundant:
+        logger.info(f"Skipping redundant pages: {list(redundant.values())}")
+    return redundant
+
+
+def _mark_duplicates(page: Dict[str, Any], redundant: Dict[int, Dict]):
+    """
+    Record on a rendered page which later pages duplicate it.
+    """
+    duplicate_pages = [
+        placeholder["page_num"]
+        for placeholder in redundant.values()
+        if placeholder.get("duplicate_of") == page["page_num"]
+    ]
+    if duplicate_pages:
+        page["duplicate_pages"] = duplicate_pages
+
+
+def _new_extract_pool(max_workers: int) -> ProcessPoolExecutor:
+    # Forking a process that runs an event loop and HTTP clients is unsafe, so
+    # workers are always spawned
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def get_extract_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Return the process-wide page extraction pool, creating it on first use.
+    None if `PDF_EXTRACT_WORKERS` disables the pool.
+    """
+    global _extract_pool
+    if PDF_EXTRACT_WORKERS <= 0:
+        return None
+    if _extract_pool is None:
+        _extract_pool = _new_extract_pool(PDF_EXTRACT_WORKERS)
+    return _extract_pool
+
+
+def shutdown_extract_pool():
+    global _extract_pool
+    if _extract_pool is not None:
+        _extract_pool.shutdown(wait=True, cancel_futures=True)
+        _extract_pool = None
+
+
 async def extract_page_data(
     document: pymupdf.Document,
+    image_policy: PageImagePolicy = PAGE_IMAGE_POLICY,
+    skip_redundant_pages: bool = PDF_SKIP_REDUNDANT_PAGES,
 ) -> List[Dict[str, str]]:
     """
     Extract text and images from each page of the document.
 
     Args:
         document: A pymupdf.Document object
+        image_policy: How page images are rendered and encoded
+        skip_redundant_pages: Whether blank and duplicate pages are replaced
+            by placeholders instead of being rendered, see
+            `find_redundant_pages`
 
     Returns:
         A list of dictionaries containing text and image for each page
@@ -196,38 +527,188 @@ async def extract_page_data(
     logger.info(f"Extracting data from {len(document)} pages")
     page_data = []
 
+    redundant = {}
+    if skip_redundant_pages:
+        redundant = find_redundant_pages([page_fingerprint(page) for page in document])
+
     for page_num in range(len(document)):
+        if page_num + 1 in redundant:
+            page_data.append(redundant[page_num + 1])
+            continue
+
         logger.info(f"Processing page {page_num + 1}")
         page = document[page_num]
-
-        # Extract text
-        text = page.get_text()
-
-        # Extract image
-        pix = page.get_pixmap(alpha=False)
-        img_bytes = pix.tobytes("jpeg")
-        img_base64 = base64.b64encode(img_bytes).decode("utf-8")
-
-        page_data.append(
-            {
-                "page_num": page_num + 1,  # 1-indexed
-                "text": text,
-                "image_base64": img_base64,
-            }
-        )
+        page_data.append(_render_page(page, image_policy))
+        _mark_duplicates(page_data[-1], redundant)
         logger.info(
-            f"Extracted {len(text)} chars of text and image from page {page_num + 1}"
+            f"Extracted {len(page_data[-1]['text'])} chars of text and image "
+            f"from page {page_num + 1}"
         )
 
     logger.info(f"Completed extraction of {len(page_data)} pages")
     return page_data
 
 
+async def _call(function, *args):
+    return function(*args)
+
+
+async def iter_page_data(
+    pdf_bytes: bytes,
+    max_workers: Optional[int] = None,
+    batch_size: int = PDF_EXTRACT_BATCH_SIZE,
+    image_policy: PageImagePolicy = PAGE_IMAGE_POLICY,
+    skip_redundant_pages: bool = PDF_SKIP_REDUNDANT_PAGES,
+    skip_pages: Optional[Set[int]] = None,
+) -> AsyncIterator[Dict[str, str]]:
+    """
+    Extract text and images from each page of a PDF in a pool of worker
+    processes, yielding pages in order as they become available. With no
+    workers, pages are extracted in the event loop instead.
+
+    Pages are rendered in batches of `batch_size`, and at most two batches per
+    worker are in flight at a time so rendered pages don't pile up when the
+    consumer is slower than the workers.
+
+    Args:
+        pdf_bytes: Raw binary data of the PDF document
+        max_workers: Number of worker processes. Uses the shared pool sized by
+            `PDF_EXTRACT_WORKERS` if not provided, 0 extracts pages in the
+            event loop.
+        batch_size: Number of pages rendered per worker task
+        image_policy: How page images are rendered and encoded
+        skip_redundant_pages: Whether blank and duplicate pages are replaced
+            by placeholders instead of being rendered, see
+            `find_redundant_pages`
+        skip_pages: Numbers of pages that are neither rendered nor yielded,
+            e.g. because they were already processed
+
+    Yields:
+        Dictionaries containing text and image for each page
+    """
+    if skip_pages is None:
+        skip_pages = set()
+
+    loop = asyncio.get_running_loop()
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(pdf_bytes)
+        pdf_file.flush()
+
+        with pymupdf.open(pdf_file.name) as document:
+            page_count = len(document)
+        report_page_count(page_count)
+
+        if max_workers is None:
+            pool = get_extract_pool()
+            workers = PDF_EXTRACT_WORKERS
+        elif max_workers > 0:
+            pool = _new_extract_pool(max_workers)
+            workers = max_workers
+        else:
+            pool = None
+        if pool is None:
+            logger.info(f"Extracting data from {page_count} pages in the event loop")
+            workers = 1
+        else:
+            logger.info(
+                f"Extracting data from {page_count} pages in worker processes"
+            )
+
+        def submit(function, *args) -> asyncio.Future:
+            if pool is None:
+                return asyncio.ensure_future(_call(function, *args))
+            return loop.run_in_executor(pool, function, *args)
+
+        pending = []
+        try:
+            redundant = {}
+            if skip_redundant_pages:
+                # Fingerprinting renders small thumbnails, so the whole
+                # document is checked upfront in large batches
+                fingerprint_batch_size = max(1, -(-page_count // workers))
+                fingerprint_batches = await asyncio.gather(
+                    *[
+                        submit(
+                            _fingerprint_page_range,
+                            pdf_file.name,
+                            start,
+                            min(start + fingerprint_batch_size, page_count),
+                        )
+                        for start in range(0, page_count, fingerprint_batch_size)
+                    ]
+                )
+                redundant = find_redundant_pages(
+                    [
+                        fingerprint
+                        for batch in fingerprint_batches
+                        for fingerprint in batch
+                    ]
+                )
+
+            page_indexes = [
+                page_index
+                for page_index in range(page_count)
+                if page_index + 1 not in redundant
+                and page_index + 1 not in skip_pages
+            ]
+            batches = [
+                page_indexes[start : start + batch_size]
+                for start in range(0, len(page_indexes), batch_size)
+            ]
+            # Placeholders of redundant pages are yielded in page order with
+            # the rendered pages
+            placeholders = sorted(
+                (
+                    page
+                    for page in redundant.values()
+                    if page["page_num"] not in skip_pages
+                ),
+                key=lambda page: page["page_num"],
+            )
+
+            def ordered(pages):
+                for page in pages:
+                    while (
+                        placeholders
+                        and placeholders[0]["page_num"] < page["page_num"]
+                    ):
+                        yield placeholders.pop(0)
+                    _mark_duplicates(page, redundant)
+                    yield page
+
+            for batch in batches:
+                pending.append(
+                    submit(_extract_pages, pdf_file.name, batch, image_policy)
+                )
+                if len(pending) < workers * 2:
+                    continue
+                for page in ordered(await pending.pop(0)):
+                    report_pages("extracted")
+                    yield page
+
+            while pending:
+                for page in ordered(await pending.pop(0)):
+                    report_pages("extracted")
+                    yield page
+            for page in placeholders:
+                report_pages("extracted")
+                yield page
+        finally:
+            for future in pending:
+                future.cancel()
+            if max_workers is not None and pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    logger.info(f"Completed extraction of {page_count} pages")
+
+
 async def analyze_page_with_openai(
     client: AsyncOpenAI,
     page_num: int,
     page_text: str,
     image_base64: str,
+    image_detail: str = "auto",
 ) -> List[DocumentBlock]:
     """
     Analyze a single page with OpenAI asynchronously.
@@ -237,6 +718,7 @@ async def analyze_page_with_openai(
         page_num: Page number
         page_text: Text content of the page
         image_base64: Base64 encoded image data for the page
+        image_detail: Detail level the image is processed at by the model
 
     Returns:
         List of DocumentBlock objects for the page
@@ -264,7 +746,7 @@ async def analyze_page_with_openai(
                     "type": "image_url",
                     "image_url": {
                         "url": f"data:image/jpeg;base64,{image_base64}",
-                        "detail": "auto",
+                        "detail": image_detail,
                     },
                 },
             ],
@@ -273,10 +755,16 @@ async def analyze_page_with_openai(
 
     page_blocks = []
     try:
-        response = await client.beta.chat.completions.parse(
-            model="gpt-4.1-mini-2025-04-14",
-            messages=messages,
-            response_format=AIDocumentParseResponseSchema,
+        response = await openai_scheduler.run(
+            PAGE_ANALYSIS_MODEL,
+            lambda: client.beta.chat.completions.parse(
+                model=PAGE_ANALYSIS_MODEL,
+                messages=messages,
+                response_format=AIDocumentParseResponseSchema,
+            ),
+            # The response is about as long as the page text
+            estimated_tokens=estimate_message_tokens(messages)
+            + estimate_tokens(page_text),
         )
 
         response_message = response.choices[0].message
@@ -308,37 +796,188 @@ async def analyze_page_with_openai(
     return page_blocks
 
 
+async def analyze_page(
+    client: AsyncOpenAI,
+    page_num: int,
+    page_text: str,
+    image_base64: Optional[str],
+    image_detail: str = "auto",
+    local_blocks: Optional[List[Dict[str, str]]] = None,
+    page_report: Optional[Dict[str, Any]] = None,
+) -> List[DocumentBlock]:
+    """
+    Analyze a single page. Pages with locally extracted blocks skip the model
+    entirely, and the blocks from an earlier analysis of an identical page
+    (same text and image) are reused when available.
+
+    Args:
+        client: AsyncOpenAI client instance
+        page_num: Page number
+        page_text: Text content of the page
+        image_base64: Base64 encoded image data for the page, None for pages
+            with local blocks, which aren't rendered
+        image_detail: Detail level the image is processed at by the model
+        local_blocks: Blocks extracted from the text layer, if the page is
+            simple enough
+        page_report: If provided, its "analysis_path" is set to how the page
+            was analyzed ("local", "cache" or "llm")
+
+    Returns:
+        List of DocumentBlock objects for the page
+    """
+    if page_report is None:
+        page_report = {}
+
+    if local_blocks is not None:
+        logger.info(f"Using text layer blocks for page {page_num}")
+        page_report["analysis_path"] = "local"
+        return [
+            DocumentBlock(
+                type=block["type"],
+                page_num=page_num,
+                content=block["content"],
+                semantic_content=block["content"],
+            )
+            for block in local_blocks
+        ]
+
+    key = page_cache_key(
+        "blocks",
+        PAGE_ANALYSIS_MODEL,
+        PAGE_ANALYSIS_PROMPT_VERSION,
+        page_text,
+        image_base64,
+        image_detail,
+    )
+    # The cache is in Postgres, keep its queries off the event loop
+    cached_blocks = await asyncio.to_thread(page_analysis_cache.get, key)
+    if cached_blocks is not None:
+        logger.info(f"Using cached analysis for page {page_num}")
+        page_report["analysis_path"] = "cache"
+        return [DocumentBlock(page_num=page_num, **block) for block in cached_blocks]
+
+    page_report["analysis_path"] = "llm"
+    if "estimated_tokens" in page_report:
+        logger.info(
+            f"Page {page_num} image: {page_report['bytes']} bytes, "
+            f"~{page_report['estimated_tokens']} tokens, detail {image_detail}"
+        )
+    page_blocks = await analyze_page_with_openai(
+        client=client,
+        page_num=page_num,
+        page_text=page_text,
+        image_base64=image_base64,
+        image_detail=image_detail,
+    )
+
+    # Empty results are also returned on refusals and API errors, don't cache
+    # those
+    if page_blocks:
+        await asyncio.to_thread(
+            page_analysis_cache.put,
+            key,
+            [
+                block.model_dump(mode="json", exclude={"page_num"})
+                for block in page_blocks
+            ],
+        )
+    return page_blocks
+
+
+def new_page_report(page: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Start the report of how an extracted page was processed, from the
+    statistics of its rendered image. Redundant pages are reported with their
+    skip reason as analysis path.
+    """
+    if "skip_reason" in page:
+        page_report = {
+            "page_num": page["page_num"],
+            "analysis_path": page["skip_reason"],
+        }
+        if "duplicate_of" in page:
+            page_report["duplicate_of"] = page["duplicate_of"]
+        return page_report
+    return {"page_num": page["page_num"], **page.get("image_stats", {})}
+
+
+def annotate_duplicate_pages(
+    chunks: List[DocumentChunk], duplicate_pages: Dict[int, List[int]]
+):
+    """
+    Record on chunks which skipped pages duplicate the page they come from.
+
+    Args:
+        chunks: DocumentChunk objects to annotate
+        duplicate_pages: Mapping of page number to the pages duplicating it
+    """
+    for chunk in chunks:
+        page_num = chunk.metadata.get("page_num")
+        if page_num is None and chunk.blocks:
+            page_num = chunk.blocks[0].page_num
+        if page_num in duplicate_pages:
+            chunk.metadata["duplicate_pages"] = duplicate_pages[page_num]
+
+
+def summarize_page_reports(page_reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Aggregate page reports into document statistics: how many pages took each
+    analysis path, and the image bytes and estimated image tokens actually
+    sent to the model.
+    """
+    page_reports = sorted(page_reports, key=lambda report: report["page_num"])
+    sent = [report for report in page_reports if report.get("analysis_path") == "llm"]
+    return {
+        "analysis_paths": dict(
+            Counter(report.get("analysis_path") for report in page_reports)
+        ),
+        "image_bytes_sent": sum(report.get("bytes", 0) for report in sent),
+        "image_tokens_sent": sum(
+            report.get("estimated_tokens", 0) for report in sent
+        ),
+        "pages": page_reports,
+    }
+
+
 async def analyze_with_openai(
     page_data: List[Dict[str, str]],
-    max_concurrency: int = 10,
+    page_reports: Optional[List[Dict[str, Any]]] = None,
 ) -> List[DocumentBlock]:
     """
-    Use OpenAI's model to analyze the document and identify blocks.
+    Use OpenAI's model to analyze the document and identify blocks. Requests
+    are queued by the shared OpenAI scheduler, which bounds concurrency across
+    all documents being parsed.
 
     Args:
         page_data: List of dictionaries containing text and images for each page
+        page_reports: If provided, a report of how each page was processed is
+            appended to it
 
     Returns:
         List of DocumentBlock objects
     """
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = get_openai_client()
 
     all_blocks = []
 
-    # Process pages in batches to control concurrency
-    semaphore = asyncio.Semaphore(max_concurrency)
-
-    async def process_page_with_semaphore(page):
-        async with semaphore:
-            return await analyze_page_with_openai(
-                client=client,
-                page_num=page["page_num"],
-                page_text=page["text"],
-                image_base64=page["image_base64"],
-            )
+    async def process_page(page):
+        page_report = new_page_report(page)
+        if page_reports is not None:
+            page_reports.append(page_report)
+        if "skip_reason" in page:
+            return []
+        return await analyze_page(
+            client=client,
+            page_num=page["page_num"],
+            page_text=page["text"],
+            image_base64=page.get("image_base64"),
+            image_detail=page.get("image_detail", "auto"),
+            local_blocks=page.get("local_blocks"),
+            page_report=page_report,
+        )
 
     # Create tasks for all pages
-    tasks = [process_page_with_semaphore(page) for page in page_data]
+    tasks = [process_page(page) for page in page_data]
 
     # Gather results
     results = await asyncio.gather(*tasks)
@@ -353,12 +992,119 @@ async def analyze_with_openai(
     return all_blocks
 
 
+async def create_page_chunk(
+    client: AsyncOpenAI,
+    page_num: int,
+    page_blocks: List[DocumentBlock],
+) -> DocumentChunk:
+    """
+    Create a single chunk from the blocks of a page, generating an
+    embedding-optimized description of the page content.
+
+    Args:
+        client: AsyncOpenAI client instance
+        page_num: Page number
+        page_blocks: DocumentBlock objects of the page
+
+    Returns:
+        A DocumentChunk for the page
+    """
+    logger.info(f"Creating chunk for page {page_num} with {len(page_blocks)} blocks")
+    # Combine all text content
+    content = "\n".join([block.content for block in page_blocks if block.content])
+
+    key = page_cache_key(
+        "description", PAGE_ANALYSIS_MODEL, PAGE_ANALYSIS_PROMPT_VERSION, content
+    )
+    embed_text = await asyncio.to_thread(page_analysis_cache.get, key)
+    if embed_text is not None:
+        logger.info(f"Using cached embedding text for page {page_num}")
+    else:
+        prompt = """
+        Create a detailed semantic description of this page content
+        optimized for vector embedding and semantic search. Include key
+        concepts, entities, relationships, and main ideas. Be
+        comprehensive but focused.
+        """
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": content},
+        ]
+        response = await openai_scheduler.run(
+            PAGE_ANALYSIS_MODEL,
+            lambda: client.chat.completions.create(
+                model=PAGE_ANALYSIS_MODEL,
+                messages=messages,
+                temperature=0,
+                max_tokens=1024,
+            ),
+            estimated_tokens=estimate_message_tokens(messages) + 1024,
+        )
+
+        embed_text = response.choices[0].message.content
+        await asyncio.to_thread(page_analysis_cache.put, key, embed_text)
+        logger.info(f"Generated embedding text for page {page_num}")
+    return DocumentChunk(
+        content=content,
+        embed=embed_text,
+        blocks=page_blocks,
+        metadata={"type": "page", "page_num": page_num},
+    )
+
+
+def create_block_chunks(blocks: List[DocumentBlock]) -> List[DocumentChunk]:
+    """
+    Create one chunk per block, using the block's semantic content for
+    embedding.
+    """
+    return [
+        DocumentChunk(
+            content=block.content,
+            embed=block.semantic_content,
+            blocks=[block],
+            metadata={
+                "type": "block",
+            },
+        )
+        for block in blocks
+    ]
+
+
+async def create_page_chunks(
+    client: AsyncOpenAI,
+    page_num: int,
+    blocks: List[DocumentBlock],
+    chunking_mode: Literal["page", "block"] = "page",
+    duplicate_pages: Optional[List[int]] = None,
+) -> List[DocumentChunk]:
+    """
+    Turn the blocks of a single page into chunks.
+
+    Args:
+        client: AsyncOpenAI client instance
+        page_num: Page number
+        blocks: DocumentBlock objects of the page
+        chunking_mode: Chunking strategy to use
+        duplicate_pages: Skipped pages duplicating this one
+
+    Returns:
+        List of DocumentChunk objects for the page
+    """
+    if chunking_mode == "page":
+        chunks = [await create_page_chunk(client, page_num, blocks)]
+    else:
+        chunks = create_block_chunks(blocks)
+
+    if duplicate_pages:
+        annotate_duplicate_pages(chunks, {page_num: duplicate_pages})
+    return chunks
+
+
 async def create_chunks_from_blocks(
     blocks: List[DocumentBlock],
     mode: Literal[
         "page", "block"
     ] = "page",  # HOMEWORK: Extend this to support other chunking strategies
-    max_concurrency: int = 10,
 ) -> List[DocumentChunk]:
     """
     Organize blocks into chunks by grouping blocks from the same page and
@@ -367,14 +1113,13 @@ async def create_chunks_from_blocks(
     Args:
         blocks: List of DocumentBlock objects
         mode: Chunking strategy to use
-        max_concurrency: Maximum number of concurrent API calls
 
     Returns:
         List of DocumentChunk objects
     """
     logger.info(f"Creating chunks from {len(blocks)} blocks")
 
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = get_openai_client()
 
     if mode == "page":
         # Group blocks by page
@@ -385,101 +1130,251 @@ async def create_chunks_from_blocks(
                 pages[page_num] = []
             pages[page_num].append(block)
 
-        # Create a chunk for each page
-        chunks = []
-
-        # Process pages in parallel with controlled concurrency
-        semaphore = asyncio.Semaphore(max_concurrency)
-
-        async def process_page(page_num, page_blocks):
-            async with semaphore:
-                logger.info(
-                    f"Creating chunk for page {page_num} with "
-                    f"{len(page_blocks)} blocks"
-                )
-                # Combine all text content
-                content = "\n".join(
-                    [block.content for block in page_blocks if block.content]
-                )
-
-                prompt = """
-                Create a detailed semantic description of this page content
-                optimized for vector embedding and semantic search. Include key
-                concepts, entities, relationships, and main ideas. Be
-                comprehensive but focused.
-                """
-                response = await client.chat.completions.create(
-                    model="gpt-4.1-mini-2025-04-14",
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": content},
-                    ],
-                    temperature=0,
-                    max_tokens=1024,
-                )
-
-                embed_text = response.choices[0].message.content
-                logger.info(f"Generated embedding text for page {page_num}")
-                return DocumentChunk(
-                    content=content,
-                    embed=embed_text,
-                    blocks=page_blocks,
-                    metadata={"type": "page", "page_num": page_num},
-                )
-
-        # Create tasks for all pages
+        # Process pages in parallel, the OpenAI scheduler controls concurrency
         tasks = [
-            process_page(page_num, page_blocks)
+            create_page_chunk(client, page_num, page_blocks)
             for page_num, page_blocks in pages.items()
         ]
 
         # Gather results
         chunks = await asyncio.gather(*tasks)
     else:
-        chunks = [
-            DocumentChunk(
-                content=block.content,
-                embed=block.semantic_content,
-                blocks=[block],
-                metadata={
-                    "type": "block",
-                },
-            )
-            for block in blocks
-        ]
+        chunks = create_block_chunks(blocks)
 
     logger.info(f"Created {len(chunks)} chunks")
     return chunks
 
 
 async def parse_pdf(
-    pdf_bytes: bytes, chunking_mode: Literal["page", "block"] = "page"
+    pdf_bytes: bytes,
+    chunking_mode: Literal["page", "block"] = "page",
+    extract_workers: int = PDF_EXTRACT_WORKERS,
+    image_policy: PageImagePolicy = PAGE_IMAGE_POLICY,
 ) -> ParsedDocument:
     """
     Parse a PDF document into structured content asynchronously.
 
     Args:
         pdf_bytes: The raw PDF bytes to parse
+        chunking_mode: Chunking strategy to use
+        extract_workers: Number of processes used to rasterize pages. 0
+            extracts pages in the event loop instead.
+        image_policy: How page images sent to the model are rendered
 
     Returns:
         A ParsedDocument containing the hierarchical structure of document content
     """
     logger.info("Starting async PDF parsing process")
     try:
-        # Load the document from bytes
-        document = await load_pdf(pdf_bytes)
-
         # Extract text and images from each page
-        page_data = await extract_page_data(document)
+        if extract_workers > 0:
+            page_data = [
+                page
+                async for page in iter_page_data(
+                    pdf_bytes,
+                    max_workers=(
+                        None
+                        if extract_workers == PDF_EXTRACT_WORKERS
+                        else extract_workers
+                    ),
+                    image_policy=image_policy,
+                )
+            ]
+        else:
+            document = await load_pdf(pdf_bytes)
+            page_data = await extract_page_data(document, image_policy)
 
         # Use OpenAI to analyze the content and identify blocks asynchronously
-        blocks = await analyze_with_openai(page_data)
+        page_reports = []
+        blocks = await analyze_with_openai(page_data, page_reports=page_reports)
 
         # Organize blocks into chunks
         chunks = await create_chunks_from_blocks(blocks, mode=chunking_mode)
+        annotate_duplicate_pages(
+            chunks,
+            {
+                page["page_num"]: page["duplicate_pages"]
+                for page in page_data
+                if "duplicate_pages" in page
+            },
+        )
 
-        logger.info("Async PDF parsing completed successfully")
-        return ParsedDocument(chunks=chunks)
+        stats = summarize_page_reports(page_reports)
+        logger.info(
+            "Async PDF parsing completed successfully. Stats: "
+            f"{_format_stats(stats)}. "
+            f"Page analysis cache: {page_analysis_cache.stats()}"
+        )
+        return ParsedDocument(chunks=chunks, stats=stats)
     except Exception as e:
         logger.error(f"Async PDF parsing failed: {str(e)}")
         raise
+
+
+def _format_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    # Per-page reports are too verbose for logs
+    return {key: value for key, value in stats.items() if key != "pages"}
+
+
+# Awaited with the page report, the blocks and the pages duplicating the page
+PageAnalyzedCallback = Callable[
+    [Dict[str, Any], List[DocumentBlock], List[int]], Awaitable[None]
+]
+
+
+async def parse_pdf_page(
+    client: AsyncOpenAI,
+    page: Dict[str, str],
+    chunking_mode: Literal["page", "block"] = "page",
+    page_reports: Optional[List[Dict[str, Any]]] = None,
+    on_page_analyzed: Optional[PageAnalyzedCallback] = None,
+) -> List[DocumentChunk]:
+    """
+    Analyze a single extracted page and turn its blocks into chunks.
+
+    The page text and image are popped from `page` so the rendered image can
+    be released as soon as the analysis call returns. Placeholders of blank
+    and duplicate pages produce no chunks. If provided, `on_page_analyzed` is
+    awaited with the page report, the blocks and the duplicate pages once the
+    page is analyzed, before its chunks are created.
+    """
+    page_num = page["page_num"]
+    page_report = new_page_report(page)
+    if page_reports is not None:
+        page_reports.append(page_report)
+    if "skip_reason" in page:
+        report_pages("analyzed")
+        return []
+
+    blocks = await analyze_page(
+        client=client,
+        page_num=page_num,
+        page_text=page.pop("text"),
+        image_base64=page.pop("image_base64", None),
+        image_detail=page.get("image_detail", "auto"),
+        local_blocks=page.get("local_blocks"),
+        page_report=page_report,
+    )
+    report_pages("analyzed")
+    if on_page_analyzed is not None:
+        await on_page_analyzed(page_report, blocks, page.get("duplicate_pages", []))
+
+    return await create_page_chunks(
+        client, page_num, blocks, chunking_mode, page.get("duplicate_pages")
+    )
+
+
+async def iter_parse_pdf_pages(
+    pdf_bytes: bytes,
+    chunking_mode: Literal["page", "block"] = "page",
+    max_inflight: int = PARSE_MAX_INFLIGHT_PAGES,
+    stats: Optional[Dict[str, Any]] = None,
+    image_policy: PageImagePolicy = PAGE_IMAGE_POLICY,
+    skip_pages: Optional[Set[int]] = None,
+    on_page_analyzed: Optional[PageAnalyzedCallback] = None,
+    extract_workers: int = PDF_EXTRACT_WORKERS,
+) -> AsyncIterator[Tuple[Dict[str, Any], List[DocumentChunk]]]:
+    """
+    Parse a PDF document page by page, yielding the chunks of each page as
+    soon as it has been analyzed.
+
+    Unlike `parse_pdf`, pages are rasterized, analyzed and chunked as a
+    pipeline: at most `max_inflight` pages are being processed at once, so
+    memory stays flat with page count and consumers can store the first
+    chunks while the rest of the document is still being parsed. Pages are
+    yielded in completion order, not page order.
+
+    Args:
+        pdf_bytes: The raw PDF bytes to parse
+        chunking_mode: Chunking strategy to use
+        max_inflight: Maximum number of pages processed concurrently
+        stats: If provided, filled with the same statistics as
+            `ParsedDocument.stats` once the document is parsed
+        image_policy: How page images sent to the model are rendered
+        skip_pages: Numbers of pages left out, e.g. because they were already
+            parsed. They are missing from the statistics too.
+        on_page_analyzed: Awaited once each page is analyzed, see
+            `parse_pdf_page`
+        extract_workers: Number of processes used to rasterize pages. 0
+            extracts pages in the event loop instead.
+
+    Yields:
+        The report of each page, see `new_page_report`, with its chunks.
+        Blank and duplicate pages have no chunks.
+    """
+    logger.info("Starting streaming PDF parsing process")
+    client = get_openai_client()
+    page_reports = []
+
+    async def parse_page(page):
+        reports = []
+        chunks = await parse_pdf_page(
+            client, page, chunking_mode, reports, on_page_analyzed
+        )
+        page_reports.extend(reports)
+        return reports[0], chunks
+
+    pending = set()
+    try:
+        async for page in iter_page_data(
+            pdf_bytes,
+            # The shared pool unless another worker count is asked for
+            max_workers=(
+                None if extract_workers == PDF_EXTRACT_WORKERS else extract_workers
+            ),
+            image_policy=image_policy,
+            skip_pages=skip_pages,
+        ):
+            # Wait for a free slot before accepting another rendered page
+            while len(pending) >= max_inflight:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+
+            pending.add(asyncio.create_task(parse_page(page)))
+
+        for task in asyncio.as_completed(pending):
+            yield await task
+        pending = set()
+
+        if stats is None:
+            stats = {}
+        stats.update(summarize_page_reports(page_reports))
+        logger.info(
+            "Streaming PDF parsing completed successfully. Stats: "
+            f"{_format_stats(stats)}. "
+            f"Page analysis cache: {page_analysis_cache.stats()}"
+        )
+    except Exception as e:
+        logger.error(f"Streaming PDF parsing failed: {str(e)}")
+        raise
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def iter_parse_pdf(
+    pdf_bytes: bytes,
+    chunking_mode: Literal["page", "block"] = "page",
+    max_inflight: int = PARSE_MAX_INFLIGHT_PAGES,
+    stats: Optional[Dict[str, Any]] = None,
+    image_policy: PageImagePolicy = PAGE_IMAGE_POLICY,
+) -> AsyncIterator[DocumentChunk]:
+    """
+    Parse a PDF document into chunks, yielding each chunk as soon as its page
+    has been analyzed. See `iter_parse_pdf_pages`.
+
+    Yields:
+        DocumentChunk objects
+    """
+    async for _, chunks in iter_parse_pdf_pages(
+        pdf_bytes,
+        chunking_mode,
+        max_inflight=max_inflight,
+        stats=stats,
+        image_policy=image_policy,
+    ):
+        for chunk in chunks:
+            yield chunk
@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import logging
+import uuid
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from sqlalchemy import func, insert, literal, select
+
+from backend.database import SessionLocal
+from backend.document_parser import (
+    DocumentBlock,
+    DocumentChunk,
+    ParsedDocument,
+    annotate_duplicate_pages,
+    create_chunks_from_blocks,
+    parse_pdf,
+)
+from backend.models import (
+    ParsedDocumentVersion,
+    StoredDocumentBlock,
+    StoredDocumentChunk,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def file_version(content: bytes) -> str:
+    """
+    Identify a version of a file by the hash of its content.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def chunk_page_num(chunk: DocumentChunk) -> int:
+    page_num = chunk.metadata.get("page_num")
+    if page_num is None and chunk.blocks:
+        page_num = chunk.blocks[0].page_num
+    return page_num or 0
+
+
+def _block_key(block: DocumentBlock) -> Tuple:
+    return (block.page_num, block.type.value, block.content, block.semantic_content)
+
+
+def save_parsed_document(
+    file_id: uuid.UUID,
+    version: str,
+    chunking_mode: str,
+    parsed_document: ParsedDocument,
+):
+    """
+    Store the blocks and chunks of a parsed file version. Blocks are stored
+    once per version, chunks once per version and chunking mode. Saving
+    chunks made from other blocks than the stored ones replaces the blocks,
+    and drops the chunks of the other modes.
+
+    Args:
+        file_id: ID of the file
+        version: Version of the file, see `file_version`
+        chunking_mode: Chunking strategy the chunks were created with
+        parsed_document: The parsed file
+    """
+    # Chunks may come in completion order from the streaming parser
+    chunks = sorted(parsed_document.chunks, key=chunk_page_num)
+    # Every block belongs to a single chunk, so this is the document's blocks
+    # in order. Blocks are positioned by that order rather than by content,
+    # identical blocks such as repeated headers or table cells are kept apart.
+    blocks = [block for chunk in chunks for block in chunk.blocks]
+
+    db = SessionLocal()
+    try:
+        stored_blocks = (
+            db.query(StoredDocumentBlock)
+            .filter(
+                StoredDocumentBlock.file_id == file_id,
+                StoredDocumentBlock.version == version,
+            )
+            .order_by(StoredDocumentBlock.position)
+            .all()
+        )
+        stored_keys = [
+            (block.page_num, block.type, block.content, block.semantic_content)
+            for block in stored_blocks
+        ]
+        if stored_keys != [_block_key(block) for block in blocks]:
+            # Chunks of other modes point at the positions of the blocks they
+            # were made from, they go with them
+            for model in (StoredDocumentChunk, StoredDocumentBlock):
+                db.query(model).filter(
+                    model.file_id == file_id, model.version == version
+                ).delete(synchronize_session=False)
+            for position, block in enumerate(blocks):
+                db.add(
+                    StoredDocumentBlock(
+                        file_id=file_id,
+                        version=version,
+                        position=position,
+                        page_num=block.page_num,
+                        type=block.type.value,
+                        content=block.content,
+                        semantic_content=block.semantic_content,
+                    )
+                )
+
+        db.query(StoredDocumentChunk).filter(
+            StoredDocumentChunk.file_id == file_id,
+            StoredDocumentChunk.version == version,
+            StoredDocumentChunk.chunking_mode == chunking_mode,
+        ).delete(synchronize_session=False)
+        block_position = 0
+        for position, chunk in enumerate(chunks):
+            db.add(
+                StoredDocumentChunk(
+                    file_id=file_id,
+                    version=version,
+                    chunking_mode=chunking_mode,
+                    position=position,
+                    content=chunk.content,
+                    embed=chunk.embed,
+                    block_positions=list(
+                        range(block_position, block_position + len(chunk.blocks))
+                    ),
+                    chunk_metadata=chunk.metadata,
+                )
+            )
+            block_position += len(chunk.blocks)
+
+        db.merge(
+            ParsedDocumentVersion(
+                file_id=file_id, version=version, stats=parsed_document.stats
+            )
+        )
+        db.commit()
+        logger.info(
+            f"Stored {len(chunks)} {chunking_mode} chunks of file {file_id} "
+            f"version {version[:12]}"
+        )
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def load_blocks(
+    file_id: uuid.UUID, version: str
+) -> Optional[Tuple[List[DocumentBlock], Dict[str, Any]]]:
+    """
+    Load the stored blocks of a file version.
+
+    Returns:
+        The blocks in document order and the parsing statistics, or None if
+        the version was never parsed
+    """
+    db = SessionLocal()
+    try:
+        parsed_version = db.get(ParsedDocumentVersion, (file_id, version))
+        if parsed_version is None:
+            return None
+
+        stored_blocks = (
+            db.query(StoredDocumentBlock)
+            .filter(
+                StoredDocumentBlock.file_id == file_id,
+                StoredDocumentBlock.version == version,
+            )
+            .order_by(StoredDocumentBlock.position)
+            .all()
+        )
+        blocks = [
+            DocumentBlock(
+                type=block.type,
+                page_num=block.page_num,
+                content=block.content,
+                semantic_content=block.semantic_content,
+            )
+            for block in stored_blocks
+        ]
+        return blocks, parsed_version.stats
+    finally:
+        db.close()
+
+
+def load_parsed_document(
+    file_id: uuid.UUID, version: str, chunking_mode: str
+) -> Optional[ParsedDocument]:
+    """
+    Load the stored chunks of a file version for a chunking mode.
+
+    Returns:
+        The parsed document, or None if it isn't stored
+    """
+    loaded = load_blocks(file_id, version)
+    if loaded is None:
+        return None
+    blocks, stats = loaded
+
+    db = SessionLocal()
+    try:
+        stored_chunks = (
+            db.query(StoredDocumentChunk)
+            .filter(
+                StoredDocumentChunk.file_id == file_id,
+                StoredDocumentChunk.version == version,
+                StoredDocumentChunk.chunking_mode == chunking_mode,
+            )
+            .order_by(StoredDocumentChunk.position)
+            .all()
+        )
+    finally:
+        db.close()
+
+    # A version without any chunk in this mode was only chunked in others
+    if not stored_chunks and blocks:
+        return None
+
+    chunks = [
+        DocumentChunk(
+            content=chunk.content,
+            embed=chunk.embed,
+            blocks=[blocks[position] for position in chunk.block_positions],
+            metadata=chunk.chunk_metadata,
+        )
+        for chunk in stored_chunks
+    ]
+    return ParsedDocument(chunks=chunks, stats=stats)
+
+
+def copy_parsed_document(source_file_id: uuid.UUID, file_id: uuid.UUID, version: str):
+    """
+    Store the blocks and chunks of another file's version for a file with the
+    same content, so it is served without parsing it again.
+
+    Args:
+        source_file_id: ID of the file the version was parsed for
+        file_id: ID of the file to store it for
+        version: Version of both files, see `file_version`
+    """
+    db = SessionLocal()
+    try:
+        parsed_version = db.get(ParsedDocumentVersion, (source_file_id, version))
+        if parsed_version is None:
+            return
+
+        for model in (StoredDocumentBlock, StoredDocumentChunk):
+            db.query(model).filter(
+                model.file_id == file_id, model.version == version
+            ).delete(synchronize_session=False)
+            columns = [
+                column.name
+                for column in model.__table__.columns
+                if column.name not in ("id", "file_id")
+            ]
+            db.execute(
+                insert(model).from_select(
+                    ["id", "file_id", *columns],
+                    select(
+                        func.gen_random_uuid(),
+                        literal(file_id, model.file_id.type),
+                        *(model.__table__.c[column] for column in columns),
+                    ).where(model.file_id == source_file_id, model.version == version),
+                )
+            )
+        db.merge(
+            ParsedDocumentVersion(
+                file_id=file_id, version=version, stats=parsed_version.stats
+            )
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _duplicate_pages(stats: Dict[str, Any]) -> Dict[int, List[int]]:
+    """
+    Rebuild the mapping of page number to the pages duplicating it from the
+    page reports.
+    """
+    duplicate_pages = {}
+    for report in stats.get("pages", []):
+        if "duplicate_of" in report:
+            duplicate_pages.setdefault(report["duplicate_of"], []).append(
+                report["page_num"]
+            )
+    return duplicate_pages
+
+
+async def load_or_parse_document(
+    file_id: uuid.UUID,
+    pdf_bytes: bytes,
+    chunking_mode: Literal["page", "block"] = "page",
+) -> ParsedDocument:
+    """
+    Parse a file, reusing what was stored for its current version.
+
+    Stored chunks are returned as they are. If the version was parsed with
+    another chunking mode, its stored blocks are re-chunked without analyzing
+    the pages again. Otherwise the file is parsed and the result stored.
+
+    Args:
+        file_id: ID of the file
+        pdf_bytes: The raw PDF bytes of the file
+        chunking_mode: Chunking strategy to use
+
+    Returns:
+        The parsed document
+    """
+    version = file_version(pdf_bytes)
+    parsed_document = await asyncio.to_thread(
+        load_parsed_document, file_id, version, chunking_mode
+    )
+    if parsed_document is not None:
+        logger.info(f"Using stored {chunking_mode} chunks of file {file_id}")
+        return parsed_document
+
+    loaded = await asyncio.to_thread(load_blocks, file_id, version)
+    if loaded is not None:
+        logger.info(f"Re-chunking stored blocks of file {file_id}")
+        blocks, stats = loaded
+        chunks = await create_chunks_from_blocks(blocks, mode=chunking_mode)
+        annotate_duplicate_pages(chunks, _duplicate_pages(stats))
+        parsed_document = ParsedDocument(chunks=chunks, stats=stats)
+    else:
+        parsed_document = await parse_pdf(pdf_bytes, chunking_mode=chunking_mode)
+
+    await asyncio.to_thread(
+        save_parsed_document, file_id, version, chunking_mode, parsed_document
+    )
+    return parsed_document
@@ -0,0 +1,188 @@
+import datetime
+import hashlib
+import logging
+import os
+from array import array
+from typing import Any, Dict, List
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database import SessionLocal
+from backend.models import EmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum number of embeddings kept in the cache. Least recently used entries
+# are evicted once the cache grows past this.
+EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000")
+)
+# Entries that haven't been used for this many days are evicted
+EMBEDDING_CACHE_TTL_DAYS = int(os.getenv("EMBEDDING_CACHE_TTL_DAYS", "90"))
+# Number of written entries between eviction passes
+EMBEDDING_CACHE_EVICT_EVERY = 1000
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings, stored in Postgres as float32 bytes.
+
+    Embeddings are keyed by model, dimensions and a hash of the embedded text,
+    so repeated pages, re-uploads and re-indexing reuse earlier embeddings.
+    Cache errors are logged and treated as misses, they never fail indexing or
+    search.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl_days: int = EMBEDDING_CACHE_TTL_DAYS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_days = ttl_days
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def get_many(
+        self, model: str, dimensions: int, texts: List[str]
+    ) -> Dict[str, List[float]]:
+        """
+        Look up the embeddings of several texts at once.
+
+        Args:
+            model: Embedding model
+            dimensions: Embedding dimensions
+            texts: Texts to look up
+
+        Returns:
+            A dictionary from text to embedding, for the texts found in the cache
+        """
+        hashes = {text_hash(text): text for text in texts}
+        db = SessionLocal()
+        try:
+            entries = db.scalars(
+                select(EmbeddingCacheEntry).where(
+                    EmbeddingCacheEntry.model == model,
+                    EmbeddingCacheEntry.dimensions == dimensions,
+                    EmbeddingCacheEntry.text_hash.in_(hashes),
+                )
+            ).all()
+
+            found = {}
+            for entry in entries:
+                found[hashes[entry.text_hash]] = array("f", entry.embedding).tolist()
+                entry.last_used_at = datetime.datetime.now()
+            db.commit()
+
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+            return found
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error reading embedding cache: {str(e)}")
+            self.misses += len(hashes)
+            return {}
+        finally:
+            db.close()
+
+    def put_many(
+        self, model: str, dimensions: int, embeddings: Dict[str, List[float]]
+    ):
+        """
+        Store the embeddings of several texts.
+
+        Args:
+            model: Embedding model
+            dimensions: Embedding dimensions
+            embeddings: A dictionary from text to embedding
+        """
+        if not embeddings:
+            return
+
+        now = datetime.datetime.now()
+        rows = [
+            {
+                "model": model,
+                "dimensions": dimensions,
+                "text_hash": text_hash(text),
+                "embedding": array("f", embedding).tobytes(),
+                "created_at": now,
+                "last_used_at": now,
+            }
+            for text, embedding in embeddings.items()
+        ]
+        db = SessionLocal()
+        try:
+            # Concurrent indexing may embed the same text, keep the first one
+            db.execute(
+                insert(EmbeddingCacheEntry).values(rows).on_conflict_do_nothing()
+            )
+            db.commit()
+
+            writes = self._writes + len(rows)
+            if writes // EMBEDDING_CACHE_EVICT_EVERY > (
+                self._writes // EMBEDDING_CACHE_EVICT_EVERY
+            ):
+                self._evict(db)
+            self._writes = writes
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error writing embedding cache: {str(e)}")
+        finally:
+            db.close()
+
+    def _evict(self, db):
+        expired = (
+            db.query(EmbeddingCacheEntry)
+            .filter(
+                EmbeddingCacheEntry.last_used_at
+                < datetime.datetime.now() - datetime.timedelta(days=self.ttl_days)
+            )
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+
+        count = db.query(EmbeddingCacheEntry).count()
+        excess = max(0, count - self.max_entries)
+        if excess:
+            stale_keys = (
+                select(
+                    EmbeddingCacheEntry.model,
+                    EmbeddingCacheEntry.dimensions,
+                    EmbeddingCacheEntry.text_hash,
+                )
+                .order_by(EmbeddingCacheEntry.last_used_at.asc())
+                .limit(excess)
+            )
+            db.query(EmbeddingCacheEntry).filter(
+                tuple_(
+                    EmbeddingCacheEntry.model,
+                    EmbeddingCacheEntry.dimensions,
+                    EmbeddingCacheEntry.text_hash,
+                ).in_(stale_keys)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+        if expired or excess:
+            logger.info(
+                f"Evicted {expired} expired and {excess} least recently used "
+                "embedding cache entries"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Set
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import text
+
+from backend.database import SessionLocal, engine
+from backend.search_cache import corpus_versions
+
+logger = logging.getLogger(__name__)
+
+
+# Postgres channel the workers' progress events, and the web servers' file
+# deletions, are relayed through
+PROGRESS_CHANNEL = "indexing_progress"
+# Workers send the latest event of each file at most this often
+PROGRESS_RELAY_INTERVAL_SECONDS = float(
+    os.getenv("PROGRESS_RELAY_INTERVAL_SECONDS", "0.5")
+)
+# Events waiting for a subscriber, the oldest are dropped when it falls behind
+PROGRESS_SUBSCRIBER_QUEUE_SIZE = 100
+# Number of files whose latest event is kept for new subscribers
+PROGRESS_LATEST_MAX_FILES = 10000
+# Page counts reported while a file is indexed, each counts the pages that
+# reached that stage
+PAGE_COUNTS = ["extracted", "analyzed", "described", "embedded", "written"]
+
+
+class ProgressBroker:
+    """
+    In-process pub/sub of indexing progress events, by user.
+
+    Publishing never blocks: events are put on each subscriber's bounded queue,
+    dropping the oldest when a subscriber falls behind, so the indexing
+    pipeline doesn't wait on slow clients.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = PROGRESS_SUBSCRIBER_QUEUE_SIZE,
+        latest_max_files: int = PROGRESS_LATEST_MAX_FILES,
+    ):
+        self.queue_size = queue_size
+        self.latest_max_files = latest_max_files
+        # Subscribers by user id, None subscribes to every user
+        self._subscribers: Dict[Optional[str], Set[asyncio.Queue]] = defaultdict(set)
+        self._latest: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+
+    def publish(self, event: Dict[str, Any]):
+        """
+        Send an event to the subscribers of its user.
+
+        Args:
+            event: Event with at least "file_id" and "user_id"
+        """
+        if event["status"] == "deleted":
+            self._latest.pop(event["file_id"], None)
+        else:
+            self._latest[event["file_id"]] = event
+            self._latest.move_to_end(event["file_id"])
+        while len(self._latest) > self.latest_max_files:
+            self._latest.popitem(last=False)
+
+        for queue in self._subscribers.get(event["user_id"], ()):
+            self._put(queue, event)
+        for queue in self._subscribers.get(None, ()):
+            self._put(queue, event)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: Dict[str, Any]):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    @contextmanager
+    def subscribe(
+        self, user_id: Optional[uuid.UUID | str] = None, queue_size: int = None
+    ):
+        """
+        Receive the events of a user, or of every user if None, on a queue for
+        the duration of the block.
+        """
+        key = str(user_id) if user_id is not None else None
+        queue = asyncio.Queue(maxsize=queue_size or self.queue_size)
+        self._subscribers[key].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[key].discard(queue)
+            if not self._subscribers[key]:
+                del self._subscribers[key]
+
+    def latest(self, user_id: uuid.UUID | str) -> List[Dict[str, Any]]:
+        """
+        Return the latest event of each of a user's files seen by this process.
+        """
+        return [
+            event for event in self._latest.values() if event["user_id"] == str(user_id)
+        ]
+
+
+progress_broker = ProgressBroker()
+
+
+class FileProgress:
+    """
+    Page counts of a file being indexed, published on every change.
+    """
+
+    def __init__(
+        self,
+        file_id: uuid.UUID,
+        user_id: uuid.UUID,
+        broker: ProgressBroker = progress_broker,
+    ):
+        self.file_id = str(file_id)
+        self.user_id = str(user_id)
+        self.broker = broker
+        self.pages_total: Optional[int] = None
+        self.pages = dict.fromkeys(PAGE_COUNTS, 0)
+
+    def set_total(self, pages: int):
+        self.pages_total = pages
+        self.publish()
+
+    def advance(self, stage: str, pages: int = 1):
+        if pages:
+            self.pages[stage] += pages
+            self.publish()
+
+    def publish(self):
+        self.broker.publish(
+            {
+                "file_id": self.file_id,
+                "user_id": self.user_id,
+                "status": "processing",
+                "pages_total": self.pages_total,
+                "pages": dict(self.pages),
+            }
+        )
+
+
+# Progress of the file indexed by the current task
+current_file_progress: ContextVar[Optional[FileProgress]] = ContextVar(
+    "current_file_progress", default=None
+)
+
+
+def report_page_count(pages: int):
+    """
+    Report the number of pages of the file being indexed, if any.
+    """
+    progress = current_file_progress.get()
+    if progress is not None:
+        progress.set_total(pages)
+
+
+def report_pages(stage: str, pages: int = 1):
+    """
+    Report pages of the file being indexed, if any, reaching a stage.
+
+    Args:
+        stage: One of PAGE_COUNTS
+        pages: Number of pages
+    """
+    progress = current_file_progress.get()
+    if progress is not None:
+        progress.advance(stage, pages)
+
+
+def publish_file_status(
+    file_id: uuid.UUID,
+    user_id: uuid.UUID,
+    status: str,
+    error: Optional[str] = None,
+    broker: ProgressBroker = progress_broker,
+):
+    """
+    Publish a change of a file's index status, see File.index_status.
+    """
+    event = {"file_id": str(file_id), "user_id": str(user_id), "status": status}
+    if error is not None:
+        event["error"] = error
+    broker.publish(event)
+
+
+def _notify(events: List[Dict[str, Any]]):
+    db = SessionLocal()
+    try:
+        for event in events:
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": PROGRESS_CHANNEL, "payload": json.dumps(event)},
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def notify_file_deleted(file_id: uuid.UUID, user_id: uuid.UUID):
+    """
+    Tell every web server, this one included, that a file was deleted, see
+    `listen_progress`.
+    """
+    _notify([{"file_id": str(file_id), "user_id": str(user_id), "status": "deleted"}])
+
+
+async def relay_progress(
+    broker: ProgressBroker = progress_broker,
+    interval: float = PROGRESS_RELAY_INTERVAL_SECONDS,
+):
+    """
+    Forward the events published in this process to the web servers with
+    Postgres NOTIFY. Events are coalesced per file, so a file sends at most one
+    event per interval however fast its pages go. The events still pending
+    are sent when cancelled, await the task for them to be.
+    """
+    with broker.subscribe(queue_size=PROGRESS_LATEST_MAX_FILES) as queue:
+        pending: Dict[str, Dict[str, Any]] = {}
+
+        def take_queued():
+            while not queue.empty():
+                event = queue.get_nowait()
+                pending[event["file_id"]] = event
+
+        async def send():
+            events = list(pending.values())
+            pending.clear()
+            try:
+                await asyncio.to_thread(_notify, events)
+            except Exception as e:
+                logger.error(f"Error relaying indexing progress: {str(e)}")
+
+        try:
+            while True:
+                event = await queue.get()
+                pending[event["file_id"]] = event
+                await asyncio.sleep(interval)
+                take_queued()
+                await send()
+        except asyncio.CancelledError:
+            # E.g. the final status of the last jobs of a stopping worker
+            take_queued()
+            if pending:
+                await send()
+            raise
+
+
+def invalidate_searches(event: Dict[str, Any]):
+    """
+    Invalidate the cached search results of a file's user when a worker wrote
+    chunks of it: while its pages are written, and once its job finished,
+    including failed attempts that wrote some pages. Also when the file was
+    deleted, by whichever web server handled it.
+    """
+    status = event["status"]
+    if (
+        status in ("indexed", "failed", "deleted")
+        or (status == "pending" and "error" in event)
+        or (status == "processing" and event.get("pages", {}).get("written"))
+    ):
+        corpus_versions.bump(event["user_id"])
+
+
+async def listen_progress(
+    broker: ProgressBroker = progress_broker, retry_delay: float = 5
+):
+    """
+    Publish the events relayed by the workers and the file deletions of the
+    web servers to this process's subscribers,
+    and invalidate the search results they make stale. Runs until cancelled,
+    reconnecting when the connection is lost.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        connection = None
+        try:
+            connection = engine.raw_connection()
+            listener = connection.driver_connection
+            listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {PROGRESS_CHANNEL}")
+
+            readable = asyncio.Event()
+            loop.add_reader(listener.fileno(), readable.set)
+            try:
+                while True:
+                    await readable.wait()
+                    readable.clear()
+                    listener.poll()
+                    while listener.notifies:
+                        notify = listener.notifies.pop(0)
+                        event = json.loads(notify.payload)
+                        broker.publish(event)
+                        invalidate_searches(event)
+            finally:
+                loop.remove_reader(listener.fileno())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error listening to indexing progress: {str(e)}")
+            await asyncio.sleep(retry_delay)
+        finally:
+            if connection is not None:
+                # The connection left autocommit mode, don't return it to the
+                # pool
+                connection.invalidate()
@@ -0,0 +1,257 @@
+import asyncio
+import datetime
+import logging
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Literal, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.clients import get_openai_client
+from backend.database import SessionLocal
+from backend.document_parser import (
+    DocumentBlock,
+    DocumentChunk,
+    ParsedDocument,
+    create_page_chunks,
+    iter_parse_pdf_pages,
+    summarize_page_reports,
+)
+from backend.models import IndexingPageProgress
+
+logger = logging.getLogger(__name__)
+
+
+# Stages a page goes through while its file is indexed, in order:
+# - "analyzed": its blocks were extracted
+# - "described": its chunks were created
+# - "embedded": its chunks were embedded, the embeddings are in the cache
+# - "written": its chunks were written to Chroma and the full-text index
+PAGE_STAGES = ["analyzed", "described", "embedded", "written"]
+
+
+def _stage_rank(stage):
+    return case(
+        {name: rank for rank, name in enumerate(PAGE_STAGES)}, value=stage
+    )
+
+
+def load_page_progress(
+    file_id: uuid.UUID, version: str
+) -> Dict[int, IndexingPageProgress]:
+    """
+    Load the recorded progress of each page of a file version.
+
+    Returns:
+        A dictionary from page number to its progress
+    """
+    db = SessionLocal()
+    try:
+        pages = (
+            db.query(IndexingPageProgress)
+            .filter(
+                IndexingPageProgress.file_id == file_id,
+                IndexingPageProgress.version == version,
+            )
+            .all()
+        )
+        return {page.page_num: page for page in pages}
+    finally:
+        db.close()
+
+
+def record_pages(
+    file_id: uuid.UUID,
+    version: str,
+    stage: str,
+    pages: Dict[int, Dict[str, Any]],
+):
+    """
+    Record that pages reached a stage. A page never goes back to an earlier
+    stage.
+
+    Args:
+        file_id: ID of the file
+        version: Version of the file
+        stage: One of PAGE_STAGES
+        pages: Mapping of page number to the "report" and "data" to store
+            with the stage, if any
+    """
+    if not pages:
+        return
+
+    now = datetime.datetime.now()
+    statement = insert(IndexingPageProgress).values(
+        [
+            {
+                "file_id": file_id,
+                "version": version,
+                "page_num": page_num,
+                "stage": stage,
+                "report": values.get("report"),
+                "data": values.get("data"),
+                "updated_at": now,
+            }
+            for page_num, values in pages.items()
+        ]
+    )
+    db = SessionLocal()
+    try:
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[
+                    IndexingPageProgress.file_id,
+                    IndexingPageProgress.version,
+                    IndexingPageProgress.page_num,
+                ],
+                set_={
+                    "stage": statement.excluded.stage,
+                    "report": func.coalesce(
+                        statement.excluded.report, IndexingPageProgress.report
+                    ),
+                    "data": func.coalesce(
+                        statement.excluded.data, IndexingPageProgress.data
+                    ),
+                    "updated_at": statement.excluded.updated_at,
+                },
+                where=_stage_rank(IndexingPageProgress.stage)
+                < _stage_rank(statement.excluded.stage),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def clear_page_progress(file_id: uuid.UUID, version: str):
+    """
+    Forget the progress of a file version once it is completely indexed.
+    """
+    db = SessionLocal()
+    try:
+        db.query(IndexingPageProgress).filter(
+            IndexingPageProgress.file_id == file_id,
+            IndexingPageProgress.version == version,
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def parsed_document_from_progress(
+    progress: Dict[int, IndexingPageProgress],
+) -> ParsedDocument:
+    """
+    Assemble the parsed document from the chunks and reports recorded for each
+    page.
+    """
+    chunks = []
+    for page_num in sorted(progress):
+        data = progress[page_num].data or {}
+        chunks.extend(
+            DocumentChunk.model_validate(chunk) for chunk in data.get("chunks", [])
+        )
+    stats = summarize_page_reports(
+        [page.report for page in progress.values() if page.report is not None]
+    )
+    return ParsedDocument(chunks=chunks, stats=stats)
+
+
+async def iter_resumable_pages(
+    file_id: uuid.UUID,
+    version: str,
+    pdf_bytes: bytes,
+    chunking_mode: Literal["page", "block"] = "page",
+    progress: Dict[int, IndexingPageProgress] | None = None,
+) -> AsyncIterator[Tuple[int, List[DocumentChunk]]]:
+    """
+    Parse the pages of a file version that weren't written yet, recording each
+    page's blocks and chunks as it is parsed.
+
+    Pages that were described in an earlier run are yielded from their
+    recorded chunks, and pages that were analyzed are chunked from their
+    recorded blocks, so neither is rendered or analyzed again.
+
+    Args:
+        file_id: ID of the file
+        version: Version of the file
+        pdf_bytes: The raw PDF bytes of the file
+        chunking_mode: Chunking strategy to use
+        progress: Progress recorded by earlier runs, see `load_page_progress`
+
+    Yields:
+        The number of each page with its chunks, in completion order
+    """
+    if progress is None:
+        progress = {}
+
+    for page_num in sorted(progress):
+        page = progress[page_num]
+        if page.stage in ("described", "embedded"):
+            yield page_num, [
+                DocumentChunk.model_validate(chunk) for chunk in page.data["chunks"]
+            ]
+
+    client = get_openai_client()
+
+    async def record_described(page_num, chunks, report=None):
+        await asyncio.to_thread(
+            record_pages,
+            file_id,
+            version,
+            "described",
+            {
+                page_num: {
+                    "report": report,
+                    "data": {
+                        "chunks": [chunk.model_dump(mode="json") for chunk in chunks]
+                    },
+                }
+            },
+        )
+
+    for page_num in sorted(progress):
+        page = progress[page_num]
+        if page.stage == "analyzed":
+            blocks = [
+                DocumentBlock.model_validate(block) for block in page.data["blocks"]
+            ]
+            chunks = await create_page_chunks(
+                client,
+                page_num,
+                blocks,
+                chunking_mode,
+                page.data.get("duplicate_pages"),
+            )
+            await record_described(page_num, chunks)
+            yield page_num, chunks
+
+    async def record_analyzed(report, blocks, duplicate_pages):
+        await asyncio.to_thread(
+            record_pages,
+            file_id,
+            version,
+            "analyzed",
+            {
+                report["page_num"]: {
+                    "report": report,
+                    "data": {
+                        "blocks": [block.model_dump(mode="json") for block in blocks],
+                        "duplicate_pages": duplicate_pages,
+                    },
+                }
+            },
+        )
+
+    if progress:
+        logger.info(
+            f"Resuming parsing of file {file_id}, skipping {len(progress)} pages"
+        )
+    async for report, chunks in iter_parse_pdf_pages(
+        pdf_bytes,
+        chunking_mode,
+        skip_pages=set(progress),
+        on_page_analyzed=record_analyzed,
+    ):
+        await record_described(report["page_num"], chunks, report)
+        yield report["page_num"], chunks
@@ -0,0 +1,316 @@
+import logging
+import os
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.database import SessionLocal
+from backend.models import File, IndexingJob
+
+logger = logging.getLogger(__name__)
+
+
+# Number of times indexing a file is attempted before it is marked as failed
+INDEXING_MAX_ATTEMPTS = int(os.getenv("INDEXING_MAX_ATTEMPTS", "5"))
+# A running job is handed to another worker if its worker doesn't extend its
+# lock for this long, e.g. because it crashed or was redeployed
+INDEXING_VISIBILITY_TIMEOUT_SECONDS = int(
+    os.getenv("INDEXING_VISIBILITY_TIMEOUT_SECONDS", "300")
+)
+# Delay before the first retry of a failed job, doubled on every attempt
+INDEXING_RETRY_BASE_DELAY_SECONDS = int(
+    os.getenv("INDEXING_RETRY_BASE_DELAY_SECONDS", "30")
+)
+INDEXING_RETRY_MAX_DELAY_SECONDS = int(
+    os.getenv("INDEXING_RETRY_MAX_DELAY_SECONDS", "3600")
+)
+
+# Takes the next job that is due, or whose worker lost its lock. Users with the
+# fewest running jobs go first, so a large upload doesn't hold back everyone
+# else's files. SKIP LOCKED lets workers claim jobs concurrently without
+# waiting on each other. All times come from the database clock, so workers
+# with skewed clocks agree on them.
+CLAIM_JOB_QUERY = text(
+    """
+    WITH running AS (
+        SELECT user_id, count(*) AS jobs
+        FROM indexing_jobs
+        WHERE status = 'running' AND locked_until > LOCALTIMESTAMP
+        GROUP BY user_id
+    ), candidate AS (
+        SELECT job.id
+        FROM indexing_jobs AS job
+            LEFT JOIN running ON running.user_id = job.user_id
+        WHERE (job.status = 'queued' AND job.run_at <= LOCALTIMESTAMP)
+            OR (job.status = 'running' AND job.locked_until <= LOCALTIMESTAMP)
+        ORDER BY coalesce(running.jobs, 0), job.run_at
+        LIMIT 1
+        FOR UPDATE OF job SKIP LOCKED
+    )
+    UPDATE indexing_jobs
+    SET status = 'running',
+        attempts = indexing_jobs.attempts + 1,
+        locked_by = :worker_id,
+        locked_until = LOCALTIMESTAMP + make_interval(secs => :visibility_timeout)
+    FROM candidate
+    WHERE indexing_jobs.id = candidate.id
+    RETURNING indexing_jobs.id, indexing_jobs.file_id, indexing_jobs.user_id,
+        indexing_jobs.attempts, indexing_jobs.max_attempts
+    """
+)
+
+EXTEND_LOCK_QUERY = text(
+    """
+    UPDATE indexing_jobs
+    SET locked_until = LOCALTIMESTAMP + make_interval(secs => :visibility_timeout)
+    WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id
+    """
+)
+
+# Only the worker holding the lock may finish a job, a worker that lost it
+# to another one must not overwrite its outcome
+FINISH_JOB_QUERY = text(
+    """
+    UPDATE indexing_jobs
+    SET status = :status,
+        run_at = LOCALTIMESTAMP + make_interval(secs => :retry_delay),
+        locked_by = NULL,
+        locked_until = NULL,
+        last_error = :error,
+        finished_at = CASE WHEN :status = 'queued' THEN NULL ELSE LOCALTIMESTAMP END
+    WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id
+    RETURNING file_id
+    """
+)
+
+
+@dataclass
+class ClaimedJob:
+    id: uuid.UUID
+    file_id: uuid.UUID
+    user_id: uuid.UUID
+    attempts: int
+    max_attempts: int
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter, so files failing together don't retry
+    together.
+    """
+    delay = min(
+        INDEXING_RETRY_BASE_DELAY_SECONDS * 2 ** (attempts - 1),
+        INDEXING_RETRY_MAX_DELAY_SECONDS,
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+class IndexingJobQueue:
+    """
+    Queue of files to index, stored in Postgres so jobs survive crashes and
+    deploys of both the web server and the workers.
+
+    A claimed job is locked for a visibility timeout that its worker keeps
+    extending while it runs. If the worker stops, the lock expires and another
+    worker runs the job again. Failed jobs are retried with backoff until they
+    run out of attempts.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = INDEXING_MAX_ATTEMPTS,
+        visibility_timeout: int = INDEXING_VISIBILITY_TIMEOUT_SECONDS,
+    ):
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+
+    def enqueue(self, db: Session, file: File) -> IndexingJob:
+        """
+        Queue a file for indexing. The job is added to the session and saved
+        when the caller commits.
+
+        Args:
+            db: Database session
+            file: The file to index
+
+        Returns:
+            The queued job
+        """
+        job = IndexingJob(
+            file_id=file.id,
+            user_id=file.user_id,
+            status="queued",
+            attempts=0,
+            max_attempts=self.max_attempts,
+        )
+        db.add(job)
+        file.index_status = "pending"
+        file.index_error = None
+        return job
+
+    def claim(self, worker_id: str) -> Optional[ClaimedJob]:
+        """
+        Lock the next job for a worker.
+
+        Args:
+            worker_id: Identifies the worker holding the lock
+
+        Returns:
+            The claimed job, or None if no job is due
+        """
+        db = SessionLocal()
+        try:
+            row = db.execute(
+                CLAIM_JOB_QUERY,
+                {
+                    "worker_id": worker_id,
+                    "visibility_timeout": self.visibility_timeout,
+                },
+            ).first()
+            if row is None:
+                db.commit()
+                return None
+
+            job = ClaimedJob(*row)
+            db.query(File).filter(File.id == job.file_id).update(
+                {"index_status": "processing"}
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if job.attempts > job.max_attempts:
+            # Every attempt lost its worker, the file is likely what kills them
+            self.fail(job, worker_id, "Worker stopped while indexing the file")
+            return None
+        return job
+
+    def extend_lock(self, job: ClaimedJob, worker_id: str) -> bool:
+        """
+        Keep a running job locked for another visibility timeout.
+
+        Returns:
+            False if the worker lost the job to another worker
+        """
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                EXTEND_LOCK_QUERY,
+                {
+                    "job_id": job.id,
+                    "worker_id": worker_id,
+                    "visibility_timeout": self.visibility_timeout,
+                },
+            )
+            db.commit()
+            return result.rowcount > 0
+        finally:
+            db.close()
+
+    def complete(self, job: ClaimedJob, worker_id: str) -> bool:
+        """
+        Mark a job and its file as indexed.
+
+        Returns:
+            False if the worker lost the job to another worker
+        """
+        return self._finish(job, worker_id, "succeeded", "indexed")
+
+    def fail(self, job: ClaimedJob, worker_id: str, error: str) -> bool:
+        """
+        Queue a failed job again after a backoff, or mark it and its file as
+        failed once it has run out of attempts.
+
+        Returns:
+            False if the worker lost the job to another worker
+        """
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            logger.warning(
+                f"Indexing file {job.file_id} failed (attempt {job.attempts} of "
+                f"{job.max_attempts}), retrying in {delay:.0f}s: {error}"
+            )
+            return self._finish(job, worker_id, "queued", "pending", error, delay)
+        else:
+            logger.error(
+                f"Indexing file {job.file_id} failed after {job.attempts} "
+                f"attempts: {error}"
+            )
+            return self._finish(job, worker_id, "failed", "failed", error)
+
+    def _finish(
+        self,
+        job: ClaimedJob,
+        worker_id: str,
+        status: str,
+        file_status: str,
+        error: Optional[str] = None,
+        delay: float = 0,
+    ) -> bool:
+        db = SessionLocal()
+        try:
+            row = db.execute(
+                FINISH_JOB_QUERY,
+                {
+                    "job_id": job.id,
+                    "worker_id": worker_id,
+                    "status": status,
+                    "error": error,
+                    "retry_delay": delay,
+                },
+            ).first()
+            if row is None:
+                logger.warning(f"Job {job.id} was taken over by another worker")
+            else:
+                db.query(File).filter(File.id == job.file_id).update(
+                    {"index_status": file_status, "index_error": error}
+                )
+            db.commit()
+            return row is not None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            counts = dict(
+                db.execute(
+                    text(
+                        "SELECT status, count(*) FROM indexing_jobs GROUP BY status"
+                    )
+                ).all()
+            )
+            oldest_queued_seconds = db.execute(
+                text(
+                    "SELECT extract(epoch FROM LOCALTIMESTAMP - min(run_at)) "
+                    "FROM indexing_jobs "
+                    "WHERE status = 'queued' AND run_at <= LOCALTIMESTAMP"
+                )
+            ).scalar()
+        except Exception as e:
+            logger.error(f"Error reading indexing queue stats: {str(e)}")
+            return {}
+        finally:
+            db.close()
+
+        return {
+            "jobs": counts,
+            "oldest_queued_seconds": (
+                float(oldest_queued_seconds)
+                if oldest_queued_seconds is not None
+                else None
+            ),
+        }
+
+
+indexing_queue = IndexingJobQueue()
@@ -0,0 +1,100 @@
+import logging
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database import SessionLocal
+from backend.models import FileChunk
+
+logger = logging.getLogger(__name__)
+
+
+# Any query term may match. plainto_tsquery joins terms with AND, which finds
+# nothing for the long natural language queries the agent writes. The terms
+# are already stemmed, so they are parsed back with the simple configuration.
+LEXICAL_SEARCH_QUERY = text(
+    """
+    SELECT id, file_id, user_id, file_name, page_number, content,
+        ts_rank_cd(content_tsv, query) AS rank
+    FROM file_chunks,
+        to_tsquery(
+            'simple', replace(plainto_tsquery('english', :query)::text, '&', '|')
+        ) AS query
+    WHERE content_tsv @@ query
+        AND (CAST(:user_id AS uuid) IS NULL OR user_id = CAST(:user_id AS uuid))
+    ORDER BY rank DESC
+    LIMIT :top_k
+    """
+)
+
+
+def add_chunks(chunks: List[Dict[str, Any]]):
+    """
+    Store the text of indexed chunks for full-text search
+
+    Args:
+        chunks: Chunks with the columns of FileChunk
+    """
+    if not chunks:
+        return
+
+    db = SessionLocal()
+    try:
+        statement = insert(FileChunk).values(chunks)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[FileChunk.id],
+                set_={
+                    "file_name": statement.excluded.file_name,
+                    "page_number": statement.excluded.page_number,
+                    "content": statement.excluded.content,
+                },
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def search_chunks(
+    query: str, top_k: int, user_id: Optional[uuid.UUID | str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Full-text search over chunk text, ranked by term frequency and proximity
+
+    Args:
+        query: The search query
+        top_k: Number of results to return
+        user_id: If provided, only search files belonging to this user
+
+    Returns:
+        List of matching chunks with metadata, best match first
+    """
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            LEXICAL_SEARCH_QUERY,
+            {
+                "query": query,
+                "user_id": str(user_id) if user_id else None,
+                "top_k": top_k,
+            },
+        ).all()
+    finally:
+        db.close()
+
+    return [
+        {
+            "id": row.id,
+            "content": row.content,
+            "metadata": {
+                "file_id": str(row.file_id),
+                "file_name": row.file_name,
+                "page_number": row.page_number,
+                "user_id": str(row.user_id),
+            },
+        }
+        for row in rows
+    ]
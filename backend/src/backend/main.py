@@ -1,7 +1,19 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from backend.clients import close_clients
+from backend.document_parser import shutdown_extract_pool
+from backend.embedding_cache import embedding_cache
+from backend.indexing_events import listen_progress
+from backend.job_queue import indexing_queue
+from backend.openai_scheduler import openai_scheduler
+from backend.page_cache import page_analysis_cache
+from backend.prefetch import chat_latency
+from backend.search_cache import search_cache_stats
+from backend.uploads import UploadSizeLimitMiddleware
 from backend.routers import auth, chat
 from backend.routers import users
 from backend.routers import files
@@ -12,8 +24,23 @@ from backend.routers import ws
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Relays the workers' indexing progress to websocket clients
+    progress_listener = asyncio.create_task(listen_progress())
+    yield
+    progress_listener.cancel()
+    # Release the shared connection pools and worker processes on shutdown
+    await close_clients()
+    shutdown_extract_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Oversized uploads are rejected before their body is received. Added first,
+# so the CORS middleware wraps its responses too.
+app.add_middleware(UploadSizeLimitMiddleware, paths={files.router.prefix})
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +57,18 @@ async def health_check():
     return "ok"
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "openai": openai_scheduler.metrics(),
+        "embedding_cache": embedding_cache.stats(),
+        "page_analysis_cache": page_analysis_cache.stats(),
+        "search_cache": search_cache_stats(),
+        "chat": chat_latency.stats(),
+        "indexing_queue": indexing_queue.stats(),
+    }
+
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(files.router)
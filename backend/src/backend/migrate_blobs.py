@@ -0,0 +1,111 @@
+"""
+Move files uploaded before blob storage from files/<file id> to the blob of
+their content, so identical files share it. Run it from the directory the
+server runs in, where files/ is. Running it again completes the files an
+interrupted run left behind.
+
+Usage:
+    python -m backend.migrate_blobs [--dry-run]
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+
+from backend.blob_store import (
+    UPLOAD_DIR,
+    add_blob_ref,
+    remove_unreferenced_blob,
+    store_blob,
+)
+from backend.database import SessionLocal
+from backend.models import File
+from backend.uploads import UPLOAD_CHUNK_SIZE, StoredUpload
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str) -> StoredUpload:
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+            size += len(chunk)
+    return StoredUpload(path=path, size=size, sha256=sha256.hexdigest())
+
+
+def legacy_path(file: File) -> str:
+    return os.path.join(UPLOAD_DIR, str(file.id))
+
+
+def migrate_file(file: File, dry_run: bool) -> bool:
+    """
+    Copy a file's content to its blob, and remove the original once the
+    file references the blob.
+
+    Returns:
+        False if the file's content is missing
+    """
+    path = legacy_path(file)
+    if not os.path.exists(path):
+        logger.warning(f"Content of file {file.id} not found at {path}")
+        return False
+    if dry_run:
+        return True
+
+    db = SessionLocal()
+    stored = None
+    try:
+        if file.sha256 is None:
+            stored = hash_file(path)
+            add_blob_ref(db, stored)
+            db.query(File).filter(File.id == file.id).update(
+                {"sha256": stored.sha256}
+            )
+        else:
+            # Referenced by an interrupted run, its blob may not be in place
+            stored = StoredUpload(path=path, size=file.size, sha256=file.sha256)
+        store_blob(db, stored, copy=True)
+        db.commit()
+    except Exception:
+        db.rollback()
+        if file.sha256 is None and stored is not None:
+            # Copied to a blob nothing references
+            remove_unreferenced_blob(db, stored.sha256)
+        raise
+    finally:
+        db.close()
+
+    # Only once the file references its blob, which has the content
+    os.remove(path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        files = [
+            file
+            for file in db.query(File).all()
+            # Or already referencing their blob, after an interrupted run
+            if file.sha256 is None or os.path.exists(legacy_path(file))
+        ]
+    finally:
+        db.close()
+
+    migrated = sum(migrate_file(file, args.dry_run) for file in files)
+    logger.info(
+        f"{'Would move' if args.dry_run else 'Moved'} {migrated} of {len(files)} "
+        "files to blob storage"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Move file chunks between Chroma collections after changing the collection
+sharding mode. Embeddings, documents and metadata are copied as they are, so
+nothing is re-embedded.
+
+Chunks indexed before full-text search was added can also be copied to the
+file_chunks table with --backfill-lexical.
+
+Usage:
+    CHROMA_COLLECTION_SHARDING=user python -m backend.migrate_collections
+        [--batch-size 500] [--dry-run] [--keep-source] [--backfill-lexical]
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from typing import Dict
+
+from backend.chroma import (
+    COLLECTION_SHARDING,
+    collection_name_for_user,
+    list_file_collection_names,
+)
+from backend.clients import get_chroma_client
+from backend.database import SessionLocal
+from backend.lexical_search import add_chunks
+from backend.models import File
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_collection(
+    source_name: str, sharding: str, batch_size: int, dry_run: bool, keep_source: bool
+) -> Dict[str, int]:
+    """
+    Move the chunks of a collection that belong in another collection under
+    the given sharding mode
+
+    Args:
+        source_name: Name of the collection to move chunks out of
+        sharding: The target sharding mode
+        batch_size: Number of chunks read and written at once
+        dry_run: Only count the chunks that would be moved
+        keep_source: Copy chunks instead of moving them
+
+    Returns:
+        The number of chunks moved to each collection
+    """
+    client = get_chroma_client()
+    source = client.get_collection(source_name)
+    moved = defaultdict(int)
+    moved_ids = []
+
+    offset = 0
+    while True:
+        batch = source.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+
+        # Group the batch by destination collection
+        destinations = defaultdict(lambda: defaultdict(list))
+        for i, chunk_id in enumerate(batch["ids"]):
+            metadata = batch["metadatas"][i]
+            target_name = collection_name_for_user(metadata["user_id"], sharding)
+            if target_name == source_name:
+                continue
+            destination = destinations[target_name]
+            destination["ids"].append(chunk_id)
+            destination["embeddings"].append(batch["embeddings"][i])
+            destination["documents"].append(batch["documents"][i])
+            destination["metadatas"].append(metadata)
+
+        for target_name, destination in destinations.items():
+            moved[target_name] += len(destination["ids"])
+            moved_ids.extend(destination["ids"])
+            if dry_run:
+                continue
+            # Upsert so an interrupted migration can simply be run again
+            client.get_or_create_collection(target_name).upsert(**destination)
+
+    # Delete only once everything is copied, deleting while paging through the
+    # collection would shift the offsets
+    if moved_ids and not dry_run and not keep_source:
+        for start in range(0, len(moved_ids), batch_size):
+            source.delete(ids=moved_ids[start : start + batch_size])
+        if source.count() == 0:
+            client.delete_collection(source_name)
+
+    return dict(moved)
+
+
+def backfill_lexical(source_name: str, batch_size: int) -> int:
+    """
+    Copy the text of a collection's chunks to the full-text search table
+
+    Args:
+        source_name: Name of the collection to copy chunks from
+        batch_size: Number of chunks read and written at once
+
+    Returns:
+        The number of chunks copied
+    """
+    source = get_chroma_client().get_collection(source_name)
+    db = SessionLocal()
+    try:
+        file_ids = {str(file_id) for (file_id,) in db.query(File.id).all()}
+    finally:
+        db.close()
+
+    copied = 0
+    offset = 0
+    while True:
+        batch = source.get(
+            include=["documents", "metadatas"], limit=batch_size, offset=offset
+        )
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+
+        chunks = [
+            {
+                "id": chunk_id,
+                "file_id": metadata["file_id"],
+                "user_id": metadata["user_id"],
+                "file_name": metadata["file_name"],
+                "page_number": metadata["page_number"],
+                "content": document,
+            }
+            for chunk_id, document, metadata in zip(
+                batch["ids"], batch["documents"], batch["metadatas"]
+            )
+            # Skip leftovers of deleted files
+            if metadata["file_id"] in file_ids
+        ]
+        add_chunks(chunks)
+        copied += len(chunks)
+
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sharding",
+        default=COLLECTION_SHARDING,
+        choices=["none", "user", "hashed"],
+        help="Target sharding mode, defaults to CHROMA_COLLECTION_SHARDING",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--keep-source", action="store_true")
+    parser.add_argument("--backfill-lexical", action="store_true")
+    args = parser.parse_args()
+
+    for source_name in list_file_collection_names():
+        moved = migrate_collection(
+            source_name,
+            args.sharding,
+            args.batch_size,
+            args.dry_run,
+            args.keep_source,
+        )
+        for target_name, count in moved.items():
+            logger.info(
+                f"{'Would move' if args.dry_run else 'Moved'} {count} chunks "
+                f"from {source_name} to {target_name}"
+            )
+
+    if args.backfill_lexical and not args.dry_run:
+        for collection_name in list_file_collection_names():
+            copied = backfill_lexical(collection_name, args.batch_size)
+            logger.info(f"Copied {copied} chunks from {collection_name} to file_chunks")
+
+    logger.info("Collection migration finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
 import uuid
 import datetime
-from sqlalchemy import JSON, ForeignKey, Integer, String, Boolean, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from typing import Any
+from sqlalchemy import (
+    JSON,
+    Computed,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    DateTime,
+    Text,
+    func,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from backend.database import Base
@@ -20,6 +32,23 @@ class User(Base):
     chat_sessions: Mapped[list["ChatSession"]] = relationship(back_populates="user")
 
 
+class Blob(Base):
+    """
+    Content of uploaded files, stored once and shared by the files with the
+    same sha256.
+    """
+
+    __tablename__ = "blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Number of files referencing the blob, it is removed when it drops to 0
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, server_default=func.localtimestamp()
+    )
+
+
 class File(Base):
     __tablename__ = "files"
 
@@ -32,7 +61,15 @@ class File(Base):
     name: Mapped[str] = mapped_column(String, nullable=False)
     content_type: Mapped[str] = mapped_column(String, nullable=False)
     size: Mapped[int] = mapped_column(Integer, nullable=False)
-    is_indexed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
+    # Blob holding the content, None for files stored under their own id
+    sha256: Mapped[str | None] = mapped_column(
+        String(64), ForeignKey("blobs.sha256"), nullable=True, index=True
+    )
+    # "pending", "processing", "indexed" or "failed", see IndexingJob
+    index_status: Mapped[str] = mapped_column(
+        String, default="pending", server_default="pending", nullable=False
+    )
+    index_error: Mapped[str | None] = mapped_column(Text, nullable=True)
     user: Mapped["User"] = relationship(back_populates="files")
 
 
@@ -70,3 +107,193 @@ class ChatMessage(Base):
     )
     content: Mapped[dict] = mapped_column(JSON, nullable=False)
     session: Mapped["ChatSession"] = relationship(back_populates="messages")
+
+
+class PageAnalysisCacheEntry(Base):
+    __tablename__ = "page_analysis_cache"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[Any] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now
+    )
+    last_used_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now, index=True
+    )
+
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    model: Mapped[str] = mapped_column(String, primary_key=True)
+    dimensions: Mapped[int] = mapped_column(Integer, primary_key=True)
+    text_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # float32 values, 4 bytes per dimension
+    embedding: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now
+    )
+    last_used_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now, index=True
+    )
+
+
+class FileChunk(Base):
+    """
+    Text of the chunks indexed in Chroma, for full-text search.
+    """
+
+    __tablename__ = "file_chunks"
+
+    # Same id as the chunk in Chroma
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), index=True
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), index=True)
+    file_name: Mapped[str] = mapped_column(String, nullable=False)
+    page_number: Mapped[int] = mapped_column(Integer, nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    content_tsv: Mapped[Any] = mapped_column(
+        TSVECTOR, Computed("to_tsvector('english', content)", persisted=True)
+    )
+
+    __table_args__ = (
+        Index("ix_file_chunks_content_tsv", "content_tsv", postgresql_using="gin"),
+    )
+
+
+class ParsedDocumentVersion(Base):
+    """
+    A version of a file that was parsed, identified by the hash of its content.
+    """
+
+    __tablename__ = "parsed_document_versions"
+
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("files.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    version: Mapped[str] = mapped_column(String(64), primary_key=True)
+    stats: Mapped[Any] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now
+    )
+
+
+class StoredDocumentBlock(Base):
+    __tablename__ = "document_blocks"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE")
+    )
+    version: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Order of the block in the document
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    page_num: Mapped[int] = mapped_column(Integer, nullable=False)
+    type: Mapped[str] = mapped_column(String, nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    semantic_content: Mapped[str] = mapped_column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_document_blocks_file_id_version", "file_id", "version"),
+    )
+
+
+class StoredDocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE")
+    )
+    version: Mapped[str] = mapped_column(String(64), nullable=False)
+    chunking_mode: Mapped[str] = mapped_column(String, nullable=False)
+    # Order of the chunk in the document
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    embed: Mapped[str] = mapped_column(Text, nullable=False)
+    # Positions of the chunk's blocks in document_blocks
+    block_positions: Mapped[Any] = mapped_column(JSON, nullable=False)
+    chunk_metadata: Mapped[Any] = mapped_column("metadata", JSON, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_document_chunks_file_id_version_chunking_mode",
+            "file_id",
+            "version",
+            "chunking_mode",
+        ),
+    )
+
+
+class IndexingJob(Base):
+    """
+    A file waiting to be indexed, or being indexed, by a worker.
+    """
+
+    __tablename__ = "indexing_jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), index=True
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    # "queued", "running", "succeeded" or "failed"
+    status: Mapped[str] = mapped_column(String, default="queued", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Queued jobs don't run before this, used for retry backoff
+    run_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, server_default=func.localtimestamp(), nullable=False
+    )
+    # A running job whose worker stops extending this is run again
+    locked_until: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime, nullable=True
+    )
+    locked_by: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now
+    )
+    finished_at: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime, nullable=True
+    )
+
+    __table_args__ = (
+        Index("ix_indexing_jobs_status_run_at", "status", "run_at"),
+        Index("ix_indexing_jobs_user_id_status", "user_id", "status"),
+    )
+
+
+class IndexingPageProgress(Base):
+    """
+    How far indexing a page of a file version got, so an interrupted indexing
+    resumes from the pages it didn't finish.
+    """
+
+    __tablename__ = "indexing_page_progress"
+
+    file_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("files.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    version: Mapped[str] = mapped_column(String(64), primary_key=True)
+    page_num: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # "analyzed", "described", "embedded" or "written"
+    stage: Mapped[str] = mapped_column(String, nullable=False)
+    report: Mapped[Any] = mapped_column(JSON(none_as_null=True), nullable=True)
+    # Blocks of an analyzed page, then chunks of a described page
+    data: Mapped[Any] = mapped_column(JSON(none_as_null=True), nullable=True)
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.now
+    )
@@ -0,0 +1,490 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import openai
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """
+    Priority classes of OpenAI requests. Lower values are served first.
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class RateLimits(BaseModel):
+    """
+    Budgets of all requests to a model, i.e. the organization's rate limits.
+    Each process enforces them on its own, see `OpenAIScheduler`.
+    """
+
+    requests_per_minute: int = Field(description="Maximum requests per minute.")
+    tokens_per_minute: int = Field(
+        description="Maximum input and output tokens per minute."
+    )
+    max_concurrency: int = Field(
+        default=10, description="Maximum number of requests in flight."
+    )
+
+
+# Budgets per model. Override with the OPENAI_RATE_LIMITS environment variable,
+# a JSON object mapping model names to RateLimits fields.
+MODEL_RATE_LIMITS: Dict[str, RateLimits] = {
+    "gpt-4.1-mini-2025-04-14": RateLimits(
+        requests_per_minute=5000, tokens_per_minute=2_000_000
+    ),
+    "text-embedding-3-small": RateLimits(
+        requests_per_minute=5000, tokens_per_minute=1_000_000, max_concurrency=20
+    ),
+}
+DEFAULT_RATE_LIMITS = RateLimits(requests_per_minute=500, tokens_per_minute=200_000)
+
+for _model, _limits in json.loads(os.getenv("OPENAI_RATE_LIMITS", "{}")).items():
+    MODEL_RATE_LIMITS[_model] = RateLimits(**_limits)
+
+# Fraction of each budget (and of the concurrency slots) bulk requests leave
+# untouched, so interactive requests arriving during bulk work don't queue
+OPENAI_BULK_RESERVE_FRACTION = float(os.getenv("OPENAI_BULK_RESERVE_FRACTION", "0.2"))
+# Bulk requests waiting longer than this are served as interactive ones so
+# they can't starve. 0 lets interactive traffic starve bulk requests.
+OPENAI_BULK_MAX_WAIT_SECONDS = float(os.getenv("OPENAI_BULK_MAX_WAIT_SECONDS", "120"))
+# Bulk requests are throttled on rate limit errors, each halving the share of
+# the budgets they use, which then recovers linearly, fully in this time
+OPENAI_BULK_RECOVERY_SECONDS = float(os.getenv("OPENAI_BULK_RECOVERY_SECONDS", "120"))
+# Share of the budgets bulk requests keep using however throttled they are
+BULK_MIN_THROTTLE = 0.1
+
+# The indexing workers only make bulk requests, and share the part of the
+# budgets those leave to interactive ones evenly. The web servers use the
+# whole budgets. Bulk requests from the workers still yield to interactive
+# ones beyond the reserve: those hit the organization's limits, and the
+# workers throttle their requests on the rate limit errors.
+INDEXING_WORKER_PROCESSES = int(os.getenv("INDEXING_WORKER_PROCESSES", "1"))
+WORKER_BUDGET_SHARE = (1 - OPENAI_BULK_RESERVE_FRACTION) / max(
+    1, INDEXING_WORKER_PROCESSES
+)
+
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Tokens assumed for an image part whose size isn't known
+IMAGE_TOKENS_LOW = 85
+IMAGE_TOKENS_HIGH = 765
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+_priority: ContextVar[Priority] = ContextVar(
+    "openai_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def openai_priority(priority: Priority):
+    """
+    Run the OpenAI requests made within the block, including from tasks
+    started within it, with the given priority.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text, about 4 characters per token.
+    """
+    return len(text) // 4 + 1
+
+
+def estimate_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    Rough token count of chat messages, including image parts.
+    """
+    tokens = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                tokens += estimate_tokens(part["text"])
+            elif part["type"] == "image_url":
+                detail = part["image_url"].get("detail", "auto")
+                tokens += IMAGE_TOKENS_LOW if detail == "low" else IMAGE_TOKENS_HIGH
+    return tokens
+
+
+def scale_rate_limits(limits: RateLimits, share: float) -> RateLimits:
+    """
+    Return a share of a model's budgets, leaving at least one request.
+    """
+    return RateLimits(
+        requests_per_minute=max(1, int(limits.requests_per_minute * share)),
+        tokens_per_minute=max(1, int(limits.tokens_per_minute * share)),
+        max_concurrency=max(1, math.ceil(limits.max_concurrency * share)),
+    )
+
+
+class _TokenBucket:
+    """
+    Token bucket refilled continuously up to a per-minute capacity. The level
+    may go negative when actual usage exceeds what was reserved.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` can be taken from the bucket."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, sequence: int, tokens: int):
+        self.priority = priority
+        self.sequence = sequence
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class _ModelState:
+    def __init__(self, limits: RateLimits):
+        self.limits = limits
+        self.requests = _TokenBucket(limits.requests_per_minute)
+        self.tokens = _TokenBucket(limits.tokens_per_minute)
+        # Notified whenever the queue or the requests in flight change
+        self.changed = asyncio.Condition()
+        self.waiters: List[_Waiter] = []
+        self.blocked_until = 0.0
+        # Share of the budgets left to bulk requests after rate limit errors,
+        # and when it was last lowered
+        self.bulk_throttle = 1.0
+        self.bulk_throttled_at = 0.0
+
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.acquired = {priority: 0 for priority in Priority}
+        self.wait_seconds_total = {priority: 0.0 for priority in Priority}
+        self.wait_seconds_max = {priority: 0.0 for priority in Priority}
+
+
+class OpenAIScheduler:
+    """
+    Process-wide scheduler for OpenAI requests.
+
+    Every request waits in a per-model queue until the model's request and
+    token budgets allow it and a concurrency slot is free. Interactive
+    requests are always served before bulk ones, and bulk requests only use
+    the capacity left above a reserved fraction of each budget; bulk requests
+    waiting too long are promoted so they can't starve. Requests of the same
+    priority are served in FIFO order.
+
+    Rate limit, connection and server errors are retried, honouring
+    `Retry-After` and otherwise backing off exponentially with jitter. A 429
+    pauses the whole model queue, not only the failed request, and throttles
+    bulk requests: other processes share the organization's limits, so bulk
+    requests yield to their interactive ones by backing off.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, RateLimits]] = None,
+        default_limits: RateLimits = DEFAULT_RATE_LIMITS,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        bulk_reserve_fraction: float = OPENAI_BULK_RESERVE_FRACTION,
+        bulk_max_wait_seconds: float = OPENAI_BULK_MAX_WAIT_SECONDS,
+        bulk_recovery_seconds: float = OPENAI_BULK_RECOVERY_SECONDS,
+    ):
+        self.limits = MODEL_RATE_LIMITS if limits is None else limits
+        self.default_limits = default_limits
+        self.max_retries = max_retries
+        self.bulk_reserve_fraction = bulk_reserve_fraction
+        self.bulk_max_wait_seconds = bulk_max_wait_seconds
+        self.bulk_recovery_seconds = bulk_recovery_seconds
+        self.budget_share = 1.0
+        self._models: Dict[str, _ModelState] = {}
+        self._sequence = itertools.count()
+
+    def use_budget_share(
+        self, share: float, bulk_reserve_fraction: Optional[float] = None
+    ):
+        """
+        Limit this process to a share of each model's budgets. Call on
+        startup, before any request is made.
+
+        Args:
+            share: Fraction of the budgets, e.g. `WORKER_BUDGET_SHARE`
+            bulk_reserve_fraction: Replaces the fraction of the budgets bulk
+                requests leave to interactive ones, if given
+        """
+        self.budget_share = share
+        if bulk_reserve_fraction is not None:
+            self.bulk_reserve_fraction = bulk_reserve_fraction
+        self._models.clear()
+        logger.info(f"Using {share:.0%} of the OpenAI rate limits")
+
+    def _state(self, model: str) -> _ModelState:
+        if model not in self._models:
+            limits = self.limits.get(model, self.default_limits)
+            if self.budget_share != 1.0:
+                limits = scale_rate_limits(limits, self.budget_share)
+            self._models[model] = _ModelState(limits)
+        return self._models[model]
+
+    def _effective_priority(self, waiter: _Waiter, now: float) -> Priority:
+        if (
+            waiter.priority == Priority.BULK
+            and self.bulk_max_wait_seconds > 0
+            and now - waiter.enqueued_at >= self.bulk_max_wait_seconds
+        ):
+            return Priority.INTERACTIVE
+        return waiter.priority
+
+    def _bulk_throttle(self, state: _ModelState, now: float) -> float:
+        """
+        Share of the budgets bulk requests may use, recovering from the last
+        rate limit error.
+        """
+        if self.bulk_recovery_seconds <= 0:
+            return 1.0
+        recovered = (now - state.bulk_throttled_at) / self.bulk_recovery_seconds
+        return min(1.0, state.bulk_throttle + recovered)
+
+    def _throttle_bulk(self, state: _ModelState):
+        now = time.monotonic()
+        state.bulk_throttle = max(
+            BULK_MIN_THROTTLE, self._bulk_throttle(state, now) / 2
+        )
+        state.bulk_throttled_at = now
+
+    def _delay(
+        self, state: _ModelState, waiter: _Waiter, now: float
+    ) -> Optional[float]:
+        """
+        Seconds until the budgets allow the waiter's request, or None if it
+        has to wait for a request in flight to complete.
+        """
+        available = 1.0
+        if self._effective_priority(waiter, now) == Priority.BULK:
+            available -= self.bulk_reserve_fraction
+        if waiter.priority == Priority.BULK:
+            # Even once promoted, so bulk requests keep yielding to the
+            # interactive ones of other processes
+            available *= self._bulk_throttle(state, now)
+        reserve = 1.0 - available
+        max_concurrency = state.limits.max_concurrency
+        max_concurrency -= math.ceil(max_concurrency * reserve)
+        if state.in_flight >= max(1, max_concurrency):
+            return None
+
+        return max(
+            state.blocked_until - now,
+            state.requests.delay(1 + reserve * state.requests.capacity),
+            state.tokens.delay(waiter.tokens + reserve * state.tokens.capacity),
+        )
+
+    async def _acquire(self, state: _ModelState, tokens: int, priority: Priority):
+        waiter = _Waiter(priority, next(self._sequence), tokens)
+        async with state.changed:
+            state.waiters.append(waiter)
+            # Let a blocked head of the queue know it may have been overtaken
+            state.changed.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    head = min(
+                        state.waiters,
+                        key=lambda w: (self._effective_priority(w, now), w.sequence),
+                    )
+                    if head is waiter:
+                        timeout = self._delay(state, waiter, now)
+                        if timeout is not None and timeout <= 0:
+                            break
+                    elif self._effective_priority(waiter, now) == Priority.BULK:
+                        # Wake up when promoted, the head may not notify
+                        timeout = (
+                            waiter.enqueued_at + self.bulk_max_wait_seconds - now
+                            if self.bulk_max_wait_seconds > 0
+                            else None
+                        )
+                    else:
+                        timeout = None
+
+                    try:
+                        await asyncio.wait_for(state.changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                state.waiters.remove(waiter)
+                state.changed.notify_all()
+
+            state.requests.take(1)
+            state.tokens.take(tokens)
+            state.in_flight += 1
+
+        wait = time.monotonic() - waiter.enqueued_at
+        state.acquired[priority] += 1
+        state.wait_seconds_total[priority] += wait
+        state.wait_seconds_max[priority] = max(state.wait_seconds_max[priority], wait)
+
+    async def _release(self, state: _ModelState):
+        async with state.changed:
+            state.in_flight -= 1
+            state.changed.notify_all()
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        if response is not None:
+            headers = response.headers
+            try:
+                if "retry-after-ms" in headers:
+                    return float(headers["retry-after-ms"]) / 1000
+                if "retry-after" in headers:
+                    return float(headers["retry-after"])
+            except ValueError:
+                # Retry-After can also be an HTTP date, fall back to backoff
+                pass
+
+        backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    async def run(
+        self,
+        model: str,
+        request: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        priority: Optional[Priority] = None,
+    ) -> T:
+        """
+        Run an OpenAI request within the model's budgets.
+
+        Args:
+            model: Model the request is made to
+            request: Function making the request, called again on retries
+            estimated_tokens: Tokens the request is expected to use, including
+                output tokens. Corrected with the actual usage reported in the
+                response when available.
+            priority: Priority class of the request. Defaults to the one set
+                with `openai_priority`, or interactive.
+
+        Returns:
+            The response of the request
+        """
+        if priority is None:
+            priority = _priority.get()
+        state = self._state(model)
+        attempt = 0
+        while True:
+            await self._acquire(state, estimated_tokens, priority)
+            try:
+                response = await request()
+            except RETRYABLE_ERRORS as e:
+                await self._release(state)
+                attempt += 1
+                if attempt > self.max_retries:
+                    state.failed += 1
+                    raise
+
+                delay = self._retry_delay(e, attempt)
+                if isinstance(e, openai.RateLimitError):
+                    state.rate_limited += 1
+                    state.blocked_until = max(
+                        state.blocked_until, time.monotonic() + delay
+                    )
+                    self._throttle_bulk(state)
+                state.retries += 1
+                logger.warning(
+                    f"OpenAI request to {model} failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt})"
+                )
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                await self._release(state)
+                state.failed += 1
+                raise
+
+            await self._release(state)
+            state.completed += 1
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                state.tokens.take(usage.total_tokens - estimated_tokens)
+            return response
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue depth, wait times and request counters per model.
+        """
+        metrics = {}
+        for model, state in self._models.items():
+            metrics[model] = {
+                "queue_depth": len(state.waiters),
+                "in_flight": state.in_flight,
+                "completed": state.completed,
+                "failed": state.failed,
+                "retries": state.retries,
+                "rate_limited": state.rate_limited,
+                "bulk_throttle": self._bulk_throttle(state, time.monotonic()),
+            }
+            for priority in Priority:
+                name = priority.name.lower()
+                acquired = state.acquired[priority]
+                metrics[model][name] = {
+                    "queue_depth": sum(
+                        waiter.priority == priority for waiter in state.waiters
+                    ),
+                    "wait_seconds_avg": (
+                        state.wait_seconds_total[priority] / acquired
+                        if acquired
+                        else 0.0
+                    ),
+                    "wait_seconds_max": state.wait_seconds_max[priority],
+                }
+        return metrics
+
+
+openai_scheduler = OpenAIScheduler()
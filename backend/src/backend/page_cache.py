@@ -0,0 +1,116 @@
+import datetime
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+
+from backend.database import SessionLocal
+from backend.models import PageAnalysisCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum number of entries kept in the cache. Least recently used entries are
+# evicted once the cache grows past this.
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "100000"))
+# Number of writes between eviction passes
+PAGE_CACHE_EVICT_EVERY = 100
+
+
+def page_cache_key(kind: str, *parts: str) -> str:
+    """
+    Build a content-addressed cache key from the kind of cached value and the
+    inputs that produced it (model, prompt version, page text, page image...).
+    """
+    digest = hashlib.sha256(kind.encode("utf-8"))
+    for part in parts:
+        encoded = part.encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class PageAnalysisCache:
+    """
+    Persistent cache of LLM page analysis results, stored in Postgres.
+
+    Values are keyed by a hash of everything that went into producing them,
+    so re-uploads and unchanged pages of revised documents reuse earlier
+    results. Cache errors are logged and treated as misses, they never fail
+    parsing.
+    """
+
+    def __init__(self, max_entries: int = PAGE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        db = SessionLocal()
+        try:
+            entry = db.get(PageAnalysisCacheEntry, key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry.last_used_at = datetime.datetime.now()
+            db.commit()
+            self.hits += 1
+            return entry.value
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error reading page analysis cache: {str(e)}")
+            self.misses += 1
+            return None
+        finally:
+            db.close()
+
+    def put(self, key: str, value: Any):
+        db = SessionLocal()
+        try:
+            db.merge(
+                PageAnalysisCacheEntry(
+                    key=key, value=value, last_used_at=datetime.datetime.now()
+                )
+            )
+            db.commit()
+
+            self._writes += 1
+            if self._writes % PAGE_CACHE_EVICT_EVERY == 0:
+                self._evict(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error writing page analysis cache: {str(e)}")
+        finally:
+            db.close()
+
+    def _evict(self, db):
+        count = db.query(PageAnalysisCacheEntry).count()
+        if count <= self.max_entries:
+            return
+
+        stale_keys = (
+            select(PageAnalysisCacheEntry.key)
+            .order_by(PageAnalysisCacheEntry.last_used_at.asc())
+            .limit(count - self.max_entries)
+        )
+        db.query(PageAnalysisCacheEntry).filter(
+            PageAnalysisCacheEntry.key.in_(stale_keys)
+        ).delete(synchronize_session=False)
+        db.commit()
+        logger.info(f"Evicted {count - self.max_entries} page analysis cache entries")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+page_analysis_cache = PageAnalysisCache()
@@ -0,0 +1,262 @@
+import base64
+import hashlib
+import math
+import os
+from typing import Any, Dict, Literal, Tuple
+
+import pymupdf
+from PIL import Image
+from pydantic import BaseModel, Field
+
+
+# OpenAI vision models bill high detail images in 512px tiles after fitting
+# the image in a 2048px square and scaling its shortest side down to 768px
+IMAGE_TILE_SIZE = 512
+IMAGE_MAX_SIZE = 2048
+IMAGE_MAX_SHORT_SIDE = 768
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+
+# Scale of the thumbnails used to fingerprint pages
+FINGERPRINT_SCALE = 0.25
+# Pixels darker than the page background by more than this count as ink
+BLANK_INK_THRESHOLD = 60
+# Maximum fraction of ink pixels on a page without text to be considered blank
+BLANK_MAX_INK_FRACTION = 0.001
+
+
+class PageImagePolicy(BaseModel):
+    """
+    How page images sent to the vision model are rendered and encoded.
+    """
+
+    dense_text_density: float = Field(
+        default=25.0,
+        description="""Text density (characters per square inch) from which a
+        page is rendered at full resolution and higher JPEG quality to keep
+        small glyphs legible.""",
+    )
+    dense_short_side: int = Field(
+        default=IMAGE_MAX_SHORT_SIDE,
+        description="Target shortest side in pixels for dense pages.",
+    )
+    sparse_short_side: int = Field(
+        default=IMAGE_TILE_SIZE,
+        description="Target shortest side in pixels for sparse pages.",
+    )
+    min_dpi: float = Field(default=36, description="Lowest rendering DPI.")
+    max_dpi: float = Field(default=150, description="Highest rendering DPI.")
+    dense_jpeg_quality: int = Field(
+        default=85, description="JPEG quality for dense pages."
+    )
+    jpeg_quality: int = Field(default=70, description="JPEG quality for other pages.")
+    tile_snap_tolerance: float = Field(
+        default=0.15,
+        description="""Maximum fraction the image may be shrunk by to fit one
+        fewer row or column of tiles.""",
+    )
+    grayscale: bool = Field(
+        default=True, description="Render monochrome pages in grayscale."
+    )
+    grayscale_max_colored_fraction: float = Field(
+        default=0.002,
+        description="""Maximum fraction of saturated pixels for a page to be
+        considered monochrome.""",
+    )
+    low_detail_text_pages: bool = Field(
+        default=True,
+        description="""Send pages that are mostly text with `detail: low`. The
+        text layer is sent alongside, so the image only conveys layout.""",
+    )
+    low_detail_min_text_chars: int = Field(
+        default=200,
+        description="Minimum number of characters for a page to be mostly text.",
+    )
+
+
+PAGE_IMAGE_POLICY = PageImagePolicy(
+    low_detail_text_pages=(
+        os.getenv("PAGE_IMAGE_LOW_DETAIL_TEXT_PAGES", "true").lower() == "true"
+    ),
+    grayscale=os.getenv("PAGE_IMAGE_GRAYSCALE", "true").lower() == "true",
+)
+
+
+def estimate_image_tokens(
+    width: int, height: int, detail: Literal["low", "high"]
+) -> int:
+    """
+    Estimate the number of input tokens an image costs.
+    """
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+
+    width, height = _fit_for_model(width, height)
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def _fit_for_model(width: float, height: float) -> Tuple[float, float]:
+    """
+    Apply the downscaling the API applies to high detail images.
+    """
+    scale = min(1.0, IMAGE_MAX_SIZE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, IMAGE_MAX_SHORT_SIDE / min(width, height))
+    return width * scale, height * scale
+
+
+def _snap_to_tiles(width: float, height: float, tolerance: float) -> float:
+    """
+    Return the scale that drops a row or column of tiles from an image, if
+    that shrinks it by less than `tolerance`, otherwise 1.
+    """
+    long_side = max(width, height)
+    snapped = math.floor(long_side / IMAGE_TILE_SIZE) * IMAGE_TILE_SIZE
+    if snapped == 0 or snapped == long_side:
+        return 1.0
+    scale = snapped / long_side
+    return scale if 1 - scale <= tolerance else 1.0
+
+
+def _is_monochrome(page: pymupdf.Page, max_colored_fraction: float) -> bool:
+    """
+    Check whether a page is monochrome from a small thumbnail rendering.
+    """
+    thumbnail = page.get_pixmap(matrix=pymupdf.Matrix(0.25, 0.25), alpha=False)
+    image = Image.frombytes(
+        "RGB", (thumbnail.width, thumbnail.height), thumbnail.samples
+    )
+    saturation = image.convert("HSV").getchannel("S").histogram()
+    # Ignore the faint saturation of anti-aliased edges
+    colored = sum(saturation[48:])
+    return colored <= max_colored_fraction * thumbnail.width * thumbnail.height
+
+
+def render_page_image(
+    page: pymupdf.Page,
+    text: str,
+    has_graphics: bool,
+    policy: PageImagePolicy = PAGE_IMAGE_POLICY,
+) -> Dict[str, Any]:
+    """
+    Render a page to a base64 encoded JPEG according to an image policy.
+
+    Resolution and quality are chosen from the page size and text density,
+    monochrome pages are rendered in grayscale, and high detail images are
+    shrunk to tile boundaries when that saves a row or column of tiles.
+
+    Args:
+        page: A pymupdf.Page object
+        text: Text content of the page
+        has_graphics: Whether the page contains images or vector drawings
+        policy: Image policy to apply
+
+    Returns:
+        A dictionary with the base64 encoded image, the `detail` to send it
+        with, and statistics about the rendered image
+    """
+    width_in = page.rect.width / 72
+    height_in = page.rect.height / 72
+    text_chars = len(text.strip())
+    text_density = text_chars / (width_in * height_in)
+    is_dense = text_density >= policy.dense_text_density
+
+    detail = "high"
+    if (
+        policy.low_detail_text_pages
+        and not has_graphics
+        and text_chars >= policy.low_detail_min_text_chars
+    ):
+        detail = "low"
+
+    if detail == "low":
+        # Low detail images are always scaled to fit in one tile
+        dpi = IMAGE_TILE_SIZE / max(width_in, height_in)
+        quality = policy.jpeg_quality
+    else:
+        short_side = policy.dense_short_side if is_dense else policy.sparse_short_side
+        dpi = short_side / min(width_in, height_in)
+        dpi *= _snap_to_tiles(
+            width_in * dpi, height_in * dpi, policy.tile_snap_tolerance
+        )
+        quality = policy.dense_jpeg_quality if is_dense else policy.jpeg_quality
+    dpi = max(policy.min_dpi, min(policy.max_dpi, dpi))
+
+    grayscale = policy.grayscale and _is_monochrome(
+        page, policy.grayscale_max_colored_fraction
+    )
+    pix = page.get_pixmap(
+        matrix=pymupdf.Matrix(dpi / 72, dpi / 72),
+        colorspace=pymupdf.csGRAY if grayscale else pymupdf.csRGB,
+        alpha=False,
+    )
+    img_bytes = pix.tobytes("jpeg", jpg_quality=quality)
+
+    return {
+        "image_base64": base64.b64encode(img_bytes).decode("utf-8"),
+        "image_detail": detail,
+        "image_stats": {
+            "width": pix.width,
+            "height": pix.height,
+            "dpi": round(dpi, 1),
+            "grayscale": grayscale,
+            "quality": quality,
+            "detail": detail,
+            "bytes": len(img_bytes),
+            "estimated_tokens": estimate_image_tokens(pix.width, pix.height, detail),
+        },
+    }
+
+
+def page_fingerprint(page: pymupdf.Page) -> Dict[str, Any]:
+    """
+    Fingerprint a page to find blank and duplicate pages before analysis.
+
+    Args:
+        page: A pymupdf.Page object
+
+    Returns:
+        A dictionary with whether the page is blank, a 64-bit difference hash
+        of its rendering, a hash of its rendered pixels, whether it has text,
+        and a hash of its normalized text
+    """
+    text = " ".join(page.get_text().split()).lower()
+    thumbnail = page.get_pixmap(
+        matrix=pymupdf.Matrix(FINGERPRINT_SCALE, FINGERPRINT_SCALE),
+        colorspace=pymupdf.csGRAY,
+        alpha=False,
+    )
+    image = Image.frombytes(
+        "L", (thumbnail.width, thumbnail.height), thumbnail.samples
+    )
+
+    # Compare against the page background rather than pure white, so scanned
+    # pages with a tinted background can still be blank
+    histogram = image.histogram()
+    pixel_count = thumbnail.width * thumbnail.height
+    cumulative = 0
+    for background, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= pixel_count / 2:
+            break
+    ink = sum(histogram[: max(0, background - BLANK_INK_THRESHOLD)])
+    blank = not text and ink <= BLANK_MAX_INK_FRACTION * pixel_count
+
+    # Difference hash: whether each pixel of a 9x8 downscale is brighter than
+    # its right neighbour
+    pixels = list(image.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    image_hash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            image_hash = (image_hash << 1) | (left > right)
+
+    return {
+        "blank": blank,
+        "image_hash": image_hash,
+        "pixel_hash": hashlib.sha256(thumbnail.samples).hexdigest(),
+        "has_text": bool(text),
+        "text_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+    }
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import statistics
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from backend.chroma import embed_queries, search_vector_db
+from backend.rerank import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+# Fraction of chat messages for which retrieval is started as soon as the
+# message arrives, concurrently with the agent run. 0 disables prefetching, a
+# value in between compares time to first token with and without it.
+CHAT_RETRIEVAL_PREFETCH_FRACTION = float(
+    os.getenv("CHAT_RETRIEVAL_PREFETCH_FRACTION", "0")
+)
+# Fraction of the tool query's terms found in the message from which the
+# prefetched results are used without comparing embeddings
+PREFETCH_MIN_TERM_OVERLAP = 0.8
+# Cosine similarity between the tool query and the message from which the
+# prefetched results are used
+PREFETCH_MIN_SIMILARITY = float(os.getenv("PREFETCH_MIN_SIMILARITY", "0.85"))
+# Long messages are cut to this many characters to be used as a query
+PREFETCH_MAX_QUERY_CHARS = 2000
+# Number of time to first token samples kept per mode
+TTFT_SAMPLES = 1000
+
+
+class RetrievalPrefetch:
+    """
+    Retrieval started for a chat message before the agent asks for it.
+    """
+
+    def __init__(self, message: str, user_id: uuid.UUID, top_k: int):
+        self.query = " ".join(message.split())[:PREFETCH_MAX_QUERY_CHARS]
+        self.user_id = str(user_id)
+        self.top_k = top_k
+        self._results = asyncio.create_task(
+            search_vector_db(self.query, top_k=top_k, user_id=user_id)
+        )
+
+    async def match(
+        self, query: str, user_id: str, top_k: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return the prefetched results if they answer a search well enough
+
+        Args:
+            query: The query the agent searches for
+            user_id: The user the agent searches for
+            top_k: The number of results the agent asks for
+
+        Returns:
+            The prefetched results, or None if the search must be run
+        """
+        if str(user_id) != self.user_id or top_k != self.top_k:
+            return None
+
+        query = " ".join(query.split())
+        query_terms = set(tokenize(query))
+        overlap = len(query_terms & set(tokenize(self.query))) / max(
+            len(query_terms), 1
+        )
+        if overlap < PREFETCH_MIN_TERM_OVERLAP:
+            # The message's embedding is cached by the prefetch search
+            query_embedding, message_embedding = await embed_queries(
+                [query, self.query]
+            )
+            # OpenAI embeddings have unit length
+            similarity = sum(a * b for a, b in zip(query_embedding, message_embedding))
+            if similarity < PREFETCH_MIN_SIMILARITY:
+                chat_latency.prefetch_misses += 1
+                return None
+
+        try:
+            results = await self._results
+        except Exception as e:
+            logger.error(f"Error prefetching context: {str(e)}")
+            chat_latency.prefetch_misses += 1
+            return None
+
+        chat_latency.prefetch_hits += 1
+        return results
+
+    def cancel(self):
+        self._results.cancel()
+
+
+# Prefetch for the chat message the agent is currently answering
+current_prefetch: ContextVar[Optional[RetrievalPrefetch]] = ContextVar(
+    "current_prefetch", default=None
+)
+
+
+class ChatLatencyStats:
+    """
+    Time to first token of agent answers, with and without prefetching.
+    """
+
+    def __init__(self):
+        self.ttft = {
+            "prefetch": deque(maxlen=TTFT_SAMPLES),
+            "no_prefetch": deque(maxlen=TTFT_SAMPLES),
+        }
+        self.prefetch_hits = 0
+        self.prefetch_misses = 0
+
+    def record_ttft(self, seconds: float, prefetch: bool):
+        self.ttft["prefetch" if prefetch else "no_prefetch"].append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        ttft = {}
+        for mode, samples in self.ttft.items():
+            samples = sorted(samples)
+            ttft[mode] = {
+                "count": len(samples),
+                "p50_ms": statistics.median(samples) * 1000 if samples else None,
+                "p95_ms": (
+                    samples[int(0.95 * (len(samples) - 1))] * 1000 if samples else None
+                ),
+            }
+        return {
+            "ttft": ttft,
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_misses": self.prefetch_misses,
+        }
+
+
+chat_latency = ChatLatencyStats()
@@ -0,0 +1,258 @@
+import asyncio
+import importlib
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+# Number of candidates retrieved for re-ranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+# Scorer used to re-rank candidates: "none" to disable re-ranking, "lexical"
+# for the built-in scorer, or "package.module:ClassName" for a custom one
+RERANK_SCORER = os.getenv("RERANK_SCORER", "lexical")
+# Candidates keep their retrieval order if scoring takes longer than this
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "50"))
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class Scorer(Protocol):
+    """
+    Scores retrieved chunks against a query, higher is more relevant.
+    """
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]: ...
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalSimilarityScorer:
+    """
+    Combines BM25 over the candidate set with the vector similarity from
+    retrieval. Needs no model, so it works offline.
+
+    Query terms containing digits (identifiers, part numbers...) get an extra
+    boost, since embeddings are poor at matching them exactly.
+    """
+
+    def __init__(
+        self,
+        lexical_weight: float = 0.5,
+        semantic_weight: float = 0.5,
+        identifier_boost: float = 2.0,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.lexical_weight = lexical_weight
+        self.semantic_weight = semantic_weight
+        self.identifier_boost = identifier_boost
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> List[float]:
+        query_terms = set(tokenize(query))
+        documents = [Counter(tokenize(c["content"])) for c in candidates]
+        if not documents:
+            return []
+
+        # Document frequencies and lengths are taken from the candidates, which
+        # are all about the query's topic, so generic terms get a low weight
+        average_length = sum(sum(d.values()) for d in documents) / len(documents)
+        document_frequency = Counter(
+            term for document in documents for term in query_terms & document.keys()
+        )
+
+        lexical_scores = []
+        for document in documents:
+            length_norm = 1 - self.b + self.b * sum(document.values()) / max(
+                average_length, 1
+            )
+            score = 0.0
+            for term in query_terms & document.keys():
+                idf = math.log(
+                    1
+                    + (len(documents) - document_frequency[term] + 0.5)
+                    / (document_frequency[term] + 0.5)
+                )
+                tf = document[term]
+                term_score = idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+                if any(char.isdigit() for char in term):
+                    term_score *= self.identifier_boost
+                score += term_score
+            lexical_scores.append(score)
+
+        semantic_scores = [self._similarity(c) for c in candidates]
+        known = [s for s in semantic_scores if s is not None]
+        # Chunks found only by full-text search have no distance
+        fallback = min(known) if known else 0.0
+        semantic_scores = [fallback if s is None else s for s in semantic_scores]
+
+        lexical_scores = _min_max(lexical_scores)
+        semantic_scores = _min_max(semantic_scores)
+        return [
+            self.lexical_weight * lexical + self.semantic_weight * semantic
+            for lexical, semantic in zip(lexical_scores, semantic_scores)
+        ]
+
+    @staticmethod
+    def _similarity(candidate: Dict[str, Any]) -> float | None:
+        distance = candidate.get("distance")
+        if distance is None:
+            return None
+        # Chroma returns squared L2 distances, OpenAI embeddings have unit
+        # length so this is their cosine similarity
+        return 1 - distance / 2
+
+
+def _min_max(scores: List[float]) -> List[float]:
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [0.0] * len(scores)
+    return [(score - low) / (high - low) for score in scores]
+
+
+SCORERS = {"lexical": LexicalSimilarityScorer}
+
+
+def load_scorer(name: str = RERANK_SCORER) -> Scorer | None:
+    """
+    Create the scorer named by RERANK_SCORER
+
+    Args:
+        name: "none", a built-in scorer name or "package.module:ClassName"
+
+    Returns:
+        The scorer, or None if re-ranking is disabled
+    """
+    if name == "none":
+        return None
+    if name in SCORERS:
+        return SCORERS[name]()
+
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+reranker = load_scorer()
+
+# Scoring runs on its own thread, one call at a time. A thread can't be
+# stopped when scoring overruns its budget, so overrunning calls must not
+# take up threads of the default executor, which embeddings and full-text
+# searches need.
+_scoring_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+# Last call that overran its budget, later calls don't queue up behind it
+_overrunning: Optional[Future] = None
+# Number of calls submitted to the executor and not done yet
+_queued = 0
+_queued_lock = threading.Lock()
+
+
+def _dequeue(future: Future):
+    global _queued
+    with _queued_lock:
+        _queued -= 1
+
+
+def _mark_started(started: asyncio.Future):
+    if not started.done():
+        started.set_result(time.perf_counter())
+
+
+async def rerank(
+    query: str,
+    candidates: List[Dict[str, Any]],
+    top_k: int,
+    scorer: Scorer | None = reranker,
+    budget_ms: float = RERANK_BUDGET_MS,
+) -> List[Dict[str, Any]]:
+    """
+    Re-score retrieved chunks and keep the best ones
+
+    Args:
+        query: The search query
+        candidates: Retrieved chunks, best first
+        top_k: Number of chunks to keep
+        scorer: Scorer to use, candidates are kept in order if None
+        budget_ms: Time allowed for scoring, from when it starts. Candidates
+            are kept in order if scoring takes longer, if the calls queued
+            ahead of it took longer than their own budgets, or while an
+            earlier call that overran its budget is still scoring
+
+    Returns:
+        The top_k most relevant chunks, with their re-ranking score
+    """
+    if scorer is None or len(candidates) <= 1:
+        return candidates[:top_k]
+
+    global _overrunning, _queued
+    if _overrunning is not None and not _overrunning.done():
+        logger.warning("Re-ranking is still overrunning, keeping retrieval order")
+        return candidates[:top_k]
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+
+    def score() -> List[float]:
+        loop.call_soon_threadsafe(_mark_started, started)
+        return scorer.score(query, candidates)
+
+    budget = budget_ms / 1000
+    with _queued_lock:
+        ahead = _queued
+        _queued += 1
+    # Scoring is CPU bound, keep it off the event loop
+    scoring = _scoring_executor.submit(score)
+    scoring.add_done_callback(_dequeue)
+    try:
+        # Concurrent searches queue up for the scoring thread, and each of the
+        # calls ahead is given its own budget
+        await asyncio.wait_for(started, (ahead + 1) * budget)
+    except asyncio.TimeoutError:
+        # Dropped if it still hasn't started
+        if not scoring.cancel():
+            _overrunning = scoring
+        logger.warning(
+            f"Re-ranking waited for {ahead} earlier calls longer than their "
+            "budgets, keeping retrieval order"
+        )
+        return candidates[:top_k]
+
+    try:
+        # A running call can't be stopped
+        scores = await asyncio.wait_for(
+            asyncio.wrap_future(scoring),
+            max(0.0, started.result() + budget - time.perf_counter()),
+        )
+    except asyncio.TimeoutError:
+        _overrunning = scoring
+        logger.warning(
+            f"Re-ranking {len(candidates)} candidates exceeded {budget_ms}ms, "
+            "keeping retrieval order"
+        )
+        return candidates[:top_k]
+    except Exception as e:
+        logger.error(f"Error re-ranking candidates: {str(e)}")
+        return candidates[:top_k]
+
+    ranked = sorted(
+        zip(scores, range(len(candidates))), key=lambda pair: pair[0], reverse=True
+    )
+    results = [
+        {**candidates[i], "rerank_score": score} for score, i in ranked[:top_k]
+    ]
+    logger.debug(
+        f"Re-ranked {len(candidates)} candidates in "
+        f"{(time.perf_counter() - start) * 1000:.1f}ms"
+    )
+    return results
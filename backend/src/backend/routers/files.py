@@ -1,28 +1,39 @@
+import asyncio
+import logging
 import os
-from typing import Annotated
+from typing import Annotated, Literal
 import uuid
-from backend.database import db_dependency, SessionLocal
-from backend.document_parser import parse_pdf
+from backend.blob_store import (
+    BLOB_DIR,
+    add_blob_ref,
+    file_path,
+    release_blob,
+    remove_unreferenced_blob,
+    store_blob,
+)
+from backend.database import db_dependency
+from backend.document_store import load_or_parse_document
+from backend.indexing_events import notify_file_deleted, publish_file_status
+from backend.job_queue import indexing_queue
 from backend.models import File, User
+from backend.search_cache import corpus_versions
+from backend.uploads import store_upload
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
     UploadFile,
     status,
-    BackgroundTasks,
 )
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
 from backend.routers.auth import get_current_user
-from backend.chroma import add_file_to_chromadb, delete_file_from_chromadb
-
+from backend.chroma import delete_file_from_chromadb
 
-UPLOAD_DIR = "files"
-
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter(prefix="/files", tags=["files"])
@@ -33,34 +44,26 @@ class FileMetadataResponse(BaseModel):
     name: str
     content_type: str
     size: int
-    is_indexed: bool | None
+    index_status: str
+    index_error: str | None
 
 
-async def index_file_in_background(file: File, file_path: str):
-    """Background task to index a file in ChromaDB"""
-    try:
-        # Add file to ChromaDB
-        await add_file_to_chromadb(
-            file=file,
-            file_path=file_path,
-        )
-
-        # Mark the file as indexed in the database
-        db = SessionLocal()
-        try:
-            db_file = db.query(File).filter(File.id == file.id).first()
-            if db_file:
-                db_file.is_indexed = True
-                db.commit()
-        except Exception as e:
-            db.rollback()
-            print(f"Error updating file indexed status: {str(e)}")
-        finally:
-            db.close()
+def remove_file(db: Session, file: File):
+    """
+    Delete a file's record, and its content once no other file references it.
+    """
+    sha256 = file.sha256
+    path = file_path(file)
+    db.delete(file)
+    db.flush()
+    unreferenced = release_blob(db, sha256)
+    db.commit()
 
-    except Exception as e:
-        # Log the error but continue - background task shouldn't fail
-        print(f"Error adding file to ChromaDB in background: {str(e)}")
+    # Only once the deletion is committed
+    if unreferenced:
+        remove_unreferenced_blob(db, sha256)
+    elif sha256 is None and os.path.exists(path):
+        os.remove(path)
 
 
 @router.get("", response_model=list[FileMetadataResponse])
@@ -79,53 +82,59 @@ async def list_files(
 )
 async def upload_file(
     file: UploadFile,
-    background_tasks: BackgroundTasks,
     current_user: Annotated[User, Depends(get_current_user)],
     db: db_dependency,
 ):
+    # Streamed to a temporary file, the upload is recorded and moved to its
+    # blob only once it was completely received
+    upload = await store_upload(file, BLOB_DIR)
     try:
-        content = await file.read()
+        # Identical uploads share a blob, and the worker shares the chunks of
+        # an indexed copy instead of indexing it again
+        add_blob_ref(db, upload)
 
         new_file = File(
             user_id=current_user.id,
             name=file.filename,
             content_type=file.content_type,
-            size=len(content),
-            is_indexed=False,
+            size=upload.size,
+            sha256=upload.sha256,
         )
-
         db.add(new_file)
+        # Indexing runs in the worker processes, see backend.worker
+        indexing_queue.enqueue(db, new_file)
+        # In place before the job is committed and a worker can claim it
+        store_blob(db, upload)
         db.commit()
         db.refresh(new_file)
-
-        file_path = os.path.join(UPLOAD_DIR, str(new_file.id))
-        with open(file_path, "wb") as f:
-            f.write(content)
-
-        # Schedule ChromaDB indexing as a background task
-        background_tasks.add_task(
-            index_file_in_background,
-            file=new_file,
-            file_path=file_path,
-        )
-
-        return new_file
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create file record",
-        )
     except Exception as e:
-        if "new_file" in locals() and new_file.id:
-            db.delete(new_file)
-            db.commit()
-
+        db.rollback()
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+        else:
+            # Moved to its blob, but not recorded
+            try:
+                remove_unreferenced_blob(db, upload.sha256)
+            except Exception as cleanup_error:
+                db.rollback()
+                logger.error(
+                    f"Error removing blob {upload.sha256[:12]} after failed "
+                    f"upload: {str(cleanup_error)}"
+                )
+
+        if isinstance(e, SQLAlchemyError):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create file record",
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload file: {str(e)}",
         )
 
+    publish_file_status(new_file.id, new_file.user_id, "pending")
+    return new_file
+
 
 @router.get("/{file_id}/download")
 async def download_file(
@@ -146,16 +155,14 @@ async def download_file(
             detail="Not authorized to access this file",
         )
 
-    file_path = os.path.join(UPLOAD_DIR, str(file_id))
-    if not os.path.exists(file_path):
+    path = file_path(file)
+    if not os.path.exists(path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File content not found",
         )
 
-    return FileResponse(
-        path=file_path, media_type=file.content_type, filename=file.name
-    )
+    return FileResponse(path=path, media_type=file.content_type, filename=file.name)
 
 
 @router.delete("/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -178,14 +185,16 @@ async def delete_file(
         )
 
     try:
-        db.delete(file)
-        db.commit()
-
-        file_path = os.path.join(UPLOAD_DIR, str(file_id))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-        await delete_file_from_chromadb(file_id)
+        remove_file(db, file)
+        # Each file has its own copy of the chunks, even when it shares its
+        # content with other files
+        await delete_file_from_chromadb(file_id, current_user.id)
+        corpus_versions.bump(current_user.id)
+        # The other web servers cache search results too
+        try:
+            await asyncio.to_thread(notify_file_deleted, file_id, current_user.id)
+        except Exception as e:
+            logger.error(f"Error notifying deletion of file {file_id}: {str(e)}")
 
         return None
 
@@ -202,6 +211,7 @@ async def parse_file(
     file_id: uuid.UUID,
     current_user: Annotated[User, Depends(get_current_user)],
     db: db_dependency,
+    chunking_mode: Literal["page", "block"] = "page",
 ):
     file = db.query(File).filter(File.id == file_id).first()
 
@@ -216,16 +226,17 @@ async def parse_file(
             detail="Not authorized to access this file",
         )
 
-    file_path = os.path.join(UPLOAD_DIR, str(file_id))
-    if not os.path.exists(file_path):
+    path = file_path(file)
+    if not os.path.exists(path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File content not found",
         )
 
-    with open(file_path, "rb") as f:
+    with open(path, "rb") as f:
         pdf_bytes = f.read()
 
-    parsed_document = await parse_pdf(pdf_bytes)
+    # Served from storage when this version of the file was already parsed
+    parsed_document = await load_or_parse_document(file_id, pdf_bytes, chunking_mode)
 
     return parsed_document
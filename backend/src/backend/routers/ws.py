@@ -1,8 +1,15 @@
 import asyncio
 import json
-import os
+import random
+import time
 import uuid
-from agents import Agent, ModelSettings, Runner, function_tool
+from agents import (
+    Agent,
+    ModelSettings,
+    Runner,
+    function_tool,
+    set_default_openai_client,
+)
 from backend.routers.chat import list_session_messages, save_message
 import jwt
 from typing import Annotated, Any
@@ -18,8 +25,16 @@ from backend.database import db_dependency
 from backend.routers.auth import get_user, TokenData
 from backend.routers.auth import SECRET_KEY, ALGORITHM
 from backend.models import ChatMessage, User
-from backend.chroma import search_vector_db
-from openai import AsyncOpenAI
+from backend.chroma import search_vector_db, search_vector_db_batch
+from backend.clients import get_openai_client
+from backend.context_packer import pack_context
+from backend.indexing_events import progress_broker
+from backend.prefetch import (
+    CHAT_RETRIEVAL_PREFETCH_FRACTION,
+    RetrievalPrefetch,
+    chat_latency,
+    current_prefetch,
+)
 from openai.types.shared import Reasoning
 import logging
 
@@ -27,8 +42,13 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ws", tags=["websocket"])
 
+# Number of search results retrieved before packing them into context
+CONTEXT_SEARCH_TOP_K = 8
+
 
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# The agent's requests aren't made through the OpenAI scheduler, so they keep
+# the client's own retries while sharing its connection pool
+set_default_openai_client(get_openai_client().with_options(max_retries=2))
 
 
 class ConnectionManager:
@@ -109,44 +129,76 @@ async def get_context_from_files(query: str, user_id: str) -> str:
 
     Returns:
         str: The context fetched from the vector DB. It's a JSON string of a
-        list of dictionaries, each containing the following keys:
+        list of dictionaries, most relevant first, each containing the
+        following keys:
+        - file_id: The ID of the file
         - file_name: The name of the file
-        - page_number: The page number
-        - content: The content of the page
-        - page_image: The base64 encoded image of the page
+        - page_numbers: The pages the content comes from
+        - content: The content of the pages
     """
     try:
-        # Search vector DB for relevant context
-        search_results = await search_vector_db(
-            query=query, top_k=5, user_id=user_id
-        )
-        logger.info(f"Search results: {search_results}")
-        # Format the results as context
-        if not search_results:
-            return ""
-
-        context_parts = []
-        for i, result in enumerate(search_results):
-            metadata = result["metadata"]
-            file_id = metadata.get("file_id")
-            file_name = metadata.get("file_name")
-            page_number = metadata.get("page_number")
-
-            context_parts.append(
-                {
-                    "file_id": file_id,
-                    "file_name": file_name,
-                    "page_number": page_number,
-                    "content": result["content"],
-                }
+        # Use the results retrieved when the message arrived if they match
+        search_results = None
+        prefetch = current_prefetch.get()
+        if prefetch is not None:
+            search_results = await prefetch.match(
+                query, user_id, CONTEXT_SEARCH_TOP_K
             )
 
-        return json.dumps(context_parts)
+        # Search vector DB for relevant context. Packing drops duplicates and
+        # trims to the token budget, so a few more results than needed are
+        # fetched.
+        if search_results is None:
+            search_results = await search_vector_db(
+                query=query, top_k=CONTEXT_SEARCH_TOP_K, user_id=user_id
+            )
+        return pack_search_results(search_results)
+    except Exception as e:
+        logger.error(f"Error retrieving context: {str(e)}")
+        return "[]"
+
+
+@function_tool
+async def get_context_from_files_batch(queries: list[str], user_id: str) -> str:
+    """
+    Retrieve relevant context from user's files for several queries at once,
+    e.g. reformulations of a question or its sub-questions. Prefer this over
+    calling get_context_from_files several times in a row.
+
+    Args:
+        queries (list[str]): The input queries to search for
+        user_id (str): The user's ID
+
+    Returns:
+        str: The context fetched from the vector DB for all queries, in the
+        same format as get_context_from_files
+    """
+    try:
+        search_results = await search_vector_db_batch(
+            queries=queries, top_k=CONTEXT_SEARCH_TOP_K, user_id=user_id
+        )
+        return pack_search_results(search_results)
     except Exception as e:
         logger.error(f"Error retrieving context: {str(e)}")
         return "[]"
 
 
+def pack_search_results(search_results: list[dict[str, Any]]) -> str:
+    # Format the results as context
+    if not search_results:
+        return ""
+
+    packed = pack_context(search_results)
+    logger.info(
+        f"Packed {len(search_results)} search results into "
+        f"{len(packed.parts)} parts, {packed.packed_tokens} tokens "
+        f"(raw {packed.raw_tokens}, {packed.duplicates} duplicates, "
+        f"{packed.truncated} truncated)"
+    )
+
+    return json.dumps([part.model_dump() for part in packed.parts])
+
+
 @router.websocket("/chat/{session_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -162,8 +214,9 @@ async def websocket_endpoint(
                 instructions=f"""You are a helpful assistant that can answer
                 questions and help with tasks for user with id
                 `{current_user.id}`. Use get_context_from_files tool to
-                get additional information.""",
-                tools=[get_context_from_files],
+                get additional information, or get_context_from_files_batch
+                to search for several queries at once.""",
+                tools=[get_context_from_files, get_context_from_files_batch],
                 model="o3",
                 model_settings=ModelSettings(
                     reasoning=Reasoning(
@@ -178,6 +231,16 @@ async def websocket_endpoint(
 
             while True:
                 user_message_text = await websocket.receive_text()
+                received_at = time.perf_counter()
+
+                # Start retrieving context for the message while the agent
+                # reasons about it
+                prefetch = None
+                if random.random() < CHAT_RETRIEVAL_PREFETCH_FRACTION:
+                    prefetch = RetrievalPrefetch(
+                        user_message_text, current_user.id, CONTEXT_SEARCH_TOP_K
+                    )
+
                 user_message = {
                     "type": "message",
                     "role": "user",
@@ -187,14 +250,77 @@ async def websocket_endpoint(
                 input_items.append(user_message)
                 await save_message(session_id, user_message, db)
 
-                result = Runner.run_streamed(agent, input=input_items)
-                async for event in result.stream_events():
-                    if event.type == "run_item_stream_event":
-                        input_items.append(event.item.to_input_item())
-                        chat_message = await save_message(
-                            session_id, event.item.to_input_item(), db
-                        )
-                        await manager.send_message(chat_message, websocket)
+                # The agent run's task copies the context, so its tool calls
+                # see this message's prefetch
+                prefetch_token = current_prefetch.set(prefetch)
+                try:
+                    result = Runner.run_streamed(agent, input=input_items)
+                finally:
+                    current_prefetch.reset(prefetch_token)
+
+                first_token = False
+                try:
+                    async for event in result.stream_events():
+                        if (
+                            not first_token
+                            and event.type == "raw_response_event"
+                            and event.data.type == "response.output_text.delta"
+                        ):
+                            first_token = True
+                            ttft = time.perf_counter() - received_at
+                            chat_latency.record_ttft(ttft, prefetch is not None)
+                            logger.info(
+                                f"Time to first token {ttft * 1000:.0f}ms "
+                                f"(prefetch {'on' if prefetch else 'off'})"
+                            )
+                        if event.type == "run_item_stream_event":
+                            input_items.append(event.item.to_input_item())
+                            chat_message = await save_message(
+                                session_id, event.item.to_input_item(), db
+                            )
+                            await manager.send_message(chat_message, websocket)
+                finally:
+                    if prefetch is not None:
+                        prefetch.cancel()
 
     except WebSocketDisconnect:
         await manager.disconnect(websocket)
+
+
+@router.websocket("/files/progress")
+async def indexing_progress_endpoint(
+    websocket: WebSocket,
+    current_user: Annotated[User | None, Depends(ws_get_current_user)],
+):
+    """
+    Push the indexing progress of the user's files: the latest known event of
+    each file on connection, then every new event.
+    """
+    if current_user is None:
+        return
+    await websocket.accept()
+
+    with progress_broker.subscribe(current_user.id) as events:
+        receive = asyncio.create_task(websocket.receive_text())
+        try:
+            for event in progress_broker.latest(current_user.id):
+                await websocket.send_json(event)
+
+            while True:
+                next_event = asyncio.create_task(events.get())
+                done, _ = await asyncio.wait(
+                    {receive, next_event}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if next_event in done:
+                    await websocket.send_json(next_event.result())
+                else:
+                    next_event.cancel()
+                if receive in done:
+                    # Raises once the client disconnects, its messages are
+                    # ignored
+                    receive.result()
+                    receive = asyncio.create_task(websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receive.cancel()
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Optional, Union
+
+
+# Query embeddings are kept as float32 arrays, about 6 KB each for 1536
+# dimensions
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "5000")
+)
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(
+    os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "3600")
+)
+SEARCH_RESULT_CACHE_MAX_ENTRIES = int(
+    os.getenv("SEARCH_RESULT_CACHE_MAX_ENTRIES", "2000")
+)
+SEARCH_RESULT_CACHE_TTL_SECONDS = float(
+    os.getenv("SEARCH_RESULT_CACHE_TTL_SECONDS", "300")
+)
+
+
+class LRUCache:
+    """
+    In-process least recently used cache with a maximum number of entries and
+    a time to live.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+class CorpusVersions:
+    """
+    Per-user counters bumped whenever a user's indexed files change.
+
+    Search results are cached under the version of the corpus they were
+    computed from, so bumping the version invalidates them. Versions only live
+    in this process, like the caches they key. Files indexed by the workers
+    and deleted by other web servers bump them through the events relayed
+    with Postgres NOTIFY, see `indexing_events.invalidate_searches`.
+    """
+
+    def __init__(self):
+        # Keyed by the string form of user ids, which the agent passes as text
+        self._versions: Dict[str, int] = defaultdict(int)
+        # Version of the whole corpus, for searches across all users
+        self._global_version = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Optional[Union[str, uuid.UUID]]) -> int:
+        with self._lock:
+            if not user_id:
+                return self._global_version
+            return self._versions.get(str(user_id), 0)
+
+    def bump(self, user_id: Union[str, uuid.UUID]):
+        with self._lock:
+            self._versions[str(user_id)] += 1
+            self._global_version += 1
+
+
+query_embedding_cache = LRUCache(
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_TTL_SECONDS
+)
+search_result_cache = LRUCache(
+    SEARCH_RESULT_CACHE_MAX_ENTRIES, SEARCH_RESULT_CACHE_TTL_SECONDS
+)
+corpus_versions = CorpusVersions()
+
+
+def search_cache_stats() -> Dict[str, Any]:
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "results": search_result_cache.stats(),
+    }
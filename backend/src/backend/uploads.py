@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Collection
+
+from fastapi import HTTPException, UploadFile, status
+
+
+# Largest file that can be uploaded
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Uploads are copied to storage this many bytes at a time, so a request never
+# holds more than one chunk of its file in memory
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room left in a request body for the multipart boundaries and headers around
+# the file
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+def upload_too_large(max_bytes: int = UPLOAD_MAX_BYTES) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is larger than {max_bytes} bytes",
+    )
+
+
+def _write_chunk(f, sha256, chunk: bytes):
+    f.write(chunk)
+    sha256.update(chunk)
+
+
+async def store_upload(
+    upload: UploadFile,
+    directory: str,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> StoredUpload:
+    """
+    Copy an upload to a temporary file in a directory, one chunk at a time,
+    hashing and counting its bytes on the way. The temporary file is in the
+    directory it is moved to, so that `os.replace` can move it atomically.
+
+    Args:
+        upload: The uploaded file
+        directory: Directory to store the temporary file in
+        max_bytes: Uploads larger than this are rejected with a 413
+        chunk_size: Number of bytes read at a time
+
+    Returns:
+        The temporary file with the size and sha256 of its content, the caller
+        moves or removes it
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise upload_too_large(max_bytes)
+
+    fd, path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    try:
+        sha256 = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await upload.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise upload_too_large(max_bytes)
+                await asyncio.to_thread(_write_chunk, f, sha256, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return StoredUpload(path=path, size=size, sha256=sha256.hexdigest())
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects upload requests whose body is larger than the upload limit before
+    receiving it: right away when the Content-Length header is over the limit,
+    otherwise as soon as the bytes received go over it. Without it, the whole
+    body is received and spooled to disk before the route gets to check its
+    size.
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: Collection[str],
+        max_bytes: int = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES,
+    ):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        too_large = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # The route's response to the aborted body is replaced by the 413
+            if not too_large:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if too_large:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": upload_too_large().detail}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
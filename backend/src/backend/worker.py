@@ -0,0 +1,282 @@
+"""
+Index uploaded files from the indexing job queue, in a process separate from
+the web server. Several workers can run side by side, on one or more hosts.
+
+On SIGTERM or SIGINT the worker stops claiming jobs and finishes the running
+ones. Jobs of a worker that is killed are run again by another worker once
+their lock expires.
+
+Usage:
+    python -m backend.worker [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from typing import Optional
+
+from backend.blob_store import file_path
+from backend.chroma import add_file_to_chromadb, copy_file_in_chromadb
+from backend.clients import close_clients
+from backend.database import SessionLocal
+from backend.document_parser import shutdown_extract_pool
+from backend.indexing_events import (
+    FileProgress,
+    current_file_progress,
+    publish_file_status,
+    relay_progress,
+)
+from backend.job_queue import ClaimedJob, IndexingJobQueue, indexing_queue
+from backend.models import File
+from backend.openai_scheduler import (
+    WORKER_BUDGET_SHARE,
+    Priority,
+    openai_priority,
+    openai_scheduler,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Number of files indexed concurrently by a worker
+INDEXING_WORKER_CONCURRENCY = int(os.getenv("INDEXING_WORKER_CONCURRENCY", "4"))
+# Time to wait before looking for jobs again when none is due
+INDEXING_POLL_INTERVAL_SECONDS = float(
+    os.getenv("INDEXING_POLL_INTERVAL_SECONDS", "2")
+)
+
+
+def load_file(file_id: uuid.UUID) -> Optional[File]:
+    db = SessionLocal()
+    try:
+        return db.query(File).filter(File.id == file_id).first()
+    finally:
+        db.close()
+
+
+def load_indexed_copy(file: File) -> Optional[File]:
+    """
+    Find an indexed file with the same content as a file.
+    """
+    if file.sha256 is None:
+        return None
+    db = SessionLocal()
+    try:
+        return (
+            db.query(File)
+            .filter(
+                File.sha256 == file.sha256,
+                File.id != file.id,
+                File.index_status == "indexed",
+            )
+            .first()
+        )
+    finally:
+        db.close()
+
+
+class IndexingWorker:
+    """
+    Runs up to `concurrency` indexing jobs at once, keeping each one locked
+    while it runs.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = INDEXING_WORKER_CONCURRENCY,
+        queue: IndexingJobQueue = indexing_queue,
+        poll_interval: float = INDEXING_POLL_INTERVAL_SECONDS,
+    ):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        logger.info(
+            f"Indexing worker {self.worker_id} started with "
+            f"{self.concurrency} slots"
+        )
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+
+        def job_done(task: asyncio.Task):
+            running.discard(task)
+            slots.release()
+
+        while not self.stopping.is_set():
+            await slots.acquire()
+            if self.stopping.is_set():
+                slots.release()
+                break
+
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            except Exception as e:
+                logger.error(f"Error claiming indexing job: {str(e)}")
+                job = None
+
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(
+                        self.stopping.wait(), timeout=self.poll_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self.run_job(job))
+            running.add(task)
+            task.add_done_callback(job_done)
+
+        if running:
+            logger.info(f"Waiting for {len(running)} running jobs to finish")
+            await asyncio.gather(*running, return_exceptions=True)
+        logger.info(f"Indexing worker {self.worker_id} stopped")
+
+    async def run_job(self, job: ClaimedJob):
+        logger.info(
+            f"Indexing file {job.file_id} (attempt {job.attempts} of "
+            f"{job.max_attempts})"
+        )
+        publish_file_status(job.file_id, job.user_id, "processing")
+        indexing = asyncio.create_task(self.index_file(job))
+        lock_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self.keep_locked(job, indexing, lock_lost))
+        try:
+            await indexing
+        except asyncio.CancelledError:
+            if not lock_lost.is_set():
+                raise
+            logger.warning(
+                f"Stopped indexing file {job.file_id}, its job was taken over"
+            )
+            return
+        except Exception as e:
+            logger.error(f"Error indexing file {job.file_id}: {str(e)}")
+            if await self._finish(self.queue.fail, job, self.worker_id, str(e)):
+                # See IndexingJobQueue.fail
+                publish_file_status(
+                    job.file_id,
+                    job.user_id,
+                    "pending" if job.attempts < job.max_attempts else "failed",
+                    str(e),
+                )
+            return
+        finally:
+            heartbeat.cancel()
+
+        if await self._finish(self.queue.complete, job, self.worker_id):
+            publish_file_status(job.file_id, job.user_id, "indexed")
+        logger.info(f"Indexed file {job.file_id}")
+
+    async def index_file(self, job: ClaimedJob):
+        file = await asyncio.to_thread(load_file, job.file_id)
+        if file is None:
+            # Deleted while queued, its job went with it
+            return
+
+        indexed_copy = await asyncio.to_thread(load_indexed_copy, file)
+        if indexed_copy is not None:
+            await copy_file_in_chromadb(indexed_copy, file)
+            if await asyncio.to_thread(load_file, indexed_copy.id) is None:
+                # Its chunks may have been deleted while they were copied, the
+                # retry indexes the file itself
+                raise RuntimeError(f"File {indexed_copy.id} was deleted while copied")
+            return
+
+        # Runs in its own task, so the progress doesn't leak to other jobs
+        current_file_progress.set(FileProgress(file.id, file.user_id))
+        # Indexing is bulk work, it only uses the OpenAI capacity left over by
+        # interactive requests. A retry resumes from the pages that earlier
+        # attempts didn't write.
+        with openai_priority(Priority.BULK):
+            await add_file_to_chromadb(
+                file=file,
+                file_path=file_path(file),
+            )
+
+    async def keep_locked(
+        self, job: ClaimedJob, indexing: asyncio.Task, lock_lost: asyncio.Event
+    ):
+        """
+        Extend the job's lock while it runs, and stop it if another worker
+        took it over.
+        """
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            try:
+                locked = await asyncio.to_thread(
+                    self.queue.extend_lock, job, self.worker_id
+                )
+            except Exception as e:
+                # Try again, the lock is still valid for a while
+                logger.error(f"Error extending lock of job {job.id}: {str(e)}")
+                continue
+            if not locked:
+                lock_lost.set()
+                indexing.cancel()
+                return
+
+    @staticmethod
+    async def _finish(finish, *args) -> bool:
+        """
+        Record a job's outcome.
+
+        Returns:
+            False if it couldn't be recorded, or the job was taken over
+        """
+        try:
+            return await asyncio.to_thread(finish, *args)
+        except Exception as e:
+            # The job runs again once its lock expires, its clients aren't
+            # told about an outcome that wasn't recorded
+            logger.error(f"Error recording indexing job outcome: {str(e)}")
+            return False
+
+    def stop(self):
+        logger.info("Stopping indexing worker")
+        self.stopping.set()
+
+
+async def run_worker(concurrency: int):
+    # The reserve for interactive requests is left out of this process's share
+    # already, they are made by the web servers
+    openai_scheduler.use_budget_share(WORKER_BUDGET_SHARE, bulk_reserve_fraction=0)
+    worker = IndexingWorker(concurrency)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, worker.stop)
+    # Progress events are sent to the web servers' websocket clients
+    relay = asyncio.create_task(relay_progress())
+    try:
+        await worker.run()
+    finally:
+        relay.cancel()
+        # Sends the events still pending, such as the last jobs' outcomes
+        await asyncio.gather(relay, return_exceptions=True)
+        await close_clients()
+        shutdown_extract_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=INDEXING_WORKER_CONCURRENCY,
+        help="Number of files indexed concurrently",
+    )
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
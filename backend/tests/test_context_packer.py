@@ -0,0 +1,70 @@
+from backend.context_packer import _trim, pack_context
+from backend.openai_scheduler import estimate_tokens
+
+
+def result(content, file_id="a", page_number=1, file_name="a.pdf"):
+    return {
+        "content": content,
+        "metadata": {
+            "file_id": file_id,
+            "file_name": file_name,
+            "page_number": page_number,
+        },
+    }
+
+
+def words(count, prefix="word"):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_drops_results_contained_in_better_ranked_ones():
+    text = words(50)
+
+    packed = pack_context(
+        [result(text, page_number=1), result(text[:200], file_id="b")]
+    )
+
+    assert packed.duplicates == 1
+    assert [part.file_id for part in packed.parts] == ["a"]
+
+
+def test_merges_adjacent_pages_in_page_order():
+    packed = pack_context(
+        [
+            result("second page", page_number=2),
+            result("other file", file_id="b", page_number=1),
+            result("first page", page_number=1),
+            result("fourth page", page_number=4),
+        ]
+    )
+
+    assert [part.page_numbers for part in packed.parts] == [[1, 2], [1], [4]]
+    assert packed.parts[0].content == "first page\n\nsecond page"
+
+
+def test_keeps_within_token_budget():
+    packed = pack_context(
+        [
+            result(words(400, "a"), page_number=1),
+            result(words(400, "b"), page_number=5),
+            result(words(400, "c"), page_number=9),
+        ],
+        token_budget=700,
+    )
+
+    assert packed.packed_tokens <= 700
+    assert packed.truncated == 2
+    # The second result is cut to the remaining budget, the third dropped
+    assert [part.page_numbers for part in packed.parts] == [[1], [5]]
+    assert packed.parts[1].content.endswith("[...]")
+    assert packed.raw_tokens > packed.packed_tokens
+
+
+def test_trim_cuts_at_paragraph_breaks_within_budget():
+    text = "\n\n".join(words(30, f"p{i}-") for i in range(10))
+
+    trimmed = _trim(text, 100)
+
+    assert estimate_tokens(trimmed) <= 100
+    assert trimmed.endswith("\n[...]")
+    assert text.startswith(trimmed[: -len("\n[...]")])
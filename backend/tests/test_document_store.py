@@ -0,0 +1,99 @@
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import document_store
+from backend.document_parser import (
+    DocumentBlock,
+    DocumentChunk,
+    ParsedDocument,
+    create_block_chunks,
+)
+from backend.document_store import load_blocks, load_parsed_document
+from backend.models import (
+    ParsedDocumentVersion,
+    StoredDocumentBlock,
+    StoredDocumentChunk,
+)
+
+
+@pytest.fixture(autouse=True)
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://")
+    for model in (ParsedDocumentVersion, StoredDocumentBlock, StoredDocumentChunk):
+        model.__table__.create(engine)
+    monkeypatch.setattr(document_store, "SessionLocal", sessionmaker(bind=engine))
+
+
+def block(page_num, content):
+    return DocumentBlock(
+        type="Text", page_num=page_num, content=content, semantic_content=content
+    )
+
+
+def page_chunk(blocks):
+    return DocumentChunk(
+        content="\n".join(block.content for block in blocks),
+        embed="description",
+        blocks=blocks,
+        metadata={"page_num": blocks[0].page_num},
+    )
+
+
+# Repeated blocks, like the header on every page and the same table cell
+# twice on a page
+BLOCKS = [
+    block(1, "Header"),
+    block(1, "Cell"),
+    block(1, "Cell"),
+    block(2, "Header"),
+    block(2, "Body"),
+]
+
+
+def save(file_id, mode, chunks):
+    document_store.save_parsed_document(
+        file_id, "v1", mode, ParsedDocument(chunks=chunks, stats={"pages": []})
+    )
+
+
+def test_repeated_blocks_round_trip():
+    file_id = uuid.uuid4()
+    save(file_id, "page", [page_chunk(BLOCKS[:3]), page_chunk(BLOCKS[3:])])
+
+    blocks, _ = load_blocks(file_id, "v1")
+    assert [document_store._block_key(block) for block in blocks] == [
+        document_store._block_key(block) for block in BLOCKS
+    ]
+
+    parsed = load_parsed_document(file_id, "v1", "page")
+    assert [len(chunk.blocks) for chunk in parsed.chunks] == [3, 2]
+    assert [block.content for block in parsed.chunks[0].blocks] == [
+        "Header",
+        "Cell",
+        "Cell",
+    ]
+
+
+def test_other_modes_share_the_stored_blocks():
+    file_id = uuid.uuid4()
+    save(file_id, "page", [page_chunk(BLOCKS[:3]), page_chunk(BLOCKS[3:])])
+    blocks, _ = load_blocks(file_id, "v1")
+    save(file_id, "block", create_block_chunks(blocks))
+
+    assert len(load_blocks(file_id, "v1")[0]) == len(BLOCKS)
+    assert len(load_parsed_document(file_id, "v1", "page").chunks) == 2
+    assert len(load_parsed_document(file_id, "v1", "block").chunks) == len(BLOCKS)
+
+
+def test_saving_other_blocks_replaces_them():
+    file_id = uuid.uuid4()
+    save(file_id, "page", [page_chunk(BLOCKS[:3]), page_chunk(BLOCKS[3:])])
+    save(file_id, "block", create_block_chunks([block(1, "Reparsed")]))
+
+    blocks, _ = load_blocks(file_id, "v1")
+    assert [block.content for block in blocks] == ["Reparsed"]
+    # Page chunks pointed at the replaced blocks
+    assert load_parsed_document(file_id, "v1", "page") is None
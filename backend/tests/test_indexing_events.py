@@ -0,0 +1,27 @@
+import asyncio
+
+from backend import indexing_events
+from backend.indexing_events import ProgressBroker, relay_progress
+
+
+def test_relay_sends_pending_events_when_cancelled(monkeypatch):
+    sent = []
+    monkeypatch.setattr(indexing_events, "_notify", sent.extend)
+    broker = ProgressBroker()
+
+    async def main():
+        relay = asyncio.create_task(relay_progress(broker, interval=60))
+        await asyncio.sleep(0)
+        broker.publish({"file_id": "a", "user_id": "u", "status": "processing"})
+        await asyncio.sleep(0)
+        broker.publish({"file_id": "a", "user_id": "u", "status": "indexed"})
+        broker.publish({"file_id": "b", "user_id": "u", "status": "failed"})
+        relay.cancel()
+        await asyncio.gather(relay, return_exceptions=True)
+
+    asyncio.run(main())
+
+    assert [(event["file_id"], event["status"]) for event in sent] == [
+        ("a", "indexed"),
+        ("b", "failed"),
+    ]
@@ -0,0 +1,212 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from backend import openai_scheduler as scheduler_module
+from backend.openai_scheduler import (
+    OpenAIScheduler,
+    Priority,
+    RateLimits,
+    _TokenBucket,
+    _Waiter,
+    openai_priority,
+    scale_rate_limits,
+)
+
+LIMITS = RateLimits(requests_per_minute=600, tokens_per_minute=60_000)
+
+
+def test_scale_rate_limits_keeps_one_request():
+    assert scale_rate_limits(LIMITS, 0.25) == RateLimits(
+        requests_per_minute=150, tokens_per_minute=15_000, max_concurrency=3
+    )
+    assert scale_rate_limits(LIMITS, 0.0001) == RateLimits(
+        requests_per_minute=1, tokens_per_minute=6, max_concurrency=1
+    )
+
+
+def test_budget_share_applies_to_every_model():
+    scheduler = OpenAIScheduler(limits={"model": LIMITS}, default_limits=LIMITS)
+    scheduler._state("model")
+
+    scheduler.use_budget_share(0.5, bulk_reserve_fraction=0)
+
+    assert scheduler.bulk_reserve_fraction == 0
+    for model in ("model", "other-model"):
+        state = scheduler._state(model)
+        assert state.limits.requests_per_minute == 300
+        assert state.requests.capacity == 300
+        assert state.tokens.capacity == 30_000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: clock.now)
+    return clock
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = _TokenBucket(per_minute=60)
+
+    bucket.take(60)
+    assert bucket.delay(1) == pytest.approx(1.0)
+
+    clock.now += 30
+    assert bucket.delay(30) == 0.0
+    # Amounts above the capacity only wait for a full bucket
+    assert bucket.delay(600) == pytest.approx(30.0)
+
+
+def test_token_bucket_goes_negative_on_overuse(clock):
+    bucket = _TokenBucket(per_minute=60)
+
+    bucket.take(90)
+
+    assert bucket.level == pytest.approx(-30)
+    assert bucket.delay(1) == pytest.approx(31.0)
+
+
+def rate_limit_error(retry_after_ms: str) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(
+        429, headers={"retry-after-ms": retry_after_ms}, request=request
+    )
+    return openai.RateLimitError("Rate limited", response=response, body=None)
+
+
+def test_run_retries_rate_limited_requests():
+    scheduler = OpenAIScheduler(default_limits=LIMITS, max_retries=2)
+    attempts = []
+
+    async def request():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise rate_limit_error("10")
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=500))
+
+    response = asyncio.run(scheduler.run("model", request, estimated_tokens=100))
+
+    assert response.usage.total_tokens == 500
+    assert len(attempts) == 2
+    metrics = scheduler.metrics()["model"]
+    assert metrics["rate_limited"] == 1
+    assert metrics["completed"] == 1
+    # Both attempts reserved 100 tokens, the last one used 400 more. The
+    # bucket refilled a little meanwhile.
+    tokens = scheduler._state("model").tokens
+    assert tokens.level == pytest.approx(LIMITS.tokens_per_minute - 600, abs=100)
+
+
+def test_run_gives_up_after_max_retries():
+    scheduler = OpenAIScheduler(default_limits=LIMITS, max_retries=1)
+
+    async def request():
+        raise rate_limit_error("1")
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(scheduler.run("model", request))
+
+    assert scheduler.metrics()["model"]["failed"] == 1
+
+
+def test_interactive_requests_overtake_queued_bulk_ones():
+    scheduler = OpenAIScheduler(
+        default_limits=RateLimits(
+            requests_per_minute=600, tokens_per_minute=60_000, max_concurrency=1
+        )
+    )
+    served = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def request(name, wait=None):
+            served.append(name)
+            if wait is not None:
+                await wait.wait()
+
+        first = asyncio.create_task(
+            scheduler.run("model", lambda: request("first", release))
+        )
+        await asyncio.sleep(0)
+        with openai_priority(Priority.BULK):
+            bulk = [
+                asyncio.create_task(scheduler.run("model", lambda n=n: request(n)))
+                for n in ("bulk 1", "bulk 2")
+            ]
+            await asyncio.sleep(0)
+        interactive = asyncio.create_task(
+            scheduler.run("model", lambda: request("interactive"))
+        )
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *bulk, interactive)
+
+    asyncio.run(main())
+
+    assert served == ["first", "interactive", "bulk 1", "bulk 2"]
+
+
+def test_bulk_requests_leave_the_reserve_to_interactive_ones(clock):
+    scheduler = OpenAIScheduler(
+        default_limits=RateLimits(requests_per_minute=60, tokens_per_minute=6000),
+        bulk_reserve_fraction=0.5,
+    )
+    state = scheduler._state("model")
+    state.requests.take(40)
+
+    interactive = _Waiter(Priority.INTERACTIVE, 0, 100)
+    bulk = _Waiter(Priority.BULK, 1, 100)
+
+    assert scheduler._delay(state, interactive, clock.now) == 0.0
+    # 20 requests are left, bulk ones need 1 above the 30 reserved
+    assert scheduler._delay(state, bulk, clock.now) == pytest.approx(11.0)
+
+
+def test_bulk_requests_are_promoted_after_waiting(clock):
+    scheduler = OpenAIScheduler(default_limits=LIMITS, bulk_max_wait_seconds=60)
+    waiter = _Waiter(Priority.BULK, 0, 0)
+
+    assert scheduler._effective_priority(waiter, clock.now) == Priority.BULK
+    clock.now += 60
+    assert scheduler._effective_priority(waiter, clock.now) == Priority.INTERACTIVE
+
+
+def test_rate_limits_throttle_bulk_requests(clock):
+    scheduler = OpenAIScheduler(
+        default_limits=RateLimits(requests_per_minute=60, tokens_per_minute=6000),
+        bulk_reserve_fraction=0,
+        bulk_recovery_seconds=100,
+    )
+    state = scheduler._state("model")
+    state.requests.take(40)
+    interactive = _Waiter(Priority.INTERACTIVE, 0, 100)
+    bulk = _Waiter(Priority.BULK, 1, 100)
+    assert scheduler._delay(state, bulk, clock.now) == 0.0
+
+    scheduler._throttle_bulk(state)
+
+    assert scheduler._bulk_throttle(state, clock.now) == 0.5
+    # Bulk requests leave half of the budgets, interactive ones use all of it
+    assert scheduler._delay(state, interactive, clock.now) == 0.0
+    assert scheduler._delay(state, bulk, clock.now) == pytest.approx(11.0)
+
+    scheduler._throttle_bulk(state)
+    clock.now += 25
+    assert scheduler._bulk_throttle(state, clock.now) == pytest.approx(0.5)
+    clock.now += 100
+    assert scheduler._bulk_throttle(state, clock.now) == 1.0
+
+
+def test_bulk_throttle_keeps_a_minimum_share(clock):
+    scheduler = OpenAIScheduler(default_limits=LIMITS)
+    state = scheduler._state("model")
+
+    for _ in range(10):
+        scheduler._throttle_bulk(state)
+
+    assert scheduler._bulk_throttle(state, clock.now) == pytest.approx(0.1)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pymupdf
+
+from backend import document_parser
+from backend.document_parser import iter_page_data
+
+
+def make_pdf(texts):
+    document = pymupdf.open()
+    for text in texts:
+        page = document.new_page()
+        page.insert_text((72, 72), text)
+    pdf_bytes = document.tobytes()
+    document.close()
+    return pdf_bytes
+
+
+async def extract(pdf_bytes, **kwargs):
+    return [page async for page in iter_page_data(pdf_bytes, **kwargs)]
+
+
+def test_pages_are_extracted_in_the_event_loop_without_workers():
+    pages = asyncio.run(
+        extract(make_pdf(["first page", "second page"]), max_workers=0)
+    )
+
+    assert [page["page_num"] for page in pages] == [1, 2]
+    assert "first page" in pages[0]["text"]
+
+
+def test_shared_pool_is_disabled_without_workers(monkeypatch):
+    monkeypatch.setattr(document_parser, "PDF_EXTRACT_WORKERS", 0)
+
+    assert document_parser.get_extract_pool() is None
+    pages = asyncio.run(extract(make_pdf(["only page"])))
+    assert [page["page_num"] for page in pages] == [1]
+
+
+def test_redundant_pages_are_placeholders_without_workers():
+    pages = asyncio.run(
+        extract(
+            make_pdf(["same text", "same text", "other text"]),
+            max_workers=0,
+            skip_redundant_pages=True,
+        )
+    )
+
+    assert [page["page_num"] for page in pages] == [1, 2, 3]
+    assert pages[1] == {"page_num": 2, "skip_reason": "duplicate", "duplicate_of": 1}
+    assert pages[0]["duplicate_pages"] == [2]
+
+
+def test_streaming_parser_extracts_in_the_event_loop_without_workers(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def parse(pdf_bytes):
+        return [
+            (report["page_num"], chunks)
+            async for report, chunks in document_parser.iter_parse_pdf_pages(
+                pdf_bytes, extract_workers=0
+            )
+        ]
+
+    # Blank pages are skipped without calling the model
+    pages = asyncio.run(parse(make_pdf(["", ""])))
+
+    assert sorted(pages) == [(1, []), (2, [])]
+
+
+def test_only_pages_analyzed_by_the_model_are_rendered():
+    document = pymupdf.open()
+    simple = document.new_page()
+    simple.insert_textbox(simple.rect + (72, 72, -72, -72), "Plain text. " * 40)
+    figure = document.new_page()
+    figure.insert_text((72, 72), "Figure 1")
+    for offset in range(0, 200, 20):
+        figure.draw_rect(pymupdf.Rect(72 + offset, 100, 82 + offset, 110))
+    pdf_bytes = document.tobytes()
+    document.close()
+
+    simple_page, figure_page = asyncio.run(extract(pdf_bytes, max_workers=0))
+
+    assert simple_page["local_blocks"]
+    assert "image_base64" not in simple_page
+    assert figure_page["local_blocks"] is None
+    assert figure_page["image_base64"]
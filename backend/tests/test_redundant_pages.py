@@ -0,0 +1,53 @@
+from backend.document_parser import find_redundant_pages
+
+
+def fingerprint(text="", image_hash=0, pixels="a", blank=False):
+    return {
+        "blank": blank,
+        "image_hash": image_hash,
+        "pixel_hash": pixels,
+        "has_text": bool(text),
+        "text_hash": f"text:{text}",
+    }
+
+
+def test_blank_pages_are_skipped():
+    redundant = find_redundant_pages([fingerprint("a"), fingerprint(blank=True)])
+
+    assert redundant == {2: {"page_num": 2, "skip_reason": "blank"}}
+
+
+def test_pages_with_same_text_and_close_image_are_duplicates():
+    redundant = find_redundant_pages(
+        [fingerprint("a", 0b1011), fingerprint("a", 0b1010)]
+    )
+
+    assert redundant == {
+        2: {"page_num": 2, "skip_reason": "duplicate", "duplicate_of": 1}
+    }
+
+
+def test_pages_with_different_text_are_kept():
+    assert find_redundant_pages([fingerprint("a"), fingerprint("b")]) == {}
+
+
+def test_pages_with_same_text_and_distant_image_are_kept():
+    pages = [fingerprint("a", 0), fingerprint("a", 2**64 - 1)]
+
+    assert find_redundant_pages(pages) == {}
+
+
+def test_scanned_pages_with_close_image_hash_are_kept():
+    pages = [fingerprint(image_hash=0, pixels=str(i)) for i in range(6)]
+
+    assert find_redundant_pages(pages) == {}
+
+
+def test_scanned_pages_with_identical_pixels_are_duplicates():
+    redundant = find_redundant_pages(
+        [fingerprint(pixels="a"), fingerprint(pixels="b"), fingerprint(pixels="a")]
+    )
+
+    assert redundant == {
+        3: {"page_num": 3, "skip_reason": "duplicate", "duplicate_of": 1}
+    }
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+from backend import rerank as rerank_module
+from backend.rerank import LexicalSimilarityScorer, rerank
+
+
+def candidate(content, distance=None):
+    return {"content": content, "distance": distance}
+
+
+def test_lexical_scorer_prefers_matching_terms():
+    scores = LexicalSimilarityScorer(semantic_weight=0).score(
+        "battery warranty",
+        [
+            candidate("the weather is nice today"),
+            candidate("the battery warranty lasts two years"),
+            candidate("battery life"),
+        ],
+    )
+
+    assert scores[1] > scores[2] > scores[0]
+
+
+def test_lexical_scorer_boosts_identifiers():
+    scores = LexicalSimilarityScorer(semantic_weight=0).score(
+        "model x200 manual",
+        [candidate("model manual manual"), candidate("x200")],
+    )
+
+    assert scores[1] > scores[0]
+
+
+def test_lexical_scorer_uses_vector_similarity():
+    scores = LexicalSimilarityScorer(lexical_weight=0, semantic_weight=1).score(
+        "query",
+        [candidate("a", distance=1.0), candidate("b", distance=0.2), candidate("c")],
+    )
+
+    # Chunks found only by full-text search get the lowest similarity
+    assert scores == [0.0, 1.0, 0.0]
+
+
+def test_lexical_scorer_without_candidates():
+    assert LexicalSimilarityScorer().score("query", []) == []
+
+
+def test_rerank_orders_by_score():
+    candidates = [candidate("unrelated"), candidate("battery warranty")]
+
+    results = asyncio.run(
+        rerank("battery warranty", candidates, 1, LexicalSimilarityScorer())
+    )
+
+    assert [result["content"] for result in results] == ["battery warranty"]
+    assert "rerank_score" in results[0]
+
+
+class BlockingScorer:
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def score(self, query, candidates):
+        self.calls += 1
+        self.release.wait(5)
+        return [1.0] * len(candidates)
+
+
+def test_rerank_skips_scoring_while_a_call_overruns(monkeypatch):
+    monkeypatch.setattr(rerank_module, "_overrunning", None)
+    scorer = BlockingScorer()
+    candidates = [candidate("a"), candidate("b")]
+
+    async def main():
+        first = await rerank("q", candidates, 2, scorer, budget_ms=10)
+        second = await rerank("q", candidates, 2, scorer, budget_ms=10)
+        scorer.release.set()
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    # Both keep the retrieval order, and the second didn't queue up
+    assert first == candidates
+    assert second == candidates
+    assert scorer.calls == 1
+
+
+class SlowScorer:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def score(self, query, candidates):
+        time.sleep(self.seconds)
+        return list(range(len(candidates)))
+
+
+def test_concurrent_searches_each_get_their_budget(monkeypatch):
+    monkeypatch.setattr(rerank_module, "_overrunning", None)
+    # Each call fits its budget, but not the time of both
+    scorer = SlowScorer(0.06)
+    candidates = [candidate("a"), candidate("b")]
+
+    async def main():
+        return await asyncio.gather(
+            rerank("q", candidates, 2, scorer, budget_ms=100),
+            rerank("q", candidates, 2, scorer, budget_ms=100),
+        )
+
+    results = asyncio.run(main())
+
+    # Both re-ranked, i.e. in reverse order
+    for result in results:
+        assert [chunk["content"] for chunk in result] == ["b", "a"]
+
+
+def test_queued_searches_give_up_behind_an_overrunning_call(monkeypatch):
+    monkeypatch.setattr(rerank_module, "_overrunning", None)
+    scorer = BlockingScorer()
+    candidates = [candidate("a"), candidate("b")]
+
+    async def main():
+        results = await asyncio.gather(
+            rerank("q", candidates, 2, scorer, budget_ms=20),
+            rerank("q", candidates, 2, scorer, budget_ms=20),
+        )
+        scorer.release.set()
+        return results
+
+    results = asyncio.run(main())
+
+    assert results == [candidates, candidates]
+    # The queued call was dropped before it started
+    assert scorer.calls == 1
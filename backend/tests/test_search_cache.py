@@ -0,0 +1,98 @@
+import uuid
+
+import pytest
+
+from backend import indexing_events, search_cache
+from backend.indexing_events import ProgressBroker, invalidate_searches
+from backend.search_cache import CorpusVersions, LRUCache
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    versions = CorpusVersions()
+    monkeypatch.setattr(indexing_events, "corpus_versions", versions)
+    return versions
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(search_cache.time, "monotonic", lambda: now)
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+
+    now += 60
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_bump_invalidates_user_and_global_versions():
+    versions = CorpusVersions()
+    user_id = uuid.uuid4()
+
+    versions.bump(user_id)
+
+    # The agent passes user ids as text
+    assert versions.get(str(user_id)) == 1
+    assert versions.get(None) == 1
+    assert versions.get(uuid.uuid4()) == 0
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"status": "indexed"},
+        {"status": "failed", "error": "boom"},
+        {"status": "pending", "error": "boom"},
+        {"status": "processing", "pages": {"written": 2}},
+        {"status": "deleted"},
+    ],
+)
+def test_relayed_events_invalidate_searches(versions, event):
+    user_id = str(uuid.uuid4())
+
+    invalidate_searches({"file_id": str(uuid.uuid4()), "user_id": user_id, **event})
+
+    assert versions.get(user_id) == 1
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"status": "pending"},
+        {"status": "processing"},
+        {"status": "processing", "pages": {"extracted": 3, "written": 0}},
+    ],
+)
+def test_events_without_written_chunks_keep_searches(versions, event):
+    user_id = str(uuid.uuid4())
+
+    invalidate_searches({"file_id": str(uuid.uuid4()), "user_id": user_id, **event})
+
+    assert versions.get(user_id) == 0
+
+
+def test_deleted_files_are_forgotten_by_the_broker():
+    broker = ProgressBroker()
+    user_id = str(uuid.uuid4())
+    event = {"file_id": str(uuid.uuid4()), "user_id": user_id}
+
+    with broker.subscribe(user_id) as queue:
+        broker.publish({**event, "status": "indexed"})
+        broker.publish({**event, "status": "deleted"})
+
+        assert queue.qsize() == 2
+    assert broker.latest(user_id) == []
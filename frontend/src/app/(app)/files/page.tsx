@@ -97,8 +97,8 @@ export default function Files() {
       accessorKey: "content_type",
     },
     {
-      header: "Indexed",
-      accessorKey: "is_indexed",
+      header: "Indexing",
+      accessorKey: "index_status",
     },
     {
       id: "actions",
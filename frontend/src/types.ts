@@ -3,5 +3,6 @@ export type FileMetadata = {
   name: string;
   content_type: string;
   size: number;
-  is_indexed: boolean | null;
+  index_status: "pending" | "processing" | "indexed" | "failed";
+  index_error: string | null;
 };